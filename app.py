@@ -2,15 +2,80 @@
 Pokemon Card Pricing Tool - Web Application
 Flask-based web interface for searching Pokemon card prices
 """
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import json
 import os
-from pokepicer import PokemonCardPricer
+import threading
+from dotenv import load_dotenv
+from events import WARNING, configure_from_env, emit
+
+load_dotenv()
+# Progress and error events stay off unless LOG_LEVEL is set
+configure_from_env()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 
-# Initialize the pricer
-pricer = PokemonCardPricer()
+# Maximum number of cards accepted by /search/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '500'))
+
+# Seconds past expiry a cached price is still served by /search while it is
+# refreshed in the background; older prices make the request wait
+SEARCH_MAX_STALE = float(os.getenv('SEARCH_MAX_STALE', '900'))
+
+# The pricer and its sources are built on first use, so importing the app
+# (and answering /health) does not wait for them
+pricer = None
+scheduler = None
+_pricer_lock = threading.Lock()
+
+
+def get_pricer():
+    """
+    Get the process-wide PokemonCardPricer, building it on first use.
+    
+    The first call imports the pricing modules, creates the sources and
+    starts the refresh scheduler if one is configured (REFRESH_WATCHLIST /
+    REFRESH_AUTO_WATCH). Later calls return the same pricer.
+    
+    Returns:
+        The shared PokemonCardPricer
+    """
+    global pricer, scheduler
+    if pricer is None:
+        with _pricer_lock:
+            if pricer is None:
+                from pokepicer import PokemonCardPricer
+                from refresh_scheduler import RefreshScheduler
+                
+                new_pricer = PokemonCardPricer()
+                # Keep watched cards warm in the background
+                scheduler = RefreshScheduler.from_env(new_pricer)
+                if scheduler is not None:
+                    scheduler.start()
+                pricer = new_pricer
+    return pricer
+
+
+def format_results(results):
+    """Shape a get_price() results dictionary for the JSON API."""
+    return {
+        'success': True,
+        'card_name': results['card_name'],
+        'canonical_name': results.get('canonical_name', results['card_name']),
+        'language': results['language'],
+        'condition': results['condition'],
+        'sources': results['sources'],
+        'cached': results.get('cached', []),
+        'stale': results.get('stale', {}),
+        'timed_out': results.get('timed_out', []),
+        'unavailable': results.get('unavailable', []),
+        'average_price': results.get('average_price'),
+        'median_price': results.get('median_price'),
+        'weighted_average_price': results.get('weighted_average_price'),
+        'currency': results.get('currency', 'USD'),
+        'price_range': results.get('price_range')
+    }
 
 
 @app.route('/')
@@ -19,15 +84,126 @@ def index():
     return render_template('index.html')
 
 
+def wants_sse():
+    """Whether the client asked for Server-Sent Events instead of NDJSON."""
+    return (request.args.get('format') == 'sse' or
+            'text/event-stream' in request.headers.get('Accept', ''))
+
+
+# Headers of streamed responses; proxies must not buffer them
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def encode_events(events, sse=False):
+    """
+    Encode pricing events as NDJSON lines or Server-Sent Events.
+    
+    A failure while producing events is sent as a final ``error`` event,
+    since the response status has already gone out.
+    
+    Args:
+        events: Events from iter_price() or iter_prices()
+        sse: Encode as Server-Sent Events instead of NDJSON
+        
+    Yields:
+        One encoded event at a time
+    """
+    try:
+        for event in events:
+            if event['type'] in ('summary', 'card'):
+                event = dict(event, results=format_results(event['results']))
+            payload = json.dumps(event)
+            yield f"event: {event['type']}\ndata: {payload}\n\n" if sse else payload + '\n'
+    except Exception as e:
+        payload = json.dumps({'type': 'error', 'error': str(e)})
+        yield f"event: error\ndata: {payload}\n\n" if sse else payload + '\n'
+
+
+def stream_events(events):
+    """
+    Stream pricing events as NDJSON lines or Server-Sent Events.
+    
+    Each event is flushed as soon as it is produced, so clients can render
+    the fastest sources or cards without waiting for the slowest.
+    """
+    sse = wants_sse()
+    return Response(stream_with_context(encode_events(events, sse)),
+                    mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                    headers=STREAM_HEADERS)
+
+
+class BadSearchRequest(ValueError):
+    """Raised by parse_search() for a payload that cannot be searched."""
+
+
+def parse_search(data):
+    """
+    Read the card from a /search payload.
+    
+    Returns:
+        Tuple of (card_name, language, condition); card_name is empty if
+        the payload has none
+        
+    Raises:
+        BadSearchRequest: If the payload is not a JSON object or a field is
+                          not a string
+    """
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise BadSearchRequest('Expected a JSON object with card_name')
+    
+    fields = []
+    for field, default in (('card_name', ''), ('language', 'English'),
+                           ('condition', 'Near Mint')):
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            raise BadSearchRequest(f'{field} must be a string')
+        fields.append((value or '').strip() or default)
+    return tuple(fields)
+
+
+def parse_batch(data):
+    """
+    Validate a batch payload.
+    
+    Returns:
+        Tuple of (queries, error response); exactly one of them is None
+    """
+    cards = data.get('cards') if isinstance(data, dict) else None
+    
+    if not isinstance(cards, list) or not cards:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Please provide a list of cards'
+        }), 400)
+    
+    if len(cards) > MAX_BATCH_SIZE:
+        return None, (jsonify({
+            'success': False,
+            'error': f'At most {MAX_BATCH_SIZE} cards can be priced per request'
+        }), 400)
+    
+    from pokepicer import parse_query
+    
+    queries = []
+    for index, card in enumerate(cards):
+        try:
+            queries.append(parse_query(parse_search(card)))
+        except ValueError as e:
+            return None, (jsonify({
+                'success': False,
+                'error': f'Card {index}: {e}'
+            }), 400)
+    
+    return queries, None
+
+
 @app.route('/search', methods=['POST'])
 def search():
     """Handle search requests and return pricing data."""
     try:
-        data = request.get_json()
-        
-        card_name = data.get('card_name', '').strip()
-        language = data.get('language', 'English').strip() or 'English'
-        condition = data.get('condition', 'Near Mint').strip() or 'Near Mint'
+        card_name, language, condition = parse_search(request.get_json(silent=True))
         
         if not card_name:
             return jsonify({
@@ -36,21 +212,49 @@ def search():
             }), 400
         
         # Get pricing data
-        results = pricer.get_price(card_name, language, condition)
+        results = get_pricer().get_price(card_name, language, condition,
+                                         max_stale=SEARCH_MAX_STALE)
         
-        # Format the response
-        response = {
-            'success': True,
-            'card_name': results['card_name'],
-            'language': results['language'],
-            'condition': results['condition'],
-            'sources': results['sources'],
-            'average_price': results.get('average_price'),
-            'currency': results.get('currency', 'USD'),
-            'price_range': results.get('price_range')
-        }
+        return jsonify(format_results(results))
+        
+    except BadSearchRequest as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Price many cards in one request.
+    
+    Expected payload:
+    {
+        "cards": [
+            {"card_name": "Charizard VMAX", "language": "English", "condition": "Near Mint"},
+            ...
+        ]
+    }
+    
+    Results are returned in the same order as the cards.
+    """
+    try:
+        queries, error = parse_batch(request.get_json(silent=True))
+        if error:
+            return error
         
-        return jsonify(response)
+        results = get_pricer().get_prices(queries)
+        
+        return jsonify({
+            'success': True,
+            'results': [format_results(result) for result in results]
+        })
         
     except Exception as e:
         return jsonify({
@@ -59,66 +263,143 @@ def search():
         }), 500
 
 
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """
+    Stream a single search, one event per source as it completes.
+    
+    Takes the same payload as /search. Responds with NDJSON by default, or
+    Server-Sent Events when the client sends ``Accept: text/event-stream``
+    (or ``?format=sse``). The last event has type ``summary`` and carries
+    the same fields as the /search response.
+    """
+    try:
+        card_name, language, condition = parse_search(request.get_json(silent=True))
+    except BadSearchRequest as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    if not card_name:
+        return jsonify({
+            'success': False,
+            'error': 'Please enter a card name'
+        }), 400
+    
+    return stream_events(get_pricer().iter_price(card_name, language, condition,
+                                                 max_stale=SEARCH_MAX_STALE))
+
+
+@app.route('/search/batch/stream', methods=['POST'])
+def search_batch_stream():
+    """
+    Stream a batch search, one ``card`` event per card as it completes.
+    
+    Takes the same payload as /search/batch. Events carry the card's
+    ``index`` in the request so clients can place them; they arrive in
+    completion order, not request order.
+    """
+    queries, error = parse_batch(request.get_json(silent=True))
+    if error:
+        return error
+    
+    return stream_events(get_pricer().iter_prices(queries))
+
+
+@app.route('/history', methods=['GET'])
+def history():
+    """Summarise recorded prices for a card from the local history store."""
+    card_name = request.args.get('card_name', '').strip()
+    if not card_name:
+        return jsonify({
+            'success': False,
+            'error': 'Please enter a card name'
+        }), 400
+    
+    try:
+        days = float(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'days must be a number'
+        }), 400
+    
+    summary = get_pricer().get_history(card_name,
+                                       request.args.get('language', '').strip() or 'English',
+                                       request.args.get('condition', '').strip() or 'Near Mint',
+                                       days)
+    if summary is None:
+        return jsonify({
+            'success': False,
+            'error': 'Price history is not enabled (set PRICE_HISTORY_PATH)'
+        }), 404
+    
+    return jsonify(dict(summary, success=True))
+
+
 @app.route('/health')
 def health():
     """Health check endpoint."""
     return jsonify({'status': 'ok'})
 
 
-@app.route('/ebay/verification-token', methods=['GET'])
-def ebay_verification_token():
+def metrics_response():
     """
-    eBay verification token endpoint.
-    Required for eBay Marketplace Account Deletion/Closure notifications.
-    Returns the verification token from environment variables.
+    Render the Prometheus metrics.
+    
+    Cache, in-flight and scheduler metrics are included once the pricer has
+    been built; scraping does not build it.
+    
+    Returns:
+        Tuple of (body, content type)
+    """
+    import metrics
+    
+    return metrics.render(pricer), metrics.CONTENT_TYPE
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Per-stage latencies, cache, error and in-flight metrics for Prometheus."""
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
+
+
+def verification_token_response():
+    """
+    Build the eBay verification token response.
+    
+    Returns:
+        Tuple of (JSON body, status code)
     """
     verification_token = os.getenv('EBAY_VERIFICATION_TOKEN', '')
     
     if not verification_token:
-        return jsonify({
+        return {
             'error': 'Verification token not configured'
-        }), 500
+        }, 500
     
-    return jsonify({
+    return {
         'verificationToken': verification_token
-    })
+    }, 200
 
 
-@app.route('/ebay/marketplace-account-deletion', methods=['POST'])
-def ebay_marketplace_account_deletion():
+def account_deletion_response(data):
     """
-    eBay Marketplace Account Deletion notification endpoint.
-    Receives notifications when an eBay user deletes their marketplace account.
-    Required for production eBay API access.
+    Handle an eBay Marketplace Account Deletion notification.
     
-    Expected payload from eBay:
-    {
-        "metadata": {
-            "topic": "MARKETPLACE_ACCOUNT_DELETION",
-            "schemaVersion": "1.0",
-            "deprecated": false
-        },
-        "notification": {
-            "notificationId": "...",
-            "eventDate": "...",
-            "publishDate": "...",
-            "publishAttemptCount": 1,
-            "data": {
-                "username": "...",
-                "userId": "...",
-                "eiasToken": "..."
-            }
-        }
-    }
+    Args:
+        data: Decoded notification payload, or None
+        
+    Returns:
+        Tuple of (JSON body, status code)
     """
     try:
-        # Get the notification data
-        data = request.get_json(silent=True)
-        
         if not data:
-            return jsonify({
+            return {
                 'error': 'No data provided'
-            }), 400
+            }, 400
         
         # Log the notification (in production, you would handle this appropriately)
         # For example, mark the user's data for deletion, remove their information, etc.
@@ -130,10 +411,8 @@ def ebay_marketplace_account_deletion():
         user_id = user_data.get('userId')
         
         # Log the deletion request
-        print(f"eBay Marketplace Account Deletion notification received:")
-        print(f"  Username: {username}")
-        print(f"  User ID: {user_id}")
-        print(f"  Event Date: {notification.get('eventDate')}")
+        emit('ebay.account_deletion', username=username, user_id=user_id,
+             event_date=notification.get('eventDate'))
         
         # In a production application, you would:
         # 1. Validate the notification authenticity
@@ -142,17 +421,59 @@ def ebay_marketplace_account_deletion():
         # 4. Remove or anonymize user data as required
         
         # Return success response
-        return jsonify({
+        return {
             'status': 'success',
             'message': 'Account deletion notification received'
-        }), 200
+        }, 200
         
     except Exception as e:
-        print(f"Error processing marketplace account deletion: {e}")
-        return jsonify({
+        emit('ebay.account_deletion_error', WARNING, error=str(e))
+        return {
             'status': 'error',
             'error': str(e)
-        }), 500
+        }, 500
+
+
+@app.route('/ebay/verification-token', methods=['GET'])
+def ebay_verification_token():
+    """
+    eBay verification token endpoint.
+    Required for eBay Marketplace Account Deletion/Closure notifications.
+    Returns the verification token from environment variables.
+    """
+    body, status = verification_token_response()
+    return jsonify(body), status
+
+
+@app.route('/ebay/marketplace-account-deletion', methods=['POST'])
+def ebay_marketplace_account_deletion():
+    """
+    eBay Marketplace Account Deletion notification endpoint.
+    Receives notifications when an eBay user deletes their marketplace account.
+    Required for production eBay API access.
+    
+    Expected payload from eBay:
+    {
+        "metadata": {
+            "topic": "MARKETPLACE_ACCOUNT_DELETION",
+            "schemaVersion": "1.0",
+            "deprecated": false
+        },
+        "notification": {
+            "notificationId": "...",
+            "eventDate": "...",
+            "publishDate": "...",
+            "publishAttemptCount": 1,
+            "data": {
+                "username": "...",
+                "userId": "...",
+                "eiasToken": "..."
+            }
+        }
+    }
+    """
+    body, status = account_deletion_response(request.get_json(silent=True))
+    return jsonify(body), status
 
 
 if __name__ == '__main__':
@@ -168,5 +489,8 @@ if __name__ == '__main__':
     # Get debug mode from environment (default: False for production)
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
+    # Build the pricer while the server starts instead of on the first search
+    threading.Thread(target=get_pricer, name='pokepricer-warmup', daemon=True).start()
+    
     # Run the Flask app
     app.run(debug=debug_mode, host='0.0.0.0', port=5000)
@@ -0,0 +1,147 @@
+"""
+Pokemon Card Pricing Tool - ASGI Application
+Async serving mode with the same page, search, streamed search, health and
+eBay notification routes as app.py. Each in-flight search is a coroutine instead of a worker
+thread, and with httpx installed the pricers talk to eBay and TCGPlayer over
+asyncio too, so one process can hold thousands of concurrent searches.
+
+    pip install starlette httpx uvicorn
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+The pricer, cache and refresh scheduler are the ones app.get_pricer() builds.
+"""
+import contextlib
+import os
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+import app as flask_app
+from app import (SEARCH_MAX_STALE, STREAM_HEADERS, BadSearchRequest,
+                 account_deletion_response, encode_events, format_results, get_pricer,
+                 metrics_response, parse_search, verification_token_response)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, 'templates'))
+# The templates are written for Flask's url_for('static', filename=...)
+templates.env.globals['url_for'] = lambda endpoint, filename: f'/static/{filename}'
+
+
+async def read_json(request: Request):
+    """Decode a JSON request body, or return None if it is not valid JSON."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def index(request: Request):
+    """Render the main page."""
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def search(request: Request):
+    """Handle search requests and return pricing data."""
+    try:
+        card_name, language, condition = parse_search(await read_json(request))
+
+        if not card_name:
+            return JSONResponse({
+                'success': False,
+                'error': 'Please enter a card name'
+            }, status_code=400)
+
+        results = await get_pricer().get_price_async(card_name, language, condition,
+                                                     max_stale=SEARCH_MAX_STALE)
+
+        return JSONResponse(format_results(results))
+
+    except BadSearchRequest as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=400)
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+
+async def search_stream(request: Request):
+    """
+    Stream a single search, one event per source as it completes.
+    
+    Same payload and events as app.search_stream. iter_price() blocks, so
+    Starlette iterates it on its thread pool rather than on the event loop.
+    """
+    try:
+        card_name, language, condition = parse_search(await read_json(request))
+    except BadSearchRequest as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=400)
+    
+    if not card_name:
+        return JSONResponse({
+            'success': False,
+            'error': 'Please enter a card name'
+        }, status_code=400)
+    
+    sse = (request.query_params.get('format') == 'sse' or
+           'text/event-stream' in request.headers.get('accept', ''))
+    events = get_pricer().iter_price(card_name, language, condition,
+                                     max_stale=SEARCH_MAX_STALE)
+    return StreamingResponse(encode_events(events, sse),
+                             media_type='text/event-stream' if sse else 'application/x-ndjson',
+                             headers=STREAM_HEADERS)
+
+
+async def health(request: Request):
+    """Health check endpoint."""
+    return JSONResponse({'status': 'ok'})
+
+
+async def prometheus_metrics(request: Request):
+    """Prometheus metrics endpoint (see app.prometheus_metrics)."""
+    body, content_type = metrics_response()
+    return Response(body, headers={'Content-Type': content_type})
+
+
+async def ebay_verification_token(request: Request):
+    """eBay verification token endpoint (see app.ebay_verification_token)."""
+    body, status = verification_token_response()
+    return JSONResponse(body, status_code=status)
+
+
+async def ebay_marketplace_account_deletion(request: Request):
+    """eBay account deletion notifications (see app.ebay_marketplace_account_deletion)."""
+    body, status = account_deletion_response(await read_json(request))
+    return JSONResponse(body, status_code=status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Close the pricer's pooled async connections when the server stops."""
+    yield
+    if flask_app.pricer is not None:
+        await flask_app.pricer.aclose()
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/', index),
+    Route('/search', search, methods=['POST']),
+    Route('/search/stream', search_stream, methods=['POST']),
+    Route('/health', health),
+    Route('/metrics', prometheus_metrics),
+    Route('/ebay/verification-token', ebay_verification_token, methods=['GET']),
+    Route('/ebay/marketplace-account-deletion', ebay_marketplace_account_deletion,
+          methods=['POST']),
+    Mount('/static', StaticFiles(directory=os.path.join(BASE_DIR, 'static')), name='static'),
+])
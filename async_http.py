@@ -0,0 +1,190 @@
+"""
+Asyncio HTTP clients for the pricing sources.
+The httpx counterpart of http_session.build_session(), used by the pricers'
+fetch_async() in the async serving mode. Requires httpx; import this module
+only after http_session.async_http_available() said it is installed.
+"""
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from http_session import DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE
+from latency import LatencyHistogram
+from rate_limiter import OVERLOAD_STATUS_CODES, RateLimitExceeded, SourceLimiter
+
+# Seconds between checks while a request queues for the rate limiter
+QUEUE_POLL_INTERVAL = 0.01
+
+
+class AsyncSourceTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport applying http_session.SourceAdapter's guards to asyncio
+    requests.
+
+    The breaker, limiter and histogram are the same objects the source's
+    requests session uses, so sync and async traffic share one budget.
+    Requests that have to queue for a token or a slot poll for them with
+    asyncio.sleep() instead of blocking a thread, so thousands of waiting
+    requests cost nothing but coroutines.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport,
+                 limiter: Optional[SourceLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 histogram: Optional[LatencyHistogram] = None):
+        """
+        Initialize the transport.
+
+        Args:
+            transport: Transport that sends the requests
+            limiter: Rate and concurrency limiter of the source
+            breaker: Circuit breaker of the source
+            histogram: Latency histogram of the source
+        """
+        self.transport = transport
+        self.limiter = limiter
+        self.breaker = breaker
+        self.histogram = histogram
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} is temporarily unavailable "
+                                   f"(circuit open)")
+
+        if self.limiter is not None:
+            timeout = request.extensions.get('timeout', {}).get('connect')
+            queued = time.monotonic()
+            try:
+                while not self.limiter.try_acquire(time.monotonic() - queued):
+                    if timeout is not None and time.monotonic() - queued >= timeout:
+                        self.limiter.reject()
+                        raise RateLimitExceeded(
+                            f"{self.limiter.name} request could not be sent within {timeout}s")
+                    await asyncio.sleep(QUEUE_POLL_INTERVAL)
+            except (RateLimitExceeded, asyncio.CancelledError):
+                if self.breaker is not None:
+                    self.breaker.cancel()
+                raise
+
+        ok = False
+        cancelled = False
+        start = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+            ok = response.status_code not in OVERLOAD_STATUS_CODES
+            if self.histogram is not None:
+                self.histogram.record(time.monotonic() - start)
+            return response
+        except asyncio.CancelledError:
+            # Our own caller gave up on the request (e.g. eBay pages past the
+            # date window), which says nothing about the upstream's health
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                if self.limiter is not None:
+                    self.limiter.cancel()
+                if self.breaker is not None:
+                    self.breaker.cancel()
+            else:
+                if self.limiter is not None:
+                    self.limiter.release(ok)
+                if self.breaker is not None:
+                    self.breaker.record(ok, time.monotonic() - start)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def build_async_client(pool_size: Optional[int] = None,
+                       max_retries: Optional[int] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       limiter: Optional[SourceLimiter] = None,
+                       breaker: Optional[CircuitBreaker] = None,
+                       histogram: Optional[LatencyHistogram] = None) -> httpx.AsyncClient:
+    """
+    Create a pooled httpx.AsyncClient, the asyncio counterpart of build_session().
+
+    The client must only be used from the event loop it was first used on;
+    see AsyncClientSlot. Connection errors are retried, but unlike
+    build_session() 429/5xx responses are not.
+
+    Args:
+        pool_size: Connections kept per host (default: HTTP_POOL_SIZE env var or 10)
+        max_retries: Retries on connection errors (default: HTTP_MAX_RETRIES
+                     env var or 2)
+        headers: Default headers sent with every request
+        limiter: Rate and concurrency limiter every request must pass
+        breaker: Circuit breaker fed with every request's outcome
+        histogram: Latency histogram fed with every answered request
+
+    Returns:
+        Configured httpx.AsyncClient
+    """
+    if pool_size is None:
+        pool_size = int(os.getenv('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE))
+    if max_retries is None:
+        max_retries = int(os.getenv('HTTP_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=pool_size)
+    transport = httpx.AsyncHTTPTransport(retries=max_retries, limits=limits)
+    if limiter is not None or breaker is not None or histogram is not None:
+        transport = AsyncSourceTransport(transport, limiter, breaker, histogram)
+    return httpx.AsyncClient(transport=transport, headers=headers)
+
+
+class AsyncClientSlot:
+    """
+    Holds one async client per event loop.
+
+    An httpx client's pooled connections belong to the loop that opened
+    them, so a pricer shared by several loops (e.g. one asyncio.run() per
+    test, or a server restart) builds a fresh client whenever the running
+    loop changes. The replaced client is closed on its own loop if that
+    loop is still running elsewhere; call aclose() before a loop ends to
+    release its connections.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncClient]):
+        """
+        Initialize an empty slot.
+
+        Args:
+            factory: Zero-argument callable building a client
+        """
+        self._factory = factory
+        self._loop = None
+        self._client = None
+
+    def get(self) -> httpx.AsyncClient:
+        """
+        Get the client of the running event loop, building it on first use.
+
+        Returns:
+            httpx.AsyncClient bound to the running loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._discard()
+            self._client = self._factory()
+            self._loop = loop
+        return self._client
+
+    def _discard(self):
+        """Close the client of another loop on that loop, if it still runs."""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        if client is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def aclose(self):
+        """Close the client, e.g. when the server shuts down."""
+        if self._loop is asyncio.get_running_loop():
+            client, self._client, self._loop = self._client, None, None
+            await client.aclose()
+        else:
+            self._discard()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmark get_price() and /search offline against the stub server.
+Points the eBay and TCGPlayer sources at benchmarks/stub_server.py, which
+replays recorded responses with injected latency and errors, then prices
+cards from many threads and reports throughput, latency percentiles and
+memory. Nothing leaves the machine.
+
+The pricer is configured from the environment as usual, except that the
+price cache, price history, refresh scheduler and upstream rate limits are
+turned off (see --cache and --rate-limits) so every search reaches the stub.
+
+Usage:
+    python benchmarks/bench_search.py [--requests N] [--concurrency N]
+        [--latency-ms MS] [--jitter-ms MS] [--error-rate R] [--mode pricer|app|both]
+        [--json results.json] [--baseline results.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from price_stats import percentile  # noqa: E402
+from stub_server import EBAY_PATH, TCGPLAYER_API_PATH, TCGPLAYER_SEARCH_PATH, StubServer  # noqa: E402
+
+CARD_NAMES = ('Charizard VMAX', 'Pikachu V', 'Umbreon VMAX', 'Mew ex', 'Lugia V')
+
+
+def configure_env(cache: bool = False, rate_limits: bool = False):
+    """Isolate the pricer from local caches and limits before it is imported."""
+    os.environ['EBAY_APP_ID'] = os.getenv('EBAY_APP_ID') or 'bench-app-id'
+    os.environ['PRICE_HISTORY_PATH'] = ''
+    os.environ['PRICE_CACHE_PATH'] = ''
+    os.environ['REFRESH_WATCHLIST'] = ''
+    os.environ['REFRESH_AUTO_WATCH'] = '0'
+    os.environ['LOG_LEVEL'] = ''
+    if not cache:
+        os.environ['PRICE_CACHE_MAX_ENTRIES'] = '0'
+    if not rate_limits:
+        os.environ['RATE_LIMIT_EBAY'] = '0'
+        os.environ['RATE_LIMIT_TCGPLAYER'] = '0'
+
+
+def build_pricer(url: str):
+    """Build a PokemonCardPricer whose sources talk to the stub server."""
+    from pokepicer import PokemonCardPricer
+
+    pricer = PokemonCardPricer()
+    if pricer.ebay_pricer is not None:
+        pricer.ebay_pricer.base_url = url + EBAY_PATH
+    if pricer.tcgplayer_pricer is not None:
+        pricer.tcgplayer_pricer.search_url = url + TCGPLAYER_SEARCH_PATH
+        pricer.tcgplayer_pricer.search_api_url = url + TCGPLAYER_API_PATH
+    return pricer
+
+
+def card(index: int, cards: int) -> str:
+    """Card name of the index-th request, cycling through `cards` distinct names."""
+    n = index % cards
+    return f"{CARD_NAMES[n % len(CARD_NAMES)]} {n}"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_load(call, total: int, concurrency: int, trace_memory: bool):
+    """
+    Run call(index) total times from `concurrency` threads.
+
+    Returns:
+        Dictionary with throughput, latency percentiles and memory
+    """
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            ok = call(index)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                failures += 1
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - start
+    traced_peak = None
+    if trace_memory:
+        traced_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'failed': failures,
+        'rps': round(total / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1),
+        'peak_rss_mb': peak_rss_mb(),
+        'traced_peak_mb': traced_peak,
+    }
+
+
+def pricer_call(pricer, cards: int):
+    """A load function calling get_price() directly."""
+    def call(index):
+        results = pricer.get_price(card(index, cards))
+        return results['average_price'] is not None and not results['timed_out']
+    return call
+
+
+def app_call(pricer, cards: int):
+    """A load function posting to the Flask app's /search."""
+    import app
+
+    app.pricer = pricer
+    local = threading.local()
+
+    def call(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.app.test_client()
+        response = client.post('/search', json={'card_name': card(index, cards)})
+        data = response.get_json()
+        return (response.status_code == 200 and data['average_price'] is not None
+                and not data['timed_out'])
+    return call
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline run.
+
+    Returns:
+        List of regression messages (empty if none)
+    """
+    regressions = []
+    for mode, current in results.items():
+        previous = baseline.get(mode)
+        if not previous:
+            continue
+        if current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{mode}: p99 {current['p99_ms']} ms vs {previous['p99_ms']} ms")
+        if current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{mode}: p50 {current['p50_ms']} ms vs {previous['p50_ms']} ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{mode}: {current['rps']} req/s vs {previous['rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--cards', type=int, default=0,
+                        help='distinct cards to cycle through (default: one per request)')
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--mode', choices=('pricer', 'app', 'both'), default='both')
+    parser.add_argument('--cache', action='store_true', help='keep the price cache on')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='keep the configured upstream rate limits')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also report the tracemalloc peak (slower)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='fail if worse than the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed regression against --baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    configure_env(args.cache, args.rate_limits)
+    cards = args.cards or args.requests + args.warmup
+    stub = StubServer(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                      error_rate=args.error_rate)
+    modes = ('pricer', 'app') if args.mode == 'both' else (args.mode,)
+
+    results = {}
+    with stub:
+        pricer = build_pricer(stub.url)
+        for mode in modes:
+            call = (pricer_call if mode == 'pricer' else app_call)(pricer, cards)
+            # Warm up connection pools and adaptive concurrency limits; the
+            # warmup cards are not reused by the measured run
+            for index in range(args.warmup):
+                call(args.requests + index)
+            upstream = stub.requests
+            results[mode] = run_load(call, args.requests, args.concurrency, args.trace_memory)
+            results[mode]['upstream_requests'] = stub.requests - upstream
+
+    print(f"{args.requests} searches, {args.concurrency} threads, upstream "
+          f"{args.latency_ms:.0f}+{args.jitter_ms:.0f} ms, {args.error_rate:.1%} errors")
+    print("-" * 78)
+    print(f"  {'mode':<8} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'failed':>7} {'RSS MB':>8}")
+    for mode, result in results.items():
+        print(f"  {mode:<8} {result['rps']:>8.1f} {result['p50_ms']:>9.1f} "
+              f"{result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['max_ms']:>9.1f} "
+              f"{result['failed']:>7} {result['peak_rss_mb'] or '-':>8}")
+        if result['traced_peak_mb'] is not None:
+            print(f"  {'':<8} tracemalloc peak {result['traced_peak_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n✗ Slower than the baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\n✓ Within {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark web app cold start.
+Times, in fresh interpreters, importing app.py, answering the first /health
+request and building the pricer on first use, and checks the time to a
+healthy app against a budget.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--budget-ms MS] [--profile]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time from interpreter start to a healthy app we are willing to accept
+DEFAULT_BUDGET_MS = 500
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+assert app.app.test_client().get('/health').status_code == 200
+healthy = time.perf_counter()
+loaded_at_health = set(sys.modules)
+app.get_pricer()
+ready = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'health_ms': (healthy - start) * 1000,
+    'pricer_ms': (ready - healthy) * 1000,
+    'heavy_at_health': [name for name in ('pokepicer', 'requests', 'bs4', 'httpx')
+                        if name in loaded_at_health],
+}))
+'''
+
+
+def run_once():
+    """Start a fresh interpreter and return its timings."""
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def profile_imports(limit=15):
+    """Print the slowest modules imported by `import app` (python -X importtime)."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    print("\nSlowest imports (cumulative):")
+    for cumulative, name in sorted(rows, reverse=True)[:limit]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.getenv('STARTUP_BUDGET_MS', DEFAULT_BUDGET_MS)))
+    parser.add_argument('--profile', action='store_true',
+                        help='also list the slowest imports')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    print(f"Cold start over {args.runs} runs (median, min - max)")
+    print("-" * 60)
+    for key, label in (('import_ms', 'import app'), ('health_ms', 'first /health'),
+                       ('pricer_ms', 'get_pricer()')):
+        values = [run[key] for run in runs]
+        print(f"  {label:<16} {statistics.median(values):>8.1f} ms   "
+              f"({min(values):.1f} - {max(values):.1f})")
+
+    heavy = runs[0]['heavy_at_health']
+    if heavy:
+        print(f"\n⚠ Loaded before the first /health: {', '.join(heavy)}")
+
+    if args.profile:
+        profile_imports()
+
+    health = statistics.median(run['health_ms'] for run in runs)
+    if health > args.budget_ms:
+        print(f"\n✗ First /health took {health:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"\n✓ First /health within the {args.budget_ms:.0f} ms budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark TCGPlayer price extraction against saved HTML fixtures.
+Compares the original BeautifulSoup + four-regex approach with each backend
+of price_extraction.extract_prices().
+
+Usage:
+    python benchmarks/bench_tcgplayer_extract.py [--repeat N] [fixture.html ...]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_extraction import BACKENDS, backend_available, extract_prices  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_extract(html: bytes):
+    """The pre-engine implementation: full DOM parse, then one regex per field."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html.decode('utf-8', 'replace'), 'html.parser')
+    prices = {}
+    price_patterns = [
+        r'market[_\s-]?price["\s:>]+\$?([\d,.]+)',
+        r'low[_\s-]?price["\s:>]+\$?([\d,.]+)',
+        r'mid[_\s-]?price["\s:>]+\$?([\d,.]+)',
+        r'high[_\s-]?price["\s:>]+\$?([\d,.]+)'
+    ]
+    page_text = soup.get_text()
+    for pattern in price_patterns:
+        match = re.search(pattern, page_text, re.IGNORECASE)
+        if match:
+            field = pattern.split('[')[0].lower() + '_price'
+            try:
+                prices[field] = float(match.group(1).replace(',', ''))
+            except ValueError:
+                continue
+    if not prices:
+        soup.find_all(string=re.compile(r'\$[\d,.]+'))
+    return prices or None
+
+
+def bench(name, func, html, repeat):
+    """Time func(html) and print the per-call latency."""
+    timer = timeit.Timer(lambda: func(html))
+    loops, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=loops)) / loops
+    print(f"  {name:<24} {best * 1000:>9.3f} ms/page   {func(html)}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('fixtures', nargs='*',
+                        default=sorted(glob.glob(os.path.join(FIXTURES_DIR, 'tcgplayer_*.html'))))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for path in args.fixtures:
+        with open(path, 'rb') as f:
+            html = f.read()
+        print(f"\n{os.path.basename(path)} ({len(html) / 1024:.1f} KiB)")
+        print("-" * 60)
+
+        baseline = None
+        if backend_available('bs4'):
+            baseline = bench('legacy (bs4 + 4 regex)', legacy_extract, html, args.repeat)
+
+        for backend in BACKENDS:
+            if not backend_available(backend):
+                print(f"  {backend:<24} {'not installed':>12}")
+                continue
+            elapsed = bench(backend, lambda page, b=backend: extract_prices(page, b),
+                            html, args.repeat)
+            if baseline:
+                print(f"  {'':<24} {baseline / elapsed:>9.1f}x faster than legacy")
+
+
+if __name__ == '__main__':
+    main()
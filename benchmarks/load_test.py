@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Load-test the web endpoints at a fixed request rate.
+Sends an open-loop mix of /search (distinct cards), /search with a few hot
+cards, and the eBay notification endpoints to a running app, then reports
+the latency distribution, error rates and, with --ramp, the rate at which
+the app saturates. Latency is measured from when each request was due, so
+a backed-up server shows up as latency instead of a lower send rate.
+
+--serve starts everything locally: the stub upstream server
+(benchmarks/stub_server.py) and the app pointed at it, on Werkzeug's
+threaded server or, with --workers, under gunicorn. Without --serve, the
+app at --url (default APP_URL or http://localhost:5000) is used as is;
+start it with EBAY_FINDING_API_URL, TCGPLAYER_URL and
+TCGPLAYER_SEARCH_API_URL pointing at a stub server to keep upstreams out
+of the test.
+
+Usage:
+    python benchmarks/load_test.py --serve [--workers N] [--rate RPS] [--duration S]
+        [--ramp START:STOP:STEP] [--concurrency N] [--mix search=4,search-hot=4,...]
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_search import CARD_NAMES, configure_env  # noqa: E402
+from price_stats import percentile  # noqa: E402
+from stub_server import EBAY_PATH, TCGPLAYER_API_PATH  # noqa: E402
+
+SCENARIOS = ('search', 'search-hot', 'ebay-token', 'ebay-deletion')
+DEFAULT_MIX = 'search=4,search-hot=4,ebay-token=1,ebay-deletion=1'
+
+# Upper bounds (ms) of the latency distribution printed per scenario
+DISTRIBUTION_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+DELETION_NOTIFICATION = {
+    'metadata': {'topic': 'MARKETPLACE_ACCOUNT_DELETION', 'schemaVersion': '1.0',
+                 'deprecated': False},
+    'notification': {
+        'notificationId': '550e8400-e29b-41d4-a716-446655440000',
+        'eventDate': '2026-02-04T12:00:00.000Z',
+        'publishDate': '2026-02-04T12:00:01.000Z',
+        'publishAttemptCount': 1,
+        'data': {'username': 'load_test_user', 'userId': '987654321',
+                 'eiasToken': 'sample-token-abc123'}
+    }
+}
+
+
+def parse_mix(text: str):
+    """Parse 'search=4,ebay-token=1' into a list of (scenario, weight)."""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class Client:
+    """Sends one scenario request over a per-thread keep-alive session."""
+
+    def __init__(self, base_url: str, hot_keys: int, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.hot_keys = hot_keys
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, scenario: str, index: int) -> str:
+        """
+        Send a request.
+
+        Returns:
+            'ok', or the kind of failure ('HTTP 500', 'no price', 'Timeout', ...)
+        """
+        session = self._session()
+        if scenario in ('search', 'search-hot'):
+            n = index % self.hot_keys if scenario == 'search-hot' else index
+            name = f"{CARD_NAMES[n % len(CARD_NAMES)]} {'hot' if scenario == 'search-hot' else 'load'} {n}"
+            response = session.post(f'{self.base_url}/search', json={'card_name': name},
+                                    timeout=self.timeout)
+            if response.status_code != 200:
+                return f'HTTP {response.status_code}'
+            data = response.json()
+            if data.get('timed_out') or data.get('unavailable'):
+                return 'degraded'
+            return 'ok' if data.get('average_price') is not None else 'no price'
+        if scenario == 'ebay-token':
+            response = session.get(f'{self.base_url}/ebay/verification-token',
+                                   timeout=self.timeout)
+        else:
+            response = session.post(f'{self.base_url}/ebay/marketplace-account-deletion',
+                                    json=DELETION_NOTIFICATION, timeout=self.timeout)
+        return 'ok' if response.status_code == 200 else f'HTTP {response.status_code}'
+
+
+def run_step(client: Client, rate: float, duration: float, concurrency: int, mix, seed: int):
+    """
+    Send requests at `rate` per second for `duration` seconds.
+
+    At most `concurrency` requests are outstanding; requests due while all
+    slots are busy are not sent and counted as dropped.
+
+    Returns:
+        Dictionary mapping scenario to its latencies (seconds), outcome
+        counts and dropped count, plus the step's elapsed time
+    """
+    rng = random.Random(seed)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    stats = {name: {'latencies': [], 'outcomes': Counter(), 'dropped': 0} for name in names}
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    def send(scenario, index, due):
+        try:
+            outcome = client.send(scenario, index)
+        except requests.exceptions.RequestException as e:
+            outcome = type(e).__name__
+        finally:
+            slots.release()
+        latency = time.perf_counter() - due
+        with lock:
+            stats[scenario]['latencies'].append(latency)
+            stats[scenario]['outcomes'][outcome] += 1
+
+    total = int(rate * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as executor:
+        for index in range(total):
+            due = start + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            scenario = rng.choices(names, weights)[0]
+            if not slots.acquire(blocking=False):
+                stats[scenario]['dropped'] += 1
+                continue
+            executor.submit(send, scenario, seed * 1000003 + index, due)
+    return stats, time.perf_counter() - start
+
+
+def summarize_step(rate: float, stats, elapsed: float):
+    """Reduce run_step() output to per-scenario and overall figures."""
+    summary = {'offered_rps': rate, 'scenarios': {}}
+    all_latencies = []
+    ok = sent = dropped = 0
+    for scenario, data in stats.items():
+        latencies = sorted(data['latencies'])
+        all_latencies.extend(latencies)
+        scenario_ok = data['outcomes'].get('ok', 0)
+        ok += scenario_ok
+        sent += len(latencies)
+        dropped += data['dropped']
+        summary['scenarios'][scenario] = {
+            'sent': len(latencies),
+            'dropped': data['dropped'],
+            'error_rate': round(1 - scenario_ok / len(latencies), 4) if latencies else 0.0,
+            'outcomes': dict(data['outcomes']),
+            'latency_ms': latency_summary(latencies),
+            'distribution': distribution(latencies),
+        }
+    summary.update({
+        'sent': sent,
+        'dropped': dropped,
+        'achieved_rps': round(ok / elapsed, 1) if elapsed else 0.0,
+        'error_rate': round(1 - ok / sent, 4) if sent else 0.0,
+        'latency_ms': latency_summary(sorted(all_latencies)),
+    })
+    return summary
+
+
+def latency_summary(latencies):
+    """p50/p90/p99/p99.9/max of sorted latencies, in milliseconds."""
+    if not latencies:
+        return {}
+    summary = {f'p{q:g}': round(percentile(latencies, q) * 1000, 1) for q in (50, 90, 99, 99.9)}
+    summary['max'] = round(latencies[-1] * 1000, 1)
+    return summary
+
+
+def distribution(latencies):
+    """Count latencies per DISTRIBUTION_MS bucket (the last one is open-ended)."""
+    counts = [0] * (len(DISTRIBUTION_MS) + 1)
+    for latency in latencies:
+        counts[bisect.bisect_left(DISTRIBUTION_MS, latency * 1000)] += 1
+    return counts
+
+
+def print_step(summary, show_distribution: bool):
+    """Print one step's report."""
+    latency = summary['latency_ms']
+    print(f"\nOffered {summary['offered_rps']:g} req/s: {summary['achieved_rps']} ok/s, "
+          f"{summary['error_rate']:.2%} errors, {summary['dropped']} dropped, "
+          f"p50 {latency.get('p50', '-')} ms, p99 {latency.get('p99', '-')} ms")
+    print(f"  {'scenario':<14} {'sent':>6} {'drop':>5} {'err %':>6} {'p50':>8} {'p90':>8} "
+          f"{'p99':>8} {'p99.9':>8} {'max':>8}  failures")
+    for scenario, data in summary['scenarios'].items():
+        lat = data['latency_ms']
+        failures = ', '.join(f"{kind} x{count}" for kind, count in data['outcomes'].items()
+                             if kind != 'ok')
+        print(f"  {scenario:<14} {data['sent']:>6} {data['dropped']:>5} "
+              f"{data['error_rate'] * 100:>6.2f} {lat.get('p50', 0):>8.1f} {lat.get('p90', 0):>8.1f} "
+              f"{lat.get('p99', 0):>8.1f} {lat.get('p99.9', 0):>8.1f} {lat.get('max', 0):>8.1f}  "
+              f"{failures}")
+    if not show_distribution:
+        return
+    for scenario, data in summary['scenarios'].items():
+        counts = data['distribution']
+        if not data['sent']:
+            continue
+        print(f"\n  {scenario} latency distribution")
+        lower = 0
+        for bound, count in zip(DISTRIBUTION_MS + (None,), counts):
+            label = f"{lower}-{bound} ms" if bound else f">{lower} ms"
+            bar = '█' * round(40 * count / data['sent'])
+            print(f"    {label:>14} {count:>6}  {bar}")
+            lower = bound
+
+
+def saturated(summary, slo_ms: float, max_error_rate: float) -> bool:
+    """Whether a step missed its offered rate, the latency SLO or the error budget."""
+    offered_ok = summary['offered_rps'] * (1 - max_error_rate)
+    return (summary['achieved_rps'] < 0.9 * offered_ok or
+            summary['error_rate'] > max_error_rate or
+            summary['latency_ms'].get('p99', 0) > slo_ms)
+
+
+def free_port() -> int:
+    """Pick an unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    """Poll url until it answers or the process exits."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def serve(args):
+    """
+    Start the stub upstreams and the app in child processes.
+
+    Returns:
+        Tuple of (app base URL, list of processes)
+    """
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f'http://127.0.0.1:{stub_port}'
+    stub = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, 'stub_server.py'),
+                             '--port', str(stub_port),
+                             '--latency-ms', str(args.latency_ms),
+                             '--jitter-ms', str(args.jitter_ms),
+                             '--error-rate', str(args.error_rate)],
+                            stdout=subprocess.DEVNULL)
+    processes = [stub]
+    wait_until_up(stub_url, stub)
+
+    configure_env(cache=not args.no_cache, rate_limits=args.rate_limits)
+    env = dict(os.environ,
+               EBAY_FINDING_API_URL=stub_url + EBAY_PATH,
+               TCGPLAYER_URL=stub_url,
+               TCGPLAYER_SEARCH_API_URL=stub_url + TCGPLAYER_API_PATH,
+               EBAY_VERIFICATION_TOKEN=os.getenv('EBAY_VERIFICATION_TOKEN') or 'load-test-token')
+    if args.workers:
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--bind', f'127.0.0.1:{app_port}',
+                   '--log-level', 'warning', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   'import app; from werkzeug.serving import run_simple; '
+                   f'run_simple("127.0.0.1", {app_port}, app.app, threaded=True)']
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    processes.append(server)
+    app_url = f'http://127.0.0.1:{app_port}'
+    wait_until_up(app_url + '/health', server)
+    return app_url, processes
+
+
+def app_metrics(base_url: str):
+    """Read a few cache and upstream counters from the app's /metrics, if served."""
+    try:
+        response = requests.get(f'{base_url}/metrics', timeout=5)
+    except requests.exceptions.RequestException:
+        return {}
+    if response.status_code != 200:
+        return {}
+    wanted = {'pokepricer_cache_hit_ratio': 'cache_hit_ratio',
+              'pokepricer_upstream_requests_total': 'upstream_requests',
+              'pokepricer_lookups_shared_total': 'shared_lookups'}
+    values = {}
+    for line in response.text.splitlines():
+        name = line.split('{')[0].split(' ')[0]
+        if name in wanted:
+            key = wanted[name]
+            values[key] = values.get(key, 0) + float(line.rsplit(' ', 1)[1])
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default=os.getenv('APP_URL', 'http://localhost:5000'))
+    parser.add_argument('--serve', action='store_true',
+                        help='start the stub upstreams and the app locally')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='with --serve, run the app under gunicorn with N workers')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='gunicorn threads per worker (default: 8)')
+    parser.add_argument('--rate', type=float, default=20, help='requests per second')
+    parser.add_argument('--ramp', help='START:STOP:STEP rates to find the saturation point')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per step')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='most requests outstanding at once')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--hot-keys', type=int, default=10,
+                        help='distinct cards searched by search-hot')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--slo-ms', type=float, default=1000,
+                        help='p99 above this counts as saturated')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=80, help='stub upstream latency')
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='stub upstream error rate')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='with --serve, turn the price cache off')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='with --serve, keep the configured upstream rate limits')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.ramp:
+        start, stop, step = (float(value) for value in args.ramp.split(':'))
+        rates = []
+        while start <= stop:
+            rates.append(start)
+            start += step
+    else:
+        rates = [args.rate]
+
+    processes = []
+    base_url = args.url
+    if args.serve:
+        base_url, processes = serve(args)
+        print(f"Serving on {base_url} ({f'gunicorn, {args.workers} workers' if args.workers else 'werkzeug, threaded'}), "
+              f"stub upstream {args.latency_ms:g}+{args.jitter_ms:g} ms, "
+              f"{args.error_rate:.1%} errors, cache {'off' if args.no_cache else 'on'}")
+
+    client = Client(base_url, args.hot_keys, args.timeout)
+    steps = []
+    saturation = None
+    try:
+        for number, rate in enumerate(rates):
+            stats, elapsed = run_step(client, rate, args.duration, args.concurrency, mix,
+                                      args.seed + number)
+            summary = summarize_step(rate, stats, elapsed)
+            steps.append(summary)
+            print_step(summary, show_distribution=len(rates) == 1)
+            if saturated(summary, args.slo_ms, args.max_error_rate):
+                saturation = rate
+                break
+        metrics = app_metrics(base_url)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    if metrics:
+        print("\nApp metrics: " + ', '.join(f"{key} {value:g}" for key, value in metrics.items()))
+    if args.ramp:
+        if saturation is None:
+            print(f"\n✓ Not saturated up to {rates[-1]:g} req/s")
+        else:
+            good = [step['offered_rps'] for step in steps[:-1]]
+            print(f"\n⚠ Saturated at {saturation:g} req/s "
+                  f"(p99 > {args.slo_ms:g} ms, errors > {args.max_error_rate:.1%} "
+                  f"or throughput below the offered rate); "
+                  f"last good rate {good[-1] if good else 'none'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'steps': steps, 'saturation_rps': saturation, 'app_metrics': metrics},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
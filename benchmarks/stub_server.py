@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the eBay Finding API and TCGPlayer.
+Serves the recorded responses in benchmarks/fixtures with configurable
+latency and error rate, so benchmarks run offline and repeatably.
+
+    Finding API            GET  /services/search/FindingService/v1
+    TCGPlayer search page  GET  /search/pokemon/product
+    TCGPlayer search API   POST /v1/search/request
+
+Usage:
+    python benchmarks/stub_server.py [--port 8765] [--latency-ms 80] [--jitter-ms 20]
+                                     [--error-rate 0.01]
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Paths to point the pricers at
+EBAY_PATH = '/services/search/FindingService/v1'
+TCGPLAYER_SEARCH_PATH = '/search/pokemon/product'
+TCGPLAYER_API_PATH = '/v1/search/request'
+
+# Path -> (method, fixture file, content type)
+ROUTES = {
+    EBAY_PATH: ('GET', 'ebay_find_completed_items.json', 'application/json'),
+    TCGPLAYER_SEARCH_PATH: ('GET', 'tcgplayer_search.html', 'text/html; charset=utf-8'),
+    TCGPLAYER_API_PATH: ('POST', 'tcgplayer_search_api.json', 'application/json'),
+}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every benchmark worker to connect at once
+    request_queue_size = 256
+
+
+class StubServer:
+    """Threaded HTTP server replaying fixtures with injected latency and errors."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 seed: int = 0):
+        """
+        Initialize the server (not yet listening).
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            latency: Seconds added before every response
+            jitter: Up to this many extra seconds, drawn uniformly per request
+            error_rate: Fraction of requests answered with error_status
+            error_status: Status code of injected errors
+            seed: Random seed, so runs inject the same delays and errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._bodies = {}
+        for path, (method, name, content_type) in ROUTES.items():
+            with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+                self._bodies[path] = (method, f.read(), content_type)
+
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server, e.g. http://127.0.0.1:8765."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _draw(self):
+        """Pick the delay and whether to fail for one request."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, method: str):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+
+                route = stub._bodies.get(urlsplit(self.path).path)
+                if route is None or route[0] != method:
+                    self._send(404, b'{"error": "not found"}', 'application/json')
+                    return
+
+                delay, fail = stub._draw()
+                if delay > 0:
+                    time.sleep(delay)
+                if fail:
+                    self._send(stub.error_status, b'{"error": "injected"}', 'application/json')
+                    return
+                self._send(200, route[1], route[2])
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self) -> 'StubServer':
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                        args.error_rate)
+    print(f"Serving fixtures at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
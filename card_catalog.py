@@ -0,0 +1,372 @@
+"""
+Local catalog of Pokemon cards for canonicalizing search queries.
+Names are normalized (case, accents, punctuation, split variant suffixes such
+as "V-MAX" or "V STAR") and indexed by exact key, by prefix and by trigram,
+so "charizard vmax", "Charizard VMAX " and "Charizard V-MAX" all resolve to
+the catalog's "Charizard VMAX" before the cache or any source sees them.
+"""
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Catalog shipped with the package (a sample of popular cards)
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    'card_catalog.json')
+# Lowest trigram similarity (0-1) at which a misspelled query is considered
+DEFAULT_MIN_SIMILARITY = 0.5
+# Normalized queries whose lookup result is remembered
+DEFAULT_MATCH_CACHE_SIZE = 4096
+
+# Variant suffixes people write split up, e.g. "V-MAX" or "V Star"
+_SPLIT_VARIANTS = {
+    ('v', 'max'): 'vmax',
+    ('v', 'star'): 'vstar',
+    ('v', 'union'): 'vunion',
+    ('g', 'x'): 'gx',
+    ('e', 'x'): 'ex',
+}
+# Tokens naming a distinct card rather than a spelling; a misspelled query
+# only matches a catalog name with the same ones (and the same numbers)
+VARIANT_TOKENS = frozenset({'v', 'vmax', 'vstar', 'vunion', 'gx', 'ex', 'lv', 'x',
+                            'break', 'prime', 'legend', 'star', 'delta'})
+
+_SYMBOLS = str.maketrans({'♀': ' f ', '♂': ' m ', '&': ' and ', "'": '', '’': '', '`': ''})
+# Runs of letters and digits in any script, with an optional /total suffix
+_TOKEN = re.compile(r'[^\W_]+(?:/[^\W_]+)?')
+_LEADING_ZEROS = re.compile(r'(?<![0-9])0+(?=[0-9])')
+
+
+def normalize_name(card_name: str) -> str:
+    """
+    Normalize a card name so different spellings of a card compare equal.
+
+    Lowercases, strips accents from Latin letters ("Pokémon" -> "pokemon")
+    and punctuation, joins split variant suffixes ("V-MAX" -> "vmax") and
+    drops leading zeros from card numbers ("004/102" -> "4/102"). Letters of
+    other scripts are kept, so "リザードン" and "ミュウツー" stay distinct.
+
+    Args:
+        card_name: Card name as typed
+
+    Returns:
+        Space-separated normalized tokens
+    """
+    text = card_name.lower().translate(_SYMBOLS)
+    if not text.isascii():
+        # Drop accents from Latin letters only; a kana's voicing mark
+        # (ザ = サ + ゙) is part of the letter
+        kept = []
+        for char in unicodedata.normalize('NFKD', text):
+            if not (unicodedata.combining(char) and kept and kept[-1].isascii()):
+                kept.append(char)
+        text = unicodedata.normalize('NFC', ''.join(kept))
+    tokens = [_LEADING_ZEROS.sub('', token) for token in _TOKEN.findall(text)]
+
+    merged = []
+    index = 0
+    while index < len(tokens):
+        pair = tuple(tokens[index:index + 2])
+        if pair in _SPLIT_VARIANTS:
+            merged.append(_SPLIT_VARIANTS[pair])
+            index += 2
+        else:
+            merged.append(tokens[index])
+            index += 1
+    return ' '.join(merged)
+
+
+def _markers(key: str) -> FrozenSet[str]:
+    """Variant tokens and card numbers of a normalized name."""
+    return frozenset(token for token in key.split()
+                     if token in VARIANT_TOKENS or any(char.isdigit() for char in token))
+
+
+def _variants(markers: FrozenSet[str]) -> FrozenSet[str]:
+    return markers & VARIANT_TOKENS
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_edits(token: str) -> int:
+    """Typos tolerated in a word: none up to 3 letters, 1 up to 7, else 2."""
+    return 0 if len(token) <= 3 else 1 if len(token) <= 7 else 2
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance of two words, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _is_misspelling(query: str, key: str) -> bool:
+    """
+    Check whether a normalized query is a misspelling of a normalized name.
+
+    Both must have the same number of words, variant tokens and card
+    numbers must be identical, and every other word may only differ by a
+    couple of typos. Words are never dropped or added, so "Charizard Holo
+    1st Edition" is not a misspelling of "Charizard 1st Edition".
+
+    Args:
+        query: Normalized query
+        key: Normalized catalog name
+
+    Returns:
+        True if the query only misspells the name
+    """
+    words, names = query.split(), key.split()
+    if len(words) != len(names):
+        return False
+    for word, name in zip(words, names):
+        if word == name:
+            continue
+        if _markers(word) or _markers(name):
+            return False
+        limit = _max_edits(name)
+        if _edit_distance(word, name, limit) > limit:
+            return False
+    return True
+
+
+class CardCatalog:
+    """
+    Index of known cards resolving queries to a canonical search string.
+
+    Every card is reachable under its name, its name with its number, set
+    or printing variant, and its aliases. Lookups try the exact normalized
+    key first, then the closest key by trigram similarity that the query
+    merely misspells (see _is_misspelling), so "Charizrd VMAX" finds
+    "Charizard VMAX" but "Charizard V" or "Charizard Holo 1st Edition"
+    never find anything else.
+    """
+
+    def __init__(self, cards: List[Dict], min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 match_cache_size: int = DEFAULT_MATCH_CACHE_SIZE):
+        """
+        Build the index.
+
+        Args:
+            cards: Card dicts with ``name`` and optionally ``set``,
+                   ``number``, ``variants`` (printings, e.g. "1st Edition")
+                   and ``aliases`` (other names, e.g. "Moonbreon")
+            min_similarity: Lowest trigram similarity for a name to be
+                            checked as a possible misspelling
+            match_cache_size: Lookups remembered, since the same few
+                              queries (and misses) repeat
+        """
+        self.cards = cards
+        self.min_similarity = min_similarity
+        self.match_cache_size = match_cache_size
+
+        # normalized key -> canonical query (None if it names different cards)
+        self._queries: Dict[str, Optional[str]] = {}
+        self._cards: Dict[str, List[Dict]] = {}
+        for card in cards:
+            name = card['name']
+            specific = f"{name} {card['number']}" if card.get('number') else name
+            self._add(name, name, card)
+            if card.get('number'):
+                self._add(specific, specific, card)
+            if card.get('set'):
+                self._add(f"{name} {card['set']}", f"{name} {card['set']}", card)
+            for variant in card.get('variants', ()):
+                self._add(f"{name} {variant}", f"{name} {variant}", card)
+            for alias in card.get('aliases', ()):
+                self._add(alias, specific, card)
+
+        self._keys = sorted(self._queries)
+        self._key_markers = [_markers(key) for key in self._keys]
+        self._key_sizes = []
+        # (variant tokens, trigram) -> positions in self._keys; a query only
+        # ever scores keys with its own variant tokens
+        postings = defaultdict(list)
+        for position, key in enumerate(self._keys):
+            variants = _variants(self._key_markers[position])
+            grams = _trigrams(key)
+            self._key_sizes.append(len(grams))
+            for gram in grams:
+                postings[variants, gram].append(position)
+        self._postings: Dict[Tuple[FrozenSet[str], str], List[int]] = dict(postings)
+
+        self._lock = threading.Lock()
+        # normalized query -> (key, similarity) or None, least recent first
+        self._matches: 'OrderedDict[str, Optional[Tuple[str, float]]]' = OrderedDict()
+
+    def _add(self, text: str, query: str, card: Dict):
+        key = normalize_name(text)
+        if not key:
+            return
+        if key in self._queries and self._queries[key] != query:
+            self._queries[key] = None
+        else:
+            self._queries.setdefault(key, query)
+        cards = self._cards.setdefault(key, [])
+        if card not in cards:
+            cards.append(card)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'CardCatalog':
+        """
+        Load a catalog from a JSON file holding a list of card dicts.
+
+        Args:
+            path: Path of the JSON file
+            **kwargs: Passed on to CardCatalog()
+
+        Returns:
+            CardCatalog of the file's cards
+        """
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    @classmethod
+    def from_env(cls) -> Optional['CardCatalog']:
+        """
+        Build a catalog from environment variables.
+
+        CARD_CATALOG_PATH names the JSON file (default: the bundled
+        card_catalog.json; empty disables the catalog) and
+        CARD_CATALOG_MIN_SIMILARITY the fuzzy match threshold.
+
+        Returns:
+            Loaded CardCatalog, or None if disabled
+        """
+        path = os.getenv('CARD_CATALOG_PATH', DEFAULT_CATALOG_PATH)
+        if not path:
+            return None
+        return cls.load(path, min_similarity=float(
+            os.getenv('CARD_CATALOG_MIN_SIMILARITY', DEFAULT_MIN_SIMILARITY)))
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def _closest(self, key: str) -> Optional[Tuple[str, float]]:
+        """Find the key most similar to a normalized query."""
+        if key in self._queries:
+            return (key, 1.0) if self._queries[key] is not None else None
+
+        markers = _markers(key)
+        variants = _variants(markers)
+        postings = sorted((self._postings.get((variants, gram), ()) for gram in _trigrams(key)),
+                          key=len)
+        # A key sharing at least `needed` trigrams with the query must share
+        # one of its rarest len - needed + 1, so only those produce candidates
+        # and the common ones just add to their counts
+        needed = math.ceil(self.min_similarity * len(postings) - 1e-9)
+        rare = len(postings) - needed + 1
+        shared = Counter()
+        for posting in postings[:rare]:
+            shared.update(posting)
+        for posting in postings[rare:]:
+            for position in shared:
+                index = bisect.bisect_left(posting, position)
+                if index < len(posting) and posting[index] == position:
+                    shared[position] += 1
+
+        best = None
+        best_similarity = 0.0
+        tied = False
+        for position, count in shared.items():
+            similarity = count / (len(postings) + self._key_sizes[position] - count)
+            if similarity < self.min_similarity or self._key_markers[position] != markers:
+                continue
+            candidate = self._keys[position]
+            if not _is_misspelling(key, candidate):
+                continue
+            if similarity > best_similarity:
+                best, best_similarity, tied = candidate, similarity, False
+            elif similarity == best_similarity and \
+                    self._queries[candidate] != self._queries[best]:
+                tied = True
+        # Two different cards equally close is no match at all
+        if best is None or tied or self._queries[best] is None:
+            return None
+        return best, round(best_similarity, 3)
+
+    def match(self, card_name: str) -> Optional[Dict]:
+        """
+        Resolve a query to a catalog entry.
+
+        Args:
+            card_name: Card name as typed
+
+        Returns:
+            Dictionary with the canonical ``query`` to search for, the
+            matched ``key``, the ``cards`` it names and the ``similarity``
+            (1.0 for an exact match), or None if nothing matches
+            unambiguously
+        """
+        key = normalize_name(card_name)
+        with self._lock:
+            known = key in self._matches
+            if known:
+                self._matches.move_to_end(key)
+                found = self._matches[key]
+        if not known:
+            found = self._closest(key)
+            with self._lock:
+                self._matches[key] = found
+                while len(self._matches) > self.match_cache_size:
+                    self._matches.popitem(last=False)
+        if found is None:
+            return None
+        matched, similarity = found
+        return {'query': self._queries[matched], 'key': matched,
+                'cards': list(self._cards[matched]), 'similarity': similarity}
+
+    def canonicalize(self, card_name: str) -> str:
+        """
+        Get the search string for a query.
+
+        Args:
+            card_name: Card name as typed
+
+        Returns:
+            The catalog's spelling if the query matches a card, otherwise
+            the query with whitespace collapsed
+        """
+        match = self.match(card_name)
+        return match['query'] if match else ' '.join(card_name.split())
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        List canonical queries whose normalized form starts with a prefix.
+
+        Args:
+            prefix: Start of a card name as typed
+            limit: Most queries returned
+
+        Returns:
+            Canonical queries in alphabetical order of their keys
+        """
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        queries = []
+        position = bisect.bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position].startswith(key) \
+                and len(queries) < limit:
+            query = self._queries[self._keys[position]]
+            if query is not None and query not in queries:
+                queries.append(query)
+            position += 1
+        return queries
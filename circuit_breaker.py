@@ -0,0 +1,235 @@
+"""
+Circuit breakers for the pricing sources.
+A source whose recent calls mostly fail or are too slow is tripped: its
+lookups are skipped at once instead of each waiting out a timeout. After a
+cool-down a few probe calls are let through, and the breaker closes again
+when they succeed.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Trip once this fraction of the recent calls failed or were slow
+DEFAULT_FAILURE_RATE = 0.5
+# Calls counted as slow (and so as failures) above this many seconds
+DEFAULT_SLOW_CALL_SECONDS = 5.0
+# Recent calls considered, and how many are needed before tripping
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_CALLS = 5
+# Seconds a tripped breaker stays open before probing
+DEFAULT_OPEN_SECONDS = 30.0
+# Concurrent probe calls allowed while half-open; all must succeed to close
+DEFAULT_HALF_OPEN_PROBES = 1
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a source whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate and latency circuit breaker with half-open probing.
+
+    Outcomes of the last ``window`` calls are kept; once at least
+    ``min_calls`` are known and ``failure_rate`` of them failed or took
+    longer than ``slow_call_seconds``, the breaker opens for
+    ``open_seconds``. It then lets ``half_open_probes`` calls through and
+    closes if they all succeed, or opens again on the first failure.
+    """
+
+    def __init__(self, name: str, failure_rate: float = DEFAULT_FAILURE_RATE,
+                 slow_call_seconds: float = DEFAULT_SLOW_CALL_SECONDS,
+                 window: int = DEFAULT_WINDOW, min_calls: int = DEFAULT_MIN_CALLS,
+                 open_seconds: float = DEFAULT_OPEN_SECONDS,
+                 half_open_probes: int = DEFAULT_HALF_OPEN_PROBES,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize a closed breaker.
+
+        Args:
+            name: Source name
+            failure_rate: Fraction of failed or slow calls that trips it
+            slow_call_seconds: Calls slower than this count as failures
+            window: Number of recent calls considered
+            min_calls: Calls needed in the window before it can trip
+            open_seconds: Cool-down before probing a tripped source
+            half_open_probes: Probe calls allowed at once while half-open
+            clock: Monotonic time source (for tests)
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Current state: 'closed', 'open' or 'half_open'."""
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        """Move from open to half-open once the cool-down has passed."""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+
+    def available(self) -> bool:
+        """
+        Check whether the source may be called, without claiming a call.
+
+        Returns:
+            False while the breaker is open and cooling down
+        """
+        with self._lock:
+            self._advance()
+            return self._state != OPEN
+
+    def allow(self) -> bool:
+        """
+        Claim a call.
+
+        Every allowed call must be reported with record().
+
+        Returns:
+            True if the call may go ahead; while half-open, only up to
+            half_open_probes calls at a time are allowed
+        """
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def cancel(self):
+        """Give back a call claimed with allow() that was never made."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        """
+        Report the outcome of an allowed call.
+
+        Args:
+            ok: False if the call failed (error, throttled, timed out)
+            elapsed: Call duration in seconds
+        """
+        success = ok and elapsed <= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if not success:
+                    self._trip()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            if self._state == OPEN:
+                # A call that started before the breaker tripped
+                return
+
+            self._outcomes.append(success)
+            if len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.trips += 1
+
+    def stats(self) -> Dict:
+        """
+        Get breaker counters.
+
+        Returns:
+            Dictionary with state, failure_rate over the window, calls in
+            the window, trips and rejected calls
+        """
+        with self._lock:
+            self._advance()
+            calls = len(self._outcomes)
+            return {
+                'state': self._state,
+                'failure_rate': round(self._outcomes.count(False) / calls, 3) if calls else 0.0,
+                'calls': calls,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Get the process-wide circuit breaker of a source, building it on first use.
+
+    Thresholds come from BREAKER_FAILURE_RATE, BREAKER_SLOW_CALL_SECONDS,
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_OPEN_SECONDS and
+    BREAKER_HALF_OPEN_PROBES.
+
+    Args:
+        name: Source name
+
+    Returns:
+        The source's shared CircuitBreaker
+    """
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(
+                name,
+                failure_rate=float(os.getenv('BREAKER_FAILURE_RATE', DEFAULT_FAILURE_RATE)),
+                slow_call_seconds=float(os.getenv('BREAKER_SLOW_CALL_SECONDS',
+                                                  DEFAULT_SLOW_CALL_SECONDS)),
+                window=int(os.getenv('BREAKER_WINDOW', DEFAULT_WINDOW)),
+                min_calls=int(os.getenv('BREAKER_MIN_CALLS', DEFAULT_MIN_CALLS)),
+                open_seconds=float(os.getenv('BREAKER_OPEN_SECONDS', DEFAULT_OPEN_SECONDS)),
+                half_open_probes=int(os.getenv('BREAKER_HALF_OPEN_PROBES',
+                                               DEFAULT_HALF_OPEN_PROBES)))
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict]:
+    """
+    Get the counters of every breaker built so far.
+
+    Returns:
+        Dictionary mapping source name to CircuitBreaker.stats()
+    """
+    with _BREAKERS_LOCK:
+        breakers = dict(_BREAKERS)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
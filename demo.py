@@ -3,6 +3,7 @@
 Demo script for Pokemon Card Pricing Tool
 Demonstrates the functionality without requiring user input
 """
+import events
 from pokepicer import PokemonCardPricer
 
 
@@ -49,7 +50,7 @@ def demo_without_ebay():
     print("="*60)
     print("\nTo run the interactive version: python pokepicer.py")
     print("\nFeatures:")
-    print("  ✓ eBay API integration (fetches top 5 sold items)")
+    print("  ✓ eBay API integration (averages recent sold items)")
     print("  ✓ TCGPlayer web scraping")
     print("  ✓ Multi-language support")
     print("  ✓ Condition-based pricing")
@@ -58,4 +59,5 @@ def demo_without_ebay():
 
 
 if __name__ == "__main__":
+    events.enable_console()
     demo_without_ebay()
@@ -1,29 +1,134 @@
 """
 eBay API integration for Pokemon card pricing.
-Fetches the top 5 last completed and sold items to calculate average price.
+Fetches the most recent completed and sold items, page by page, to calculate
+average price over a configurable sample.
 """
+import asyncio
 import os
+import math
 import requests
-from typing import List, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 import hashlib
+from circuit_breaker import get_breaker
+from hedging import get_hedger, hedging_enabled
+from http_session import async_http_available, build_session
+from latency import STAGE_EXTRACT, STAGE_JSON, get_histogram, timed
+from events import WARNING, emit
+from metrics import record_error
+from rate_limiter import get_limiter
+from price_sources import SALES_FIELD, BasePriceSource, SourceNotConfigured, register_source
+from price_stats import PriceStats
 
+# Sold items averaged per lookup
+DEFAULT_SAMPLE_SIZE = 50
+# Items requested per API call (the Finding API allows at most 100)
+DEFAULT_ENTRIES_PER_PAGE = 100
+MAX_ENTRIES_PER_PAGE = 100
+# The Finding API returns at most 100 pages per search
+MAX_PAGES = 100
+# Pages fetched in parallel once the first page has been read
+DEFAULT_PAGE_CONCURRENCY = 4
+# Individual sold items kept in get_average_price() results
+DEFAULT_ITEMS_KEPT = 10
+# Finding API endpoint (EBAY_FINDING_API_URL points it elsewhere, e.g. at a stub)
+DEFAULT_FINDING_API_URL = "https://svcs.ebay.com/services/search/FindingService/v1"
 
-class EbayPricer:
+
+class EbayPricer(BasePriceSource):
     """Handles eBay API calls to fetch Pokemon card prices."""
     
-    def __init__(self, app_id: str):
+    name = 'eBay'
+    reports_sales = True
+    
+    def __init__(self, app_id: str, timeout: float = 10,
+                 session: Optional[requests.Session] = None,
+                 sample_size: Optional[int] = None,
+                 entries_per_page: Optional[int] = None,
+                 max_days: Optional[float] = None,
+                 page_concurrency: Optional[int] = None,
+                 items_kept: Optional[int] = None,
+                 hedge: Optional[bool] = None,
+                 async_client: Optional['httpx.AsyncClient'] = None):
         """
         Initialize eBay pricer with API credentials.
         
         Args:
             app_id: eBay App ID
+            timeout: HTTP timeout for API calls in seconds (default: 10)
+            session: HTTP session to use (default: a new pooled keep-alive
+                     session shared by all calls made through this pricer)
+            sample_size: Sold items to average (default: EBAY_SAMPLE_SIZE
+                         env var or 50)
+            entries_per_page: Items per API call, at most 100 (default:
+                              EBAY_ENTRIES_PER_PAGE env var or 100)
+            max_days: Only use items sold in the last N days; 0 means no
+                      window (default: EBAY_MAX_DAYS env var or 0)
+            page_concurrency: Pages fetched in parallel (default:
+                              EBAY_PAGE_CONCURRENCY env var or 4)
+            items_kept: Sold items included in get_average_price() results
+                        (default: EBAY_ITEMS_KEPT env var or 10)
+            hedge: Send a second request when a page is slower than usual
+                   (default: HEDGE_REQUESTS env var)
+            async_client: httpx client used by fetch_async() (default: a
+                          pooled client per event loop if httpx is installed,
+                          otherwise fetch_async() runs fetch() on a thread)
         """
         # Store the raw API key for API calls (required by eBay)
         self.api_key = app_id
         # Also store a hashed version for logging/display purposes
         self.api_key_hash = self._hash_api_key(app_id)
-        self.base_url = "https://svcs.ebay.com/services/search/FindingService/v1"
+        self.base_url = os.getenv('EBAY_FINDING_API_URL', DEFAULT_FINDING_API_URL)
+        self.timeout = timeout
+        self.session = session or build_session(limiter=get_limiter(self.name),
+                                                breaker=get_breaker(self.name),
+                                                histogram=get_histogram(self.name))
+        
+        if sample_size is None:
+            sample_size = int(os.getenv('EBAY_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE))
+        if entries_per_page is None:
+            entries_per_page = int(os.getenv('EBAY_ENTRIES_PER_PAGE', DEFAULT_ENTRIES_PER_PAGE))
+        if max_days is None:
+            max_days = float(os.getenv('EBAY_MAX_DAYS', 0))
+        if page_concurrency is None:
+            page_concurrency = int(os.getenv('EBAY_PAGE_CONCURRENCY', DEFAULT_PAGE_CONCURRENCY))
+        if items_kept is None:
+            items_kept = int(os.getenv('EBAY_ITEMS_KEPT', DEFAULT_ITEMS_KEPT))
+        self.sample_size = max(1, sample_size)
+        self.entries_per_page = max(1, min(entries_per_page, MAX_ENTRIES_PER_PAGE))
+        self.max_days = max_days
+        self.page_concurrency = max(1, page_concurrency)
+        self.items_kept = max(0, items_kept)
+        self._page_executor = ThreadPoolExecutor(max_workers=self.page_concurrency,
+                                                 thread_name_prefix='ebay-page')
+        if hedge is None:
+            hedge = hedging_enabled()
+        self.hedger = get_hedger(self.name) if hedge else None
+        
+        self.async_client = async_client
+        self._async_clients = None
         
+    @classmethod
+    def from_env(cls, timeout: float = 10) -> 'EbayPricer':
+        """
+        Build an eBay pricer from the EBAY_APP_ID environment variable.
+        
+        Args:
+            timeout: HTTP timeout for API calls in seconds
+            
+        Returns:
+            Configured EbayPricer
+            
+        Raises:
+            SourceNotConfigured: If EBAY_APP_ID is not set
+        """
+        app_id = os.getenv('EBAY_APP_ID')
+        if not app_id:
+            raise SourceNotConfigured('API credentials not configured')
+        return cls(app_id, timeout=timeout)
+    
     @staticmethod
     def _hash_api_key(api_key: str) -> str:
         """
@@ -39,7 +144,8 @@ class EbayPricer:
         return hashlib.sha256(api_key.encode()).hexdigest()
     
     def search_sold_items(self, card_name: str, language: str = "English", 
-                         condition: str = "Used") -> List[Dict]:
+                         condition: str = "Used",
+                         sample_size: Optional[int] = None) -> List[Dict]:
         """
         Search for sold Pokemon cards on eBay.
         
@@ -47,10 +153,150 @@ class EbayPricer:
             card_name: Name of the Pokemon card
             language: Language of the card (default: English)
             condition: Condition of the card (default: Used)
+            sample_size: Maximum number of items (default: self.sample_size)
             
         Returns:
-            List of sold items with prices
+            List of sold items with prices, most recent first
+        """
+        return list(self.iter_sold_items(card_name, language, condition, sample_size))
+    
+    def iter_sold_items(self, card_name: str, language: str = "English",
+                        condition: str = "Used",
+                        sample_size: Optional[int] = None) -> Iterator[Dict]:
         """
+        Stream sold items, most recent first, fetching pages as needed.
+        
+        The first page tells how many pages exist; the rest are fetched up
+        to page_concurrency at a time and yielded in order. Fetching stops
+        as soon as sample_size items have been yielded or a page falls
+        entirely outside the max_days window; pages still queued are
+        cancelled.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Used)
+            sample_size: Maximum number of items (default: self.sample_size)
+            
+        Yields:
+            Sold item dictionaries
+        """
+        sample_size, per_page, cutoff, params = self._plan(card_name, language,
+                                                           condition, sample_size)
+        
+        first = self._fetch_page(params, 1)
+        if first is None:
+            return
+        page_items, total_pages = first
+        last_page = min(total_pages, MAX_PAGES, math.ceil(sample_size / per_page))
+        
+        pending = deque()
+        next_page = 2
+        yielded = 0
+        try:
+            while True:
+                # Keep up to page_concurrency later pages in flight while
+                # the current one is consumed
+                while next_page <= last_page and len(pending) < self.page_concurrency:
+                    pending.append(self._page_executor.submit(self._fetch_page, params, next_page))
+                    next_page += 1
+                
+                in_window = False
+                for item in page_items:
+                    if not self._in_window(item, cutoff):
+                        continue
+                    in_window = True
+                    yield item
+                    yielded += 1
+                    if yielded >= sample_size:
+                        return
+                
+                if not pending or (cutoff is not None and page_items and not in_window):
+                    return
+                page = pending.popleft().result()
+                if page is None or not page[0]:
+                    return
+                page_items = page[0]
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    async def search_sold_items_async(self, card_name: str, language: str = "English",
+                                      condition: str = "Used",
+                                      sample_size: Optional[int] = None) -> List[Dict]:
+        """
+        Asynchronous variant of search_sold_items() using the httpx client.
+        
+        Pages are fetched and consumed exactly as in iter_sold_items(), with
+        asyncio tasks instead of worker threads.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Used)
+            sample_size: Maximum number of items (default: self.sample_size)
+            
+        Returns:
+            List of sold items with prices, most recent first
+        """
+        sample_size, per_page, cutoff, params = self._plan(card_name, language,
+                                                           condition, sample_size)
+        
+        first = await self._fetch_page_async(params, 1)
+        if first is None:
+            return []
+        page_items, total_pages = first
+        last_page = min(total_pages, MAX_PAGES, math.ceil(sample_size / per_page))
+        
+        pending = deque()
+        next_page = 2
+        items = []
+        try:
+            while True:
+                while next_page <= last_page and len(pending) < self.page_concurrency:
+                    pending.append(asyncio.ensure_future(
+                        self._fetch_page_async(params, next_page)))
+                    next_page += 1
+                
+                in_window = False
+                for item in page_items:
+                    if not self._in_window(item, cutoff):
+                        continue
+                    in_window = True
+                    items.append(item)
+                    if len(items) >= sample_size:
+                        return items
+                
+                if not pending or (cutoff is not None and page_items and not in_window):
+                    return items
+                page = await pending.popleft()
+                if page is None or not page[0]:
+                    return items
+                page_items = page[0]
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _plan(self, card_name: str, language: str, condition: str,
+              sample_size: Optional[int]) -> Tuple[int, int, Optional[datetime], Dict]:
+        """Work out sample size, page size, date cutoff and query parameters."""
+        sample_size = sample_size or self.sample_size
+        per_page = min(self.entries_per_page, sample_size)
+        cutoff = None
+        if self.max_days > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=self.max_days)
+        params = self._search_params(card_name, language, condition, per_page, cutoff)
+        return sample_size, per_page, cutoff, params
+    
+    @classmethod
+    def _in_window(cls, item: Dict, cutoff: Optional[datetime]) -> bool:
+        """Whether an item sold after the cutoff (or has no end time)."""
+        return cutoff is None or not item.get('end_time') or \
+            cls._parse_time(item['end_time']) >= cutoff
+    
+    def _search_params(self, card_name: str, language: str, condition: str,
+                       per_page: int, cutoff: Optional[datetime]) -> Dict:
+        """Build the findCompletedItems query parameters (without the page number)."""
         # Build search query
         search_query = f"Pokemon {card_name} {language}"
         
@@ -65,49 +311,153 @@ class EbayPricer:
             'itemFilter(0).value': 'true',
             'itemFilter(1).name': 'Condition',
             'itemFilter(1).value': self._map_condition(condition),
-            'paginationInput.entriesPerPage': '5',
+            'paginationInput.entriesPerPage': str(per_page),
             'sortOrder': 'EndTimeSoonest'
         }
+        if cutoff is not None:
+            params['itemFilter(2).name'] = 'EndTimeFrom'
+            params['itemFilter(2).value'] = cutoff.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        return params
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request, hedged if hedging is enabled."""
+        if self.hedger is None:
+            return self.session.get(url, **kwargs)
+        return self.hedger.call(lambda: self.session.get(url, **kwargs))
+    
+    def _client_async(self) -> 'httpx.AsyncClient':
+        """Get the httpx client of the running event loop, loading httpx on first use."""
+        if self.async_client is not None:
+            return self.async_client
+        if self._async_clients is None:
+            from async_http import AsyncClientSlot, build_async_client
+            self._async_clients = AsyncClientSlot(
+                lambda: build_async_client(limiter=get_limiter(self.name),
+                                           breaker=get_breaker(self.name),
+                                           histogram=get_histogram(self.name)))
+        return self._async_clients.get()
+    
+    async def aclose(self):
+        """Close the httpx client built for the running event loop, if any."""
+        if self._async_clients is not None:
+            await self._async_clients.aclose()
+    
+    def _fetch_page(self, params: Dict, page: int) -> Optional[Tuple[List[Dict], int]]:
+        """
+        Fetch and parse one page of sold items.
+        
+        Args:
+            params: Query parameters from _search_params()
+            page: 1-based page number
+            
+        Returns:
+            Tuple of (items, total pages), or None if the request failed
+        """
+        try:
+            response = self._get(
+                self.base_url,
+                params=dict(params, **{'paginationInput.pageNumber': str(page)}),
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            with timed(self.name, STAGE_JSON):
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            emit('source.error', WARNING, source=self.name, error=str(e))
+            record_error(self.name, e)
+            return None
         
+        with timed(self.name, STAGE_EXTRACT):
+            return self._parse_page(data)
+    
+    async def _fetch_page_async(self, params: Dict,
+                                page: int) -> Optional[Tuple[List[Dict], int]]:
+        """Asynchronous variant of _fetch_page()."""
+        import httpx
+        client = self._client_async()
         try:
-            response = requests.get(self.base_url, params=params, timeout=10)
+            response = await client.get(
+                self.base_url,
+                params=dict(params, **{'paginationInput.pageNumber': str(page)}),
+                timeout=self.timeout
+            )
             response.raise_for_status()
-            data = response.json()
-            
-            # Parse the response
-            items = []
-            search_result = data.get('findCompletedItemsResponse', [{}])[0]
-            search_results = search_result.get('searchResult', [{}])[0]
-            
-            if 'item' in search_results:
-                for item in search_results['item']:
-                    try:
-                        title = item.get('title', [''])[0]
-                        price = float(item.get('sellingStatus', [{}])[0]
-                                    .get('currentPrice', [{}])[0]
-                                    .get('__value__', 0))
-                        currency = item.get('sellingStatus', [{}])[0] \
-                                      .get('currentPrice', [{}])[0] \
-                                      .get('@currencyId', 'USD')
-                        
-                        items.append({
-                            'title': title,
-                            'price': price,
-                            'currency': currency
-                        })
-                    except (KeyError, IndexError, ValueError):
-                        continue
-            
-            return items
+            with timed(self.name, STAGE_JSON):
+                data = response.json()
+        except (httpx.HTTPError, requests.exceptions.RequestException, ValueError) as e:
+            emit('source.error', WARNING, source=self.name, error=str(e))
+            record_error(self.name, e)
+            return None
+        
+        with timed(self.name, STAGE_EXTRACT):
+            return self._parse_page(data)
+    
+    @staticmethod
+    def _parse_page(data: Dict) -> Tuple[List[Dict], int]:
+        """
+        Parse a findCompletedItems response.
+        
+        Args:
+            data: Decoded JSON response
             
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching eBay data: {e}")
-            return []
+        Returns:
+            Tuple of (items, total pages)
+        """
+        items = []
+        search_response = data.get('findCompletedItemsResponse', [{}])[0]
+        search_results = search_response.get('searchResult', [{}])[0]
+        
+        if 'item' in search_results:
+            for item in search_results['item']:
+                try:
+                    title = item.get('title', [''])[0]
+                    price = float(item.get('sellingStatus', [{}])[0]
+                                .get('currentPrice', [{}])[0]
+                                .get('__value__', 0))
+                    currency = item.get('sellingStatus', [{}])[0] \
+                                  .get('currentPrice', [{}])[0] \
+                                  .get('@currencyId', 'USD')
+                    
+                    sold_item = {
+                        'title': title,
+                        'price': price,
+                        'currency': currency
+                    }
+                    end_time = item.get('listingInfo', [{}])[0].get('endTime', [None])[0]
+                    if end_time:
+                        sold_item['end_time'] = end_time
+                    item_id = item.get('itemId', [None])[0]
+                    if item_id:
+                        sold_item['item_id'] = item_id
+                    items.append(sold_item)
+                except (KeyError, IndexError, ValueError):
+                    continue
+        
+        try:
+            total_pages = int(search_response.get('paginationOutput', [{}])[0]
+                              .get('totalPages', ['1'])[0])
+        except (KeyError, IndexError, ValueError):
+            total_pages = 1
+        
+        return items, total_pages
+    
+    @staticmethod
+    def _parse_time(value: str) -> datetime:
+        """Parse an eBay timestamp like '2024-05-01T12:00:00.000Z'."""
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return datetime.max.replace(tzinfo=timezone.utc)
     
     def get_average_price(self, card_name: str, language: str = "English",
                          condition: str = "Used") -> Optional[Dict]:
         """
-        Get average price from top 5 sold items.
+        Get average price over the most recent sold items.
+        
+        Prices are aggregated as items stream in, so only the first
+        items_kept items are held in memory. The average is the mean of the
+        prices inside the IQR fences, so a mislabeled graded slab or lot
+        listing does not skew it.
         
         Args:
             card_name: Name of the Pokemon card
@@ -115,23 +465,83 @@ class EbayPricer:
             condition: Condition of the card
             
         Returns:
-            Dictionary with average price and item count
+            Dictionary with average price, median price, item count and the
+            full price statistics
+        """
+        return self._summarize(self.iter_sold_items(card_name, language, condition))
+    
+    def fetch(self, card_name: str, language: str = "English",
+              condition: str = "Near Mint", with_sales: bool = False) -> Optional[Dict]:
         """
-        items = self.search_sold_items(card_name, language, condition)
+        Fetch the price result for a card.
         
-        if not items:
-            return None
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+            with_sales: Also return every sold item of the sample under
+                        SALES_FIELD, for the price history
+            
+        Returns:
+            Price result dictionary, or None if nothing was found
+        """
+        return self._summarize(self.iter_sold_items(card_name, language, condition),
+                               with_sales)
+    
+    async def fetch_async(self, card_name: str, language: str = "English",
+                          condition: str = "Near Mint",
+                          with_sales: bool = False) -> Optional[Dict]:
+        """
+        Fetch the price result for a card on the event loop.
         
-        total = sum(item['price'] for item in items)
-        average = total / len(items)
+        Uses the httpx client when there is one, and otherwise falls back
+        to running fetch() on a worker thread. Requests are not hedged.
         
-        return {
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+            with_sales: See fetch()
+            
+        Returns:
+            Price result dictionary, or None if nothing was found
+        """
+        if self.async_client is None and not async_http_available():
+            return await asyncio.to_thread(self.fetch, card_name, language, condition,
+                                           with_sales)
+        items = await self.search_sold_items_async(card_name, language, condition)
+        return self._summarize(items, with_sales)
+    
+    def _summarize(self, items: Iterable[Dict], with_sales: bool = False) -> Optional[Dict]:
+        """Build the get_average_price() result from a stream of sold items."""
+        stats = PriceStats()
+        currency = None
+        kept = []
+        sales = [] if with_sales else None
+        for item in items:
+            stats.add(item['price'])
+            currency = currency or item['currency']
+            if len(kept) < self.items_kept:
+                kept.append(item)
+            if sales is not None:
+                sales.append(item)
+        
+        summary = stats.summary()
+        if summary is None:
+            return None
+        
+        result = {
             'source': 'eBay',
-            'average_price': round(average, 2),
-            'currency': items[0]['currency'] if items else 'USD',
-            'sample_size': len(items),
-            'items': items
+            'average_price': summary['robust_mean'],
+            'median_price': summary['median'],
+            'currency': currency or 'USD',
+            'sample_size': summary['count'],
+            'price_stats': summary,
+            'items': kept
         }
+        if sales is not None:
+            result[SALES_FIELD] = sales
+        return result
     
     @staticmethod
     def _map_condition(condition: str) -> str:
@@ -156,3 +566,6 @@ class EbayPricer:
             'poor': '6000'
         }
         return condition_map.get(condition.lower(), '3000')
+
+
+register_source(EbayPricer.name, EbayPricer.from_env)
@@ -0,0 +1,209 @@
+"""
+Structured events for progress and error reporting.
+Library code calls emit() with an event name and fields instead of printing.
+Events go to the 'pokepricer' logger, which is off until something enables
+it, so a disabled event costs one level check. When enabled, events are
+written as JSON lines by a background thread (through a logging queue) so
+request threads never block on the output, or rendered as the familiar
+console lines for the command-line tools.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Callable, Dict, Optional, TextIO, Union
+
+LOGGER_NAME = 'pokepricer'
+INFO = logging.INFO
+WARNING = logging.WARNING
+# Logger level while events are disabled
+DISABLED = logging.CRITICAL + 10
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.addHandler(logging.NullHandler())
+logger.setLevel(DISABLED)
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def enabled(level: int = INFO) -> bool:
+    """
+    Check whether events of a level are being recorded.
+
+    Callers building expensive fields can check this first.
+
+    Args:
+        level: Logging level (default: INFO)
+
+    Returns:
+        True if emit() at this level would record anything
+    """
+    return logger.isEnabledFor(level)
+
+
+def emit(event: str, level: int = INFO, **fields):
+    """
+    Record an event.
+
+    Args:
+        event: Dotted event name, e.g. 'source.result'
+        level: Logging level (default: INFO; errors use WARNING)
+        **fields: Event data; values should be JSON-serialisable
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'event': event, 'fields': fields})
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats events as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {'ts': round(record.created, 3), 'level': record.levelname.lower(),
+                'event': getattr(record, 'event', record.getMessage())}
+        data.update(getattr(record, 'fields', {}))
+        return json.dumps(data, default=str)
+
+
+def _banner(fields: Dict) -> str:
+    lines = [f"\n{'='*60}",
+             f"Searching for: {fields['card_name']}",
+             f"Language: {fields['language']} | Condition: {fields['condition']}",
+             f"{'='*60}\n"]
+    if fields.get('sources'):
+        lines.append(f"Fetching prices from {' and '.join(fields['sources'])}...\n")
+    return '\n'.join(lines)
+
+
+def _source_result(fields: Dict) -> str:
+    name = fields['source']
+    status = fields['status']
+    if status == 'ok':
+        line = f"✓ {name}: ${fields['price']}"
+        if fields.get('sample_size') is not None:
+            line += f" (based on {fields['sample_size']} sold items)"
+        if fields.get('stale_age') is not None:
+            line += f" [cached {fields['stale_age']:.0f}s ago, refreshing]"
+        elif fields.get('cached'):
+            line += " [cached]"
+        return line
+    if status == 'timeout':
+        return f"⏱ {name}: Timed out after {fields['elapsed']}s"
+    if status == 'unavailable':
+        return f"⊘ {name}: Temporarily unavailable, skipped"
+    return f"✗ {name}: No results found"
+
+
+def _source_error(fields: Dict) -> str:
+    what = f"{fields['source']} {fields['operation']}" if fields.get('operation') else fields['source']
+    return f"Error fetching {what} data: {fields['error']}"
+
+
+def _account_deletion(fields: Dict) -> str:
+    return '\n'.join(["eBay Marketplace Account Deletion notification received:",
+                      f"  Username: {fields['username']}",
+                      f"  User ID: {fields['user_id']}",
+                      f"  Event Date: {fields['event_date']}"])
+
+
+# How ConsoleFormatter renders each event: a str.format() template over the
+# event's fields or a function of them
+CONSOLE_TEMPLATES: Dict[str, Union[str, Callable[[Dict], str]]] = {
+    'search.started': _banner,
+    'source.result': _source_result,
+    'source.unconfigured': "⚠ {source}: {reason}",
+    'source.error': _source_error,
+    'source.parser_unavailable': "⚠ {source} parser '{parser}' is not available, using '{fallback}'",
+    'cache.error': "Error {action} price cache: {error}",
+    'history.error': "Error {action} price history: {error}",
+    'scheduler.error': "Error refreshing watched cards: {error}",
+    'ebay.account_deletion': _account_deletion,
+    'ebay.account_deletion_error': "Error processing marketplace account deletion: {error}",
+}
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Renders events as the human-readable lines of the command-line tools."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = getattr(record, 'event', None)
+        fields = getattr(record, 'fields', {})
+        template = CONSOLE_TEMPLATES.get(event)
+        if template is None:
+            details = ' '.join(f"{key}={value}" for key, value in fields.items())
+            return f"{event or record.getMessage()} {details}".rstrip()
+        return template(fields) if callable(template) else template.format(**fields)
+
+
+def disable():
+    """Stop recording events and shut down the handler enable() installed."""
+    global _handler, _listener
+    logger.setLevel(DISABLED)
+    if _handler is not None:
+        logger.removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def enable(level: int = INFO, stream: Optional[TextIO] = None,
+           filename: Optional[str] = None, fmt: str = 'json', queued: bool = True):
+    """
+    Start recording events, replacing any previous enable().
+
+    Args:
+        level: Lowest level recorded (default: INFO)
+        stream: Stream written to (default: stderr)
+        filename: Append to this file instead of a stream
+        fmt: 'json' for JSON lines or 'console' for console lines
+        queued: Hand events to a background thread that does the writing;
+                turn off to keep them in order with the caller's own output
+    """
+    global _handler, _listener
+    disable()
+
+    target = logging.FileHandler(filename) if filename else \
+        logging.StreamHandler(stream or sys.stderr)
+    target.setFormatter(ConsoleFormatter() if fmt == 'console' else JSONFormatter())
+
+    if queued:
+        events = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(events, target)
+        _listener.start()
+        _handler = logging.handlers.QueueHandler(events)
+    else:
+        _handler = target
+
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    # Our handler writes the events; do not also pass them to the root logger
+    logger.propagate = False
+
+
+def enable_console(level: int = INFO):
+    """Print events to stdout as console lines, in order with other output."""
+    enable(level, sys.stdout, fmt='console', queued=False)
+
+
+def configure_from_env():
+    """
+    Enable events from the environment.
+
+    LOG_LEVEL (e.g. INFO or WARNING; unset or 'off' keeps events disabled),
+    LOG_FORMAT ('json' or 'console', default json) and LOG_FILE (default:
+    stderr).
+    """
+    level = os.getenv('LOG_LEVEL', '').strip().upper()
+    if not level or level == 'OFF':
+        return
+    value = int(level) if level.isdigit() else logging.getLevelName(level)
+    enable(value if isinstance(value, int) else INFO,
+           filename=os.getenv('LOG_FILE') or None,
+           fmt=os.getenv('LOG_FORMAT', 'json').lower())
+
+
+atexit.register(disable)
@@ -2,6 +2,7 @@
 Example: Using Pokemon Card Pricing Tool Programmatically
 This demonstrates how to integrate the pricing tool into your own Python code
 """
+import events
 from pokepicer import PokemonCardPricer
 
 
@@ -44,13 +45,13 @@ def example_multiple_cards():
         "Mewtwo VSTAR"
     ]
     
-    all_results = []
+    # Price the whole list in one batch; sources are queried concurrently
+    all_results = pricer.get_prices(
+        [(card_name, "English", "Near Mint") for card_name in cards_to_check]
+    )
     
-    for card_name in cards_to_check:
-        print(f"\nSearching for: {card_name}")
-        results = pricer.get_price(card_name, "English", "Near Mint")
-        all_results.append(results)
-        
+    for results in all_results:
+        print(f"\n{results['card_name']}:")
         if results['average_price']:
             print(f"  → Average: ${results['average_price']}")
         else:
@@ -147,6 +148,7 @@ def example_error_handling():
 
 
 if __name__ == "__main__":
+    events.enable_console()
     print("""
     ╔════════════════════════════════════════════════════════╗
     ║     POKEMON CARD PRICING TOOL - EXAMPLES               ║
@@ -0,0 +1,228 @@
+"""
+Hedged requests for upstream calls.
+If a request has not answered by a high percentile of the source's recent
+latency, an identical second request is sent and whichever succeeds first
+is used. A budget caps the extra load hedging adds.
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, TypeVar
+
+from latency import LatencyHistogram, get_histogram
+
+# Hedge once a request is slower than this percentile of recent requests
+DEFAULT_PERCENTILE = 95.0
+# Extra requests allowed, as a fraction of all requests
+DEFAULT_BUDGET = 0.1
+# Hedges that may be saved up while traffic is light
+DEFAULT_MAX_BURST = 10
+# Recent samples needed before the percentile is trusted
+DEFAULT_MIN_SAMPLES = 20
+# Never hedge sooner than this (seconds)
+DEFAULT_MIN_DELAY = 0.05
+
+T = TypeVar('T')
+
+
+class HedgeBudget:
+    """
+    Token budget for hedges.
+
+    Every request earns ``ratio`` of a token, up to ``max_burst``; every
+    hedge spends one. Over time at most ``ratio`` extra requests are sent
+    per request.
+    """
+
+    def __init__(self, ratio: float = DEFAULT_BUDGET, max_burst: float = DEFAULT_MAX_BURST):
+        """
+        Initialize an empty budget.
+
+        Args:
+            ratio: Hedges allowed per request
+            max_burst: Most tokens that can be saved up
+        """
+        self.ratio = ratio
+        self.max_burst = max_burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        """Credit one request."""
+        with self._lock:
+            self._tokens = min(self.max_burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """
+        Spend a token for a hedge.
+
+        Returns:
+            True if the hedge may be sent
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class Hedger:
+    """Runs calls with an optional hedge driven by a source's latency histogram."""
+
+    def __init__(self, name: str, histogram: Optional[LatencyHistogram] = None,
+                 percentile: float = DEFAULT_PERCENTILE,
+                 budget: Optional[HedgeBudget] = None,
+                 min_samples: int = DEFAULT_MIN_SAMPLES,
+                 min_delay: float = DEFAULT_MIN_DELAY,
+                 max_workers: int = 32):
+        """
+        Initialize the hedger.
+
+        Args:
+            name: Source name
+            histogram: Latencies the hedge delay is taken from (default:
+                       the source's shared histogram)
+            percentile: Percentile of recent latency after which to hedge
+            budget: Hedge budget (default: DEFAULT_BUDGET of requests)
+            min_samples: Recent samples needed before hedging at all
+            min_delay: Lower bound of the hedge delay in seconds
+            max_workers: Threads running the attempts
+        """
+        self.name = name
+        self.histogram = histogram or get_histogram(name)
+        self.percentile = percentile
+        self.budget = budget or HedgeBudget()
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=f'hedge-{name}')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self) -> Optional[float]:
+        """
+        Get how long to wait before hedging.
+
+        Returns:
+            Seconds, or None while there are too few recent samples
+        """
+        if self.histogram.recent_count() < self.min_samples:
+            return None
+        value = self.histogram.percentile(self.percentile)
+        return max(self.min_delay, value) if value is not None else None
+
+    def call(self, attempt: Callable[[], T]) -> T:
+        """
+        Run attempt(), hedging it with a second attempt if it is slow.
+
+        The first attempt to succeed wins; if one fails, the other's result
+        is used. The losing attempt is left to finish in the background.
+
+        Args:
+            attempt: Zero-argument callable making the request
+
+        Returns:
+            The winning attempt's result
+
+        Raises:
+            Exception: The last error, if every attempt failed
+        """
+        self.budget.earn()
+        with self._lock:
+            self.calls += 1
+
+        delay = self.delay()
+        if delay is None:
+            return attempt()
+
+        first = self._executor.submit(attempt)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.budget.try_spend():
+            return first.result()
+
+        second = self._executor.submit(attempt)
+        with self._lock:
+            self.hedged += 1
+
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict:
+        """
+        Get hedging counters.
+
+        Returns:
+            Dictionary with calls, hedged, hedge_wins and the current
+            delay_ms (None while hedging is not yet active)
+        """
+        delay = self.delay()
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'delay_ms': round(delay * 1000, 1) if delay is not None else None
+            }
+
+
+_HEDGERS: Dict[str, Hedger] = {}
+_HEDGERS_LOCK = threading.Lock()
+
+
+def hedging_enabled() -> bool:
+    """
+    Check the HEDGE_REQUESTS environment variable.
+
+    Returns:
+        True if sources should hedge their requests by default
+    """
+    return os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'
+
+
+def get_hedger(name: str) -> Hedger:
+    """
+    Get the process-wide hedger of a source, building it on first use.
+
+    HEDGE_PERCENTILE sets the latency percentile after which a request is
+    hedged, HEDGE_BUDGET the extra requests allowed as a fraction of all
+    requests, and HEDGE_MIN_SAMPLES the recent samples needed first.
+
+    Args:
+        name: Source name
+
+    Returns:
+        The source's shared Hedger
+    """
+    with _HEDGERS_LOCK:
+        hedger = _HEDGERS.get(name)
+        if hedger is None:
+            hedger = _HEDGERS[name] = Hedger(
+                name,
+                percentile=float(os.getenv('HEDGE_PERCENTILE', DEFAULT_PERCENTILE)),
+                budget=HedgeBudget(float(os.getenv('HEDGE_BUDGET', DEFAULT_BUDGET))),
+                min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', DEFAULT_MIN_SAMPLES)))
+        return hedger
+
+
+def hedger_stats() -> Dict[str, Dict]:
+    """
+    Get the counters of every hedger built so far.
+
+    Returns:
+        Dictionary mapping source name to Hedger.stats()
+    """
+    with _HEDGERS_LOCK:
+        hedgers = dict(_HEDGERS)
+    return {name: hedger.stats() for name, hedger in hedgers.items()}
@@ -0,0 +1,188 @@
+"""
+Shared HTTP session factory for the pricing sources.
+Builds pooled keep-alive sessions with retry/backoff so repeated lookups reuse
+TCP+TLS connections instead of opening a new one per request.
+"""
+import functools
+import importlib.util
+import os
+import time
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from latency import LatencyHistogram
+from rate_limiter import OVERLOAD_STATUS_CODES, SourceLimiter
+
+# Connections kept open per host
+DEFAULT_POOL_SIZE = 10
+# Retries for connection errors and retryable status codes
+DEFAULT_MAX_RETRIES = 2
+# Sleep between retries is backoff_factor * 2 ** (retry - 1) seconds
+DEFAULT_BACKOFF_FACTOR = 0.3
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Longest Retry-After honoured before a retry (seconds); upstreams asking
+# for more would hold a worker thread past the source timeout
+MAX_RETRY_AFTER = 2.0
+
+
+class CappedRetry(Retry):
+    """Retry that waits at most MAX_RETRY_AFTER seconds for a Retry-After header."""
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER)
+
+
+class SourceAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that guards every request with a source's circuit breaker
+    and rate limiter, and tracks its latency.
+
+    While the breaker is open, requests fail at once with CircuitOpenError.
+    Otherwise a request waits for a token and a concurrency slot for at
+    most its own timeout. Both guards then learn from the outcome whether
+    the upstream is healthy: connection errors, timeouts and 429/5xx
+    responses count as failures. The time spent queueing is attached to the
+    response as ``queue_delay`` (seconds), and the time the upstream took to
+    answer, without queueing, goes into the latency histogram. Retries made
+    by urllib3 happen inside one call, so build_session() only lets it
+    retry connection errors here: 429/5xx answers reach the limiter at once
+    and every upstream answer costs its own token.
+    """
+
+    def __init__(self, limiter: Optional[SourceLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 histogram: Optional[LatencyHistogram] = None, **kwargs):
+        """
+        Initialize the adapter.
+
+        Args:
+            limiter: Rate and concurrency limiter of the source
+            breaker: Circuit breaker of the source
+            histogram: Latency histogram of the source
+            **kwargs: Passed to HTTPAdapter
+        """
+        self.limiter = limiter
+        self.breaker = breaker
+        self.histogram = histogram
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} is temporarily unavailable "
+                                   f"(circuit open)", request=request)
+
+        timeout = kwargs.get('timeout')
+        if isinstance(timeout, tuple):
+            timeout = timeout[0]
+        delay = 0.0
+        if self.limiter is not None:
+            try:
+                delay = self.limiter.acquire(timeout)
+            except Exception:
+                if self.breaker is not None:
+                    self.breaker.cancel()
+                raise
+
+        ok = False
+        start = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+            ok = response.status_code not in OVERLOAD_STATUS_CODES
+            response.queue_delay = delay
+            if self.histogram is not None:
+                self.histogram.record(time.monotonic() - start)
+            return response
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(ok)
+            if self.breaker is not None:
+                self.breaker.record(ok, time.monotonic() - start)
+
+
+def build_session(pool_size: Optional[int] = None,
+                  max_retries: Optional[int] = None,
+                  backoff_factor: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None,
+                  limiter: Optional[SourceLimiter] = None,
+                  breaker: Optional[CircuitBreaker] = None,
+                  histogram: Optional[LatencyHistogram] = None) -> requests.Session:
+    """
+    Create a pooled HTTP session with keep-alive and retry/backoff.
+
+    The returned session can be shared by the Flask worker threads: the
+    underlying urllib3 pool is thread-safe and hands each thread its own
+    connection. Up to ``pool_size`` connections per host are kept alive;
+    bursts beyond that open short-lived extra connections instead of
+    queueing behind the pool. Callers must not mutate the session's headers
+    after construction.
+
+    Args:
+        pool_size: Connections kept per host (default: HTTP_POOL_SIZE env var or 10)
+        max_retries: Retries on connection errors, and on 429/5xx responses
+                     unless a limiter is given (default: HTTP_MAX_RETRIES
+                     env var or 2)
+        backoff_factor: Exponential backoff factor between retries in seconds
+                        (default: HTTP_BACKOFF_FACTOR env var or 0.3)
+        headers: Default headers sent with every request
+        limiter: Rate and concurrency limiter every request must pass
+                 (default: none)
+        breaker: Circuit breaker fed with every request's outcome
+                 (default: none)
+        histogram: Latency histogram fed with every answered request
+                   (default: none)
+
+    Returns:
+        Configured requests.Session
+    """
+    if pool_size is None:
+        pool_size = int(os.getenv('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE))
+    if max_retries is None:
+        max_retries = int(os.getenv('HTTP_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+    if backoff_factor is None:
+        backoff_factor = float(os.getenv('HTTP_BACKOFF_FACTOR', DEFAULT_BACKOFF_FACTOR))
+
+    retry = CappedRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        # A limited source retries nothing the upstream answered: a retry
+        # would spend quota without a token and delay the AIMD back-off
+        status_forcelist=RETRY_STATUS_CODES if limiter is None else (),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=limiter is None,
+        raise_on_status=False
+    )
+    pool = {'pool_connections': pool_size, 'pool_maxsize': pool_size, 'max_retries': retry}
+    if limiter is not None or breaker is not None or histogram is not None:
+        adapter = SourceAdapter(limiter, breaker, histogram, **pool)
+    else:
+        adapter = HTTPAdapter(**pool)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    if headers:
+        session.headers.update(headers)
+
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def async_http_available() -> bool:
+    """
+    Check whether the optional async HTTP client (httpx) is installed.
+
+    Does not import it; async_http.py is only loaded once an async lookup
+    actually runs.
+
+    Returns:
+        True if httpx can be imported
+    """
+    return importlib.util.find_spec('httpx') is not None
@@ -0,0 +1,229 @@
+"""
+Latency histograms for upstream calls and the stages of a lookup.
+Each source gets a log-bucketed histogram of its recent request latencies,
+cheap enough to update on every request and precise enough (about 10%) to
+pick hedging delays from its percentiles, plus one per processing stage
+(JSON decode, HTML parse, price extraction, whole lookup). Lifetime counts
+are also kept in coarse buckets for the Prometheus /metrics endpoint.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Bucket upper bounds grow by this factor from MIN_LATENCY to MAX_LATENCY
+BUCKET_GROWTH = 1.1
+MIN_LATENCY = 0.001
+MAX_LATENCY = 120.0
+# Seconds covered by each half of the rotating window
+DEFAULT_WINDOW_SECONDS = 300.0
+# Bucket upper bounds exported to Prometheus (seconds)
+EXPORT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stages timed for each source
+STAGE_HTTP = 'http'
+STAGE_JSON = 'json_decode'
+STAGE_HTML = 'html_parse'
+STAGE_EXTRACT = 'extract'
+STAGE_LOOKUP = 'lookup'
+
+
+def _bucket_bounds() -> List[float]:
+    count = math.ceil(math.log(MAX_LATENCY / MIN_LATENCY, BUCKET_GROWTH)) + 1
+    return [MIN_LATENCY * BUCKET_GROWTH ** i for i in range(count)]
+
+
+BUCKET_BOUNDS = _bucket_bounds()
+
+
+class LatencyHistogram:
+    """
+    Thread-safe histogram of recent latencies.
+
+    Counts are kept for the current and the previous window; percentiles
+    cover both, so old latencies age out after one to two windows while
+    there are always recent samples to answer from.
+    """
+
+    def __init__(self, window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                 clock=time.monotonic):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            window_seconds: Length of each rotating window
+            clock: Monotonic time source (for tests)
+        """
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._current = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._previous = [0] * (len(BUCKET_BOUNDS) + 1)
+        self._rotated_at = clock()
+        self._lock = threading.Lock()
+        # Lifetime totals
+        self.count = 0
+        self.total = 0.0
+        self._exported = [0] * (len(EXPORT_BUCKETS) + 1)
+
+    def _rotate(self):
+        now = self._clock()
+        elapsed = now - self._rotated_at
+        if elapsed < self.window_seconds:
+            return
+        if elapsed >= 2 * self.window_seconds:
+            self._previous = [0] * len(self._current)
+        else:
+            self._previous = self._current
+        self._current = [0] * len(self._previous)
+        self._rotated_at = now
+
+    def record(self, seconds: float):
+        """
+        Add one latency.
+
+        Args:
+            seconds: Request duration in seconds
+        """
+        index = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+        exported = bisect.bisect_left(EXPORT_BUCKETS, seconds)
+        with self._lock:
+            self._rotate()
+            self._current[index] += 1
+            self._exported[exported] += 1
+            self.count += 1
+            self.total += seconds
+
+    def cumulative_buckets(self) -> List[Tuple[float, int]]:
+        """
+        Get lifetime counts in Prometheus histogram form.
+
+        Returns:
+            List of (upper bound, observations at or below it), ending with
+            (inf, count)
+        """
+        with self._lock:
+            counts = list(self._exported)
+        buckets = []
+        seen = 0
+        for bound, count in zip(EXPORT_BUCKETS + (math.inf,), counts):
+            seen += count
+            buckets.append((bound, seen))
+        return buckets
+
+    def recent_count(self) -> int:
+        """
+        Count latencies in the current and previous window.
+
+        Returns:
+            Number of recent samples
+        """
+        with self._lock:
+            self._rotate()
+            return sum(self._current) + sum(self._previous)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Estimate a percentile of the recent latencies.
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            Upper bound of the bucket holding the percentile, in seconds,
+            or None without recent samples
+        """
+        with self._lock:
+            self._rotate()
+            counts = [a + b for a, b in zip(self._current, self._previous)]
+        total = sum(counts)
+        if not total:
+            return None
+
+        rank = max(1, math.ceil(total * q / 100))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else MAX_LATENCY
+        return MAX_LATENCY
+
+    def snapshot(self) -> Dict:
+        """
+        Summarise the histogram.
+
+        Returns:
+            Dictionary with lifetime count and sum, recent count and the
+            recent p50, p90, p95 and p99 in milliseconds
+        """
+        summary = {'count': self.count, 'sum': round(self.total, 6),
+                   'recent': self.recent_count()}
+        for q in (50, 90, 95, 99):
+            value = self.percentile(q)
+            summary[f'p{q}_ms'] = round(value * 1000, 1) if value is not None else None
+        return summary
+
+
+_HISTOGRAMS: Dict[Tuple[str, str], LatencyHistogram] = {}
+_HISTOGRAMS_LOCK = threading.Lock()
+
+
+def get_histogram(name: str, stage: str = STAGE_HTTP) -> LatencyHistogram:
+    """
+    Get the process-wide latency histogram of a source and stage.
+
+    Args:
+        name: Source name
+        stage: What is timed (default: the HTTP round trip)
+
+    Returns:
+        The shared LatencyHistogram
+    """
+    with _HISTOGRAMS_LOCK:
+        histogram = _HISTOGRAMS.get((name, stage))
+        if histogram is None:
+            histogram = _HISTOGRAMS[(name, stage)] = LatencyHistogram()
+        return histogram
+
+
+@contextmanager
+def timed(name: str, stage: str) -> Iterator[None]:
+    """
+    Record how long the with-block takes in a source's stage histogram.
+
+    Args:
+        name: Source name
+        stage: Stage being timed
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_histogram(name, stage).record(time.perf_counter() - start)
+
+
+def histograms() -> Dict[Tuple[str, str], LatencyHistogram]:
+    """
+    Get every histogram built so far.
+
+    Returns:
+        Dictionary mapping (source name, stage) to its LatencyHistogram
+    """
+    with _HISTOGRAMS_LOCK:
+        return dict(_HISTOGRAMS)
+
+
+def latency_stats() -> Dict[str, Dict[str, Dict]]:
+    """
+    Get a snapshot of every histogram built so far.
+
+    Returns:
+        Dictionary mapping source name to a dictionary mapping stage to
+        LatencyHistogram.snapshot()
+    """
+    stats = {}
+    for (name, stage), histogram in histograms().items():
+        stats.setdefault(name, {})[stage] = histogram.snapshot()
+    return stats
@@ -0,0 +1,223 @@
+"""
+Prometheus metrics for the pricing service.
+Counters are kept in a small process-wide registry; render() adds them to
+the per-stage latency histograms and the stats of the cache, in-flight
+lookups, refresh scheduler, rate limiters, circuit breakers and hedgers in
+the Prometheus text exposition format served at /metrics.
+"""
+import math
+import threading
+from typing import Dict, List, Tuple
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, breaker_stats
+from hedging import hedger_stats
+from latency import histograms
+from rate_limiter import OVERLOAD_STATUS_CODES, limiter_stats
+
+# Content type of the text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Counters updated through inc()
+SOURCE_LOOKUPS = 'pokepricer_source_lookups_total'
+SOURCE_ERRORS = 'pokepricer_source_errors_total'
+CATALOG_LOOKUPS = 'pokepricer_catalog_lookups_total'
+
+_HELP = {
+    SOURCE_LOOKUPS: 'Source lookups by outcome (ok, no_results, timeout, unavailable, cached, stale).',
+    SOURCE_ERRORS: 'Failed upstream requests by kind (request, decode).',
+    CATALOG_LOOKUPS: 'Card names looked up in the card catalog by result (exact, fuzzy, miss).',
+}
+
+# Circuit breaker states exported as numbers
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+_COUNTERS: Dict[str, Dict[LabelSet, float]] = {}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def inc(metric: str, amount: float = 1, **labels: str):
+    """
+    Increase a counter.
+
+    Args:
+        metric: Counter name
+        amount: Amount to add
+        **labels: Label values of the series
+    """
+    key = tuple(sorted(labels.items()))
+    with _COUNTERS_LOCK:
+        series = _COUNTERS.setdefault(metric, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def record_error(source: str, error: Exception):
+    """
+    Count a failed upstream request.
+
+    Args:
+        source: Source name
+        error: The exception raised; malformed responses (ValueError,
+               AttributeError) count as 'decode', anything else as 'request'
+    """
+    kind = 'decode' if isinstance(error, (ValueError, AttributeError)) else 'request'
+    inc(SOURCE_ERRORS, source=source, kind=kind)
+
+
+def counters() -> Dict[str, Dict[LabelSet, float]]:
+    """
+    Get a copy of every counter.
+
+    Returns:
+        Dictionary mapping counter name to a dictionary mapping the sorted
+        (label, value) pairs of each series to its value
+    """
+    with _COUNTERS_LOCK:
+        return {metric: dict(series) for metric, series in _COUNTERS.items()}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class _Writer:
+    """Collects samples grouped by metric family."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name: str, value, **labels):
+        if labels:
+            pairs = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            name = f'{name}{{{pairs}}}'
+        self.lines.append(f'{name} {_format_value(value)}')
+
+    def per_source(self, name: str, kind: str, help_text: str,
+                   stats: Dict[str, Dict], field: str):
+        if not stats:
+            return
+        self.family(name, kind, help_text)
+        for source, values in sorted(stats.items()):
+            self.sample(name, values.get(field), source=source)
+
+
+def _render_histograms(out: _Writer):
+    stage_histograms = histograms()
+    if not stage_histograms:
+        return
+    name = 'pokepricer_stage_seconds'
+    out.family(name, 'histogram',
+               'Time spent per source and stage (http, json_decode, html_parse, extract, lookup).')
+    for (source, stage), histogram in sorted(stage_histograms.items()):
+        for bound, count in histogram.cumulative_buckets():
+            out.sample(f'{name}_bucket', count, source=source, stage=stage,
+                       le=_format_value(float(bound)))
+        out.sample(f'{name}_sum', histogram.total, source=source, stage=stage)
+        out.sample(f'{name}_count', histogram.count, source=source, stage=stage)
+
+
+def _render_counters(out: _Writer):
+    for metric, series in sorted(counters().items()):
+        out.family(metric, 'counter', _HELP.get(metric, metric))
+        for labels, value in sorted(series.items()):
+            out.sample(metric, value, **dict(labels))
+
+
+def _render_sources(out: _Writer):
+    limiters = limiter_stats()
+    out.per_source('pokepricer_upstream_requests_total', 'counter',
+                   'Requests sent upstream.', limiters, 'requests')
+    out.per_source('pokepricer_upstream_overloaded_total', 'counter',
+                   'Upstream answers signalling overload '
+                   f"({'/'.join(map(str, OVERLOAD_STATUS_CODES))}).", limiters, 'overloaded')
+    out.per_source('pokepricer_rate_limited_total', 'counter',
+                   'Requests rejected by the rate limiter.', limiters, 'rejected')
+    out.per_source('pokepricer_upstream_in_flight', 'gauge',
+                   'Requests currently in flight upstream.', limiters, 'in_flight')
+    out.per_source('pokepricer_upstream_concurrency_limit', 'gauge',
+                   'Current adaptive concurrency limit.', limiters, 'concurrency_limit')
+
+    breakers = {source: dict(stats, state=BREAKER_STATES.get(stats['state']))
+                for source, stats in breaker_stats().items()}
+    out.per_source('pokepricer_circuit_state', 'gauge',
+                   'Circuit breaker state (0 closed, 1 half open, 2 open).', breakers, 'state')
+    out.per_source('pokepricer_circuit_trips_total', 'counter',
+                   'Times the circuit breaker opened.', breakers, 'trips')
+    out.per_source('pokepricer_circuit_rejected_total', 'counter',
+                   'Requests refused while the circuit was open.', breakers, 'rejected')
+
+    hedgers = hedger_stats()
+    out.per_source('pokepricer_hedge_calls_total', 'counter',
+                   'Requests run through the hedger.', hedgers, 'calls')
+    out.per_source('pokepricer_hedged_total', 'counter',
+                   'Hedge requests sent.', hedgers, 'hedged')
+    out.per_source('pokepricer_hedge_wins_total', 'counter',
+                   'Hedge requests that answered first.', hedgers, 'hedge_wins')
+
+
+def _render_pricer(out: _Writer, pricer):
+    cache = pricer.cache.stats() if pricer.cache is not None else None
+    if cache is not None:
+        for field, kind, help_text in (
+                ('hits', 'counter', 'Price cache hits.'),
+                ('misses', 'counter', 'Price cache misses.'),
+                ('stale_hits', 'counter', 'Expired cache entries served while refreshing.'),
+                ('evictions', 'counter', 'Price cache evictions.'),
+                ('hit_ratio', 'gauge', 'Price cache hit ratio.'),
+                ('entries', 'gauge', 'Entries in the price cache.'),
+                ('bytes', 'gauge', 'Approximate size of the price cache in bytes.')):
+            name = f'pokepricer_cache_{field}' + ('_total' if kind == 'counter' else '')
+            out.family(name, kind, help_text)
+            out.sample(name, cache[field])
+
+    inflight = [pricer._inflight.stats(), pricer._inflight_async.stats()]
+    out.family('pokepricer_lookups_in_flight', 'gauge',
+               'Source lookups currently running (shared between callers).')
+    out.sample('pokepricer_lookups_in_flight', sum(stats['in_flight'] for stats in inflight))
+    out.family('pokepricer_lookups_shared_total', 'counter',
+               'Callers that joined a lookup already in flight.')
+    out.sample('pokepricer_lookups_shared_total', sum(stats['shared'] for stats in inflight))
+
+    scheduler = pricer.scheduler.stats() if pricer.scheduler is not None else None
+    if scheduler is not None:
+        out.family('pokepricer_refresh_watched', 'gauge', 'Cards kept warm by the refresh scheduler.')
+        out.sample('pokepricer_refresh_watched', scheduler['watched'])
+        out.family('pokepricer_refreshes_total', 'counter', 'Background refreshes run.')
+        out.sample('pokepricer_refreshes_total', scheduler['refreshes'])
+
+
+def render(pricer=None) -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Args:
+        pricer: PokemonCardPricer whose cache, in-flight lookups and refresh
+                scheduler are reported (skipped if None)
+
+    Returns:
+        The /metrics response body
+    """
+    out = _Writer()
+    _render_histograms(out)
+    _render_counters(out)
+    _render_sources(out)
+    if pricer is not None:
+        _render_pricer(out, pricer)
+    return '\n'.join(out.lines) + '\n'
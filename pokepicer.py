@@ -2,87 +2,829 @@
 Main Pokemon Card Pricing Tool
 Aggregates pricing from multiple sources: eBay, TCGPlayer, and others.
 """
+import asyncio
+import functools
+import heapq
 import os
-from typing import Dict, List, Optional
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from dotenv import load_dotenv
+from card_catalog import CardCatalog
+from circuit_breaker import get_breaker
+import events
+from latency import STAGE_LOOKUP, timed
+from metrics import CATALOG_LOOKUPS, SOURCE_LOOKUPS, inc
+from price_cache import PriceCache, normalize_query
+from price_history import DEFAULT_WINDOW_DAYS, PriceHistory
+from price_sources import SALES_FIELD, PriceSource, create_sources
+from price_stats import summarize
+from singleflight import SingleFlight
+# Importing the pricer modules registers them as price sources
 from ebay_pricer import EbayPricer
 from tcgplayer_pricer import TCGPlayerPricer
 
+# Wall-clock budget for a single source lookup (seconds)
+DEFAULT_SOURCE_TIMEOUT = 10.0
+# Wall-clock budget for a whole get_price() call across all sources (seconds)
+DEFAULT_DEADLINE = 12.0
+# Worker threads shared by all concurrent get_price() calls
+DEFAULT_MAX_WORKERS = 16
+# Concurrent lookups per source while pricing a batch of cards
+DEFAULT_BATCH_CONCURRENCY = 4
+
+# A batch query: a card name, or a (card_name, language, condition) tuple
+# with language and condition optional
+CardQuery = Union[str, Sequence[str]]
+
+
+def parse_query(query: CardQuery) -> Tuple[str, str, str]:
+    """
+    Expand a batch query into a full (card_name, language, condition) tuple.
+    
+    Args:
+        query: Card name, or a tuple/list of card name, language and condition
+        
+    Returns:
+        Tuple of (card_name, language, condition) with defaults filled in
+        
+    Raises:
+        ValueError: If the query has no card name or too many fields
+    """
+    if isinstance(query, str):
+        query = (query,)
+    if not 1 <= len(query) <= 3:
+        raise ValueError(f"Expected (card_name, language, condition), got {query!r}")
+    
+    card_name = (query[0] or '').strip()
+    language = (query[1] if len(query) > 1 else '').strip() or 'English'
+    condition = (query[2] if len(query) > 2 else '').strip() or 'Near Mint'
+    if not card_name:
+        raise ValueError("Card name is required")
+    
+    return card_name, language, condition
+
 
 class PokemonCardPricer:
     """Main class for aggregating Pokemon card prices from multiple sources."""
     
-    def __init__(self):
-        """Initialize the pricer with all available sources."""
+    def __init__(self, deadline: Optional[float] = None,
+                 source_timeout: Optional[float] = None,
+                 max_workers: Optional[int] = None,
+                 sources: Optional[List[str]] = None,
+                 cache: Optional[PriceCache] = None,
+                 batch_concurrency: Optional[int] = None,
+                 history: Optional[PriceHistory] = None,
+                 catalog: Optional[CardCatalog] = None):
+        """
+        Initialize the pricer with all available sources.
+        
+        Args:
+            deadline: Overall time budget for get_price(), and for each card
+                      of a batch, in seconds
+                      (default: PRICER_DEADLINE env var or 12)
+            source_timeout: Time budget for each individual source in seconds
+                            (default: PRICER_SOURCE_TIMEOUT env var or 10)
+            max_workers: Size of the thread pool used to query sources
+                         (default: PRICER_MAX_WORKERS env var or 16)
+            sources: Names of registered sources to enable
+                     (default: PRICER_SOURCES env var, comma separated,
+                     or every registered source)
+            cache: Result cache sitting in front of the sources
+                   (default: built from the PRICE_CACHE_* env vars, see
+                   PriceCache.from_env)
+            batch_concurrency: Concurrent lookups per source in get_prices()
+                               (default: PRICER_BATCH_CONCURRENCY env var or 4)
+            history: Store every fresh source price and sold item is
+                     appended to (default: PRICE_HISTORY_PATH env var, or
+                     no history)
+            catalog: Card catalog canonicalizing card names before they
+                     reach the cache or any source (default: built from
+                     the CARD_CATALOG_* env vars, see CardCatalog.from_env)
+        """
         load_dotenv()
         
-        # Initialize eBay pricer if credentials are available
-        ebay_app_id = os.getenv('EBAY_APP_ID')
-        self.ebay_pricer = EbayPricer(ebay_app_id) if ebay_app_id else None
+        self.deadline = deadline if deadline is not None else \
+            float(os.getenv('PRICER_DEADLINE', DEFAULT_DEADLINE))
+        self.source_timeout = source_timeout if source_timeout is not None else \
+            float(os.getenv('PRICER_SOURCE_TIMEOUT', DEFAULT_SOURCE_TIMEOUT))
+        max_workers = max_workers or int(os.getenv('PRICER_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        self.batch_concurrency = batch_concurrency or \
+            int(os.getenv('PRICER_BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY))
         
-        # Initialize TCGPlayer scraper
-        self.tcgplayer_pricer = TCGPlayerPricer()
+        if sources is None and os.getenv('PRICER_SOURCES'):
+            sources = [name.strip() for name in os.getenv('PRICER_SOURCES').split(',')
+                       if name.strip()]
         
-    def get_price(self, card_name: str, language: str = "English", 
-                 condition: str = "Near Mint") -> Dict:
+        # Build every enabled source; the ones that cannot be configured
+        # (e.g. eBay without credentials) are remembered with the reason
+        self.sources, self.unconfigured_sources = create_sources(
+            sources, timeout=self.source_timeout)
+        
+        self.cache = cache if cache is not None else PriceCache.from_env()
+        self.history = history if history is not None else PriceHistory.from_env()
+        self.catalog = catalog if catalog is not None else CardCatalog.from_env()
+        # Set by a RefreshScheduler keeping watched cards warm
+        self.scheduler = None
+        
+        # Concurrent searches for the same card share one upstream call per
+        # source instead of each starting their own
+        self._inflight = SingleFlight()
+        self._inflight_async = SingleFlight()
+        
+        # Sources are queried in parallel so a search costs as much as the
+        # slowest source rather than the sum of all of them
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='pokepricer-source')
+    
+    def _set_source(self, name: str, source: Optional[PriceSource]):
+        """Replace, add or (with None) remove a source by name."""
+        if source is None:
+            self.sources.pop(name, None)
+        else:
+            self.sources[name] = source
+            self.unconfigured_sources.pop(name, None)
+    
+    @property
+    def ebay_pricer(self) -> Optional[PriceSource]:
+        """The eBay source, or None if it is not enabled."""
+        return self.sources.get('eBay')
+    
+    @ebay_pricer.setter
+    def ebay_pricer(self, source: Optional[PriceSource]):
+        self._set_source('eBay', source)
+    
+    @property
+    def tcgplayer_pricer(self) -> Optional[PriceSource]:
+        """The TCGPlayer source, or None if it is not enabled."""
+        return self.sources.get('TCGPlayer')
+    
+    @tcgplayer_pricer.setter
+    def tcgplayer_pricer(self, source: Optional[PriceSource]):
+        self._set_source('TCGPlayer', source)
+    
+    def _cached(self, name: str, key, max_stale: float = 0) -> Optional[Dict]:
         """
-        Get pricing information from all available sources.
+        Return the cached outcome for a source, or None on a miss.
+        
+        With max_stale, an expired result at most that many seconds past
+        its TTL is returned too, marked ``stale`` with its ``age``.
+        """
+        if self.cache is None:
+            return None
+        result = self.cache.get(name, key)
+        if result is not None:
+            return {'status': 'ok', 'result': result, 'elapsed': 0.0, 'cached': True}
+        if max_stale > 0:
+            entry = self.cache.get_stale(name, key, max_stale)
+            if entry is not None:
+                return {'status': 'ok', 'result': entry[0], 'elapsed': 0.0,
+                        'cached': True, 'stale': True, 'age': round(entry[1], 1)}
+        return None
+    
+    @staticmethod
+    def _unavailable(name: str) -> Optional[Dict]:
+        """Return an 'unavailable' outcome if the source's circuit is open."""
+        if get_breaker(name).available():
+            return None
+        return {'status': 'unavailable', 'result': None, 'elapsed': 0.0}
+    
+    def _cached_or_revalidate(self, name: str, source: PriceSource, key,
+                              card_name: str, language: str, condition: str,
+                              max_stale: float) -> Optional[Dict]:
+        """
+        Return the cached outcome for a source, refreshing it if stale.
+        
+        A stale result is served as is while a background lookup, shared
+        with any concurrent caller, replaces it in the cache.
+        """
+        outcome = self._cached(name, key, max_stale)
+        if outcome and outcome.get('stale'):
+            self._start_lookup(name, source, key, card_name, language, condition)
+        return outcome
+    
+    def _note_access(self, key, card_name: str, language: str, condition: str):
+        """Tell the refresh scheduler, if any, that a card was searched."""
+        if self.scheduler is not None:
+            self.scheduler.record_access(key, card_name, language, condition)
+    
+    def _storage_blocks(self) -> bool:
+        """Whether cache or history access may wait on disk I/O."""
+        in_memory = isinstance(self.cache, PriceCache) and self.cache.backend is None
+        return self.history is not None or not (self.cache is None or in_memory)
+    
+    def _store(self, name: str, key, result: Optional[Dict]):
+        """Remember a fresh source result and append it to the history."""
+        if not result:
+            return
+        # Every observed sale goes to the history, not just the ones returned
+        sales = result.pop(SALES_FIELD, None)
+        if self.cache is not None:
+            self.cache.set(name, key, result)
+        if self.history is not None:
+            self.history.record(key, name, result, sales=sales)
+    
+    def _fetch_options(self, source: PriceSource) -> Dict:
+        """Extra fetch() arguments: the full sales sample when a history wants it."""
+        if self.history is not None and getattr(source, 'reports_sales', False) is True:
+            return {'with_sales': True}
+        return {}
+    
+    def _fetch_source(self, name: str, source: PriceSource, key, card_name: str,
+                      language: str, condition: str) -> Optional[Dict]:
+        """Fetch from a single source and cache the result."""
+        with timed(name, STAGE_LOOKUP):
+            result = source.fetch(card_name, language, condition,
+                                  **self._fetch_options(source))
+        self._store(name, key, result)
+        return result
+    
+    async def _fetch_source_async(self, name: str, source: PriceSource, key,
+                                  card_name: str, language: str,
+                                  condition: str) -> Optional[Dict]:
+        """Fetch from a single source asynchronously and cache the result."""
+        with timed(name, STAGE_LOOKUP):
+            result = await source.fetch_async(card_name, language, condition,
+                                              **self._fetch_options(source))
+        if self._storage_blocks():
+            # SQLite commits must not stall the event loop
+            await asyncio.to_thread(self._store, name, key, result)
+        else:
+            self._store(name, key, result)
+        return result
+    
+    def _start_lookup(self, name: str, source: PriceSource, key, card_name: str,
+                      language: str, condition: str) -> Future:
+        """Start (or join) the lookup of a query on one source."""
+        future, _ = self._inflight.run(
+            (name, key),
+            lambda: self._executor.submit(self._fetch_source, name, source, key,
+                                          card_name, language, condition))
+        return future
+    
+    def _fetch_batched(self, name: str, source: PriceSource, key, card_name: str,
+                       language: str, condition: str,
+                       on_start: Callable[[], None]) -> Optional[Dict]:
+        """
+        Run a batch lookup once one of the batch's workers picks it up.
+        
+        Queued batch work stays out of the single-flight table, so a search
+        for a card further down the batch starts its own lookup instead of
+        waiting behind the queue. Once started, the lookup joins (or
+        becomes) the shared lookup of its query.
+        """
+        on_start()
+        cached = self._cached(name, key)
+        if cached:
+            return cached['result']
+        
+        own = Future()
+        own.set_running_or_notify_cancel()
+        flight, shared = self._inflight.run((name, key), lambda: own)
+        if shared:
+            return flight.result()
+        try:
+            result = self._fetch_source(name, source, key, card_name, language, condition)
+        except BaseException as e:
+            own.set_exception(e)
+            raise
+        own.set_result(result)
+        return result
+    
+    def _fetch_all(self, card_name: str, language: str,
+                   condition: str, max_stale: float = 0) -> Dict[str, Dict]:
+        """
+        Query every enabled source concurrently.
+        
+        Sources with a fresh cached result are answered from the cache. If
+        another caller is already fetching the same query from a source, its
+        in-flight lookup is shared rather than duplicated. The rest get at
+        most ``source_timeout`` seconds and all of them together at most
+        ``deadline`` seconds. Sources that have not answered in time are
+        reported as timed out; their worker keeps running in the background
+        (and still fills the cache) but nobody waits for it.
         
         Args:
             card_name: Name of the Pokemon card to price
-            language: Language of the card (default: English)
-            condition: Condition of the card (default: Near Mint)
+            language: Language of the card
+            condition: Condition of the card
+            max_stale: Serve results expired at most this many seconds ago
+                       immediately and refresh them in the background
             
         Returns:
-            Dictionary with pricing from all sources and aggregated data
+            Dictionary mapping source name to a dict with ``status``
+            ('ok', 'no_results', 'timeout' or 'unavailable'), ``result``,
+            ``elapsed`` and, for cache hits, ``cached`` (plus ``stale`` and
+            ``age`` for stale ones)
+        """
+        key = normalize_query(card_name, language, condition)
+        self._note_access(key, card_name, language, condition)
+        start = time.monotonic()
+        outcomes = {}
+        futures = []
+        for name, source in self.sources.items():
+            outcome = self._cached_or_revalidate(name, source, key, card_name,
+                                                 language, condition, max_stale)
+            if outcome:
+                outcomes[name] = outcome
+                continue
+            outcome = self._unavailable(name)
+            if outcome:
+                outcomes[name] = outcome
+                continue
+            futures.append((name, self._start_lookup(name, source, key, card_name,
+                                                     language, condition)))
+        
+        budget = min(self.source_timeout, self.deadline)
+        for name, future in futures:
+            remaining = max(0.0, budget - (time.monotonic() - start))
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                # Drop it if still queued and nobody else shares it, so a
+                # stalled upstream does not fill the pool with dead work
+                self._inflight.abandon((name, key), future)
+                outcomes[name] = {'status': 'timeout', 'result': None,
+                                  'elapsed': round(time.monotonic() - start, 3)}
+                continue
+            outcomes[name] = {'status': 'ok' if result else 'no_results',
+                              'result': result,
+                              'elapsed': round(time.monotonic() - start, 3)}
+        
+        # Keep the configured source order regardless of which were cached
+        return {name: outcomes[name] for name in self.sources if name in outcomes}
+    
+    async def _fetch_all_async(self, card_name: str, language: str,
+                               condition: str, max_stale: float = 0) -> Dict[str, Dict]:
+        """
+        Asynchronous variant of _fetch_all() built on each source's fetch_async().
+        
+        Args:
+            card_name: Name of the Pokemon card to price
+            language: Language of the card
+            condition: Condition of the card
+            max_stale: Serve results expired at most this many seconds ago
+                       immediately and refresh them in the background
+            
+        Returns:
+            Dictionary mapping source name to an outcome dict (see _fetch_all)
+        """
+        key = normalize_query(card_name, language, condition)
+        self._note_access(key, card_name, language, condition)
+        start = time.monotonic()
+        budget = min(self.source_timeout, self.deadline)
+        
+        blocking = self._storage_blocks()
+        
+        async def run(name: str, source: PriceSource):
+            args = (name, source, key, card_name, language, condition, max_stale)
+            if blocking:
+                # A SQLite cache read must not stall the event loop
+                outcome = await asyncio.to_thread(self._cached_or_revalidate, *args)
+            else:
+                outcome = self._cached_or_revalidate(*args)
+            outcome = outcome or self._unavailable(name)
+            if outcome:
+                return name, outcome
+            task, _ = self._inflight_async.run(
+                (name, key),
+                lambda: asyncio.ensure_future(self._fetch_source_async(
+                    name, source, key, card_name, language, condition)))
+            try:
+                # Shielded so a timeout here does not cancel the lookup for
+                # other callers sharing it
+                result = await asyncio.wait_for(asyncio.shield(task), budget)
+            except asyncio.TimeoutError:
+                self._inflight_async.abandon((name, key), task)
+                return name, {'status': 'timeout', 'result': None,
+                              'elapsed': round(time.monotonic() - start, 3)}
+            return name, {'status': 'ok' if result else 'no_results',
+                          'result': result,
+                          'elapsed': round(time.monotonic() - start, 3)}
+        
+        pairs = await asyncio.gather(*(run(name, source)
+                                       for name, source in self.sources.items()))
+        return dict(pairs)
+    
+    def canonical_name(self, card_name: str) -> str:
         """
-        results = {
+        Get the name a card is searched under.
+        
+        Names matching a catalog card, exactly or misspelled, are replaced by
+        the catalog's spelling, so every way of writing a card shares one
+        cache entry and one upstream search.
+        
+        Args:
+            card_name: Name of the Pokemon card as typed
+            
+        Returns:
+            The catalog's name for the card, or card_name with whitespace
+            collapsed if there is no catalog or it does not know the card
+        """
+        if self.catalog is None:
+            return ' '.join(card_name.split())
+        match = self.catalog.match(card_name)
+        inc(CATALOG_LOOKUPS, result='miss' if match is None else
+            'exact' if match['similarity'] == 1.0 else 'fuzzy')
+        return match['query'] if match else ' '.join(card_name.split())
+    
+    def _new_results(self, card_name: str, language: str, condition: str,
+                     verbose: bool = True, canonical_name: Optional[str] = None) -> Dict:
+        """Create an empty results dictionary and emit the search.started event."""
+        if verbose and events.enabled():
+            events.emit('search.started', card_name=card_name, language=language,
+                        condition=condition, sources=list(self.sources),
+                        canonical_name=canonical_name)
+        
+        return {
             'card_name': card_name,
+            'canonical_name': canonical_name or card_name,
             'language': language,
             'condition': condition,
             'sources': [],
+            'cached': [],
+            'stale': {},
+            'timed_out': [],
+            'unavailable': [],
             'average_price': None,
             'currency': 'USD'
         }
+    
+    def _merge(self, results: Dict, outcomes: Dict[str, Dict],
+               verbose: bool = True) -> Dict:
+        """
+        Merge per-source outcomes into the results dictionary.
         
-        print(f"\n{'='*60}")
-        print(f"Searching for: {card_name}")
-        print(f"Language: {language} | Condition: {condition}")
-        print(f"{'='*60}\n")
-        
-        # Fetch from eBay
-        if self.ebay_pricer:
-            print("Fetching prices from eBay...")
-            ebay_result = self.ebay_pricer.get_average_price(card_name, language, condition)
-            if ebay_result:
-                results['sources'].append(ebay_result)
-                print(f"✓ eBay: ${ebay_result['average_price']} "
-                      f"(based on {ebay_result['sample_size']} sold items)")
+        Args:
+            results: Results dictionary from _new_results()
+            outcomes: Per-source outcomes from _fetch_all()
+            verbose: Emit a source.result event per source
+            
+        Returns:
+            The completed results dictionary
+        """
+        verbose = verbose and events.enabled()
+        for name, outcome in outcomes.items():
+            if outcome.get('stale'):
+                inc(SOURCE_LOOKUPS, source=name, status='stale')
+            elif outcome.get('cached'):
+                inc(SOURCE_LOOKUPS, source=name, status='cached')
             else:
-                print("✗ eBay: No results found")
-        else:
-            print("⚠ eBay: API credentials not configured")
-        
-        # Fetch from TCGPlayer
-        print("\nFetching prices from TCGPlayer...")
-        tcgplayer_result = self.tcgplayer_pricer.get_average_price(card_name, language, condition)
-        if tcgplayer_result:
-            results['sources'].append(tcgplayer_result)
-            print(f"✓ TCGPlayer: ${tcgplayer_result['average_price']}")
-        else:
-            print("✗ TCGPlayer: No results found")
+                inc(SOURCE_LOOKUPS, source=name, status=outcome['status'])
+            result = outcome['result']
+            if result:
+                results['sources'].append(result)
+                if outcome.get('cached'):
+                    results['cached'].append(name)
+                    if outcome.get('stale'):
+                        results['stale'][name] = outcome['age']
+            elif outcome['status'] == 'timeout':
+                results['timed_out'].append(name)
+            elif outcome['status'] == 'unavailable':
+                results['unavailable'].append(name)
+            
+            if verbose:
+                events.emit('source.result', source=name,
+                            status='ok' if result else outcome['status'],
+                            price=result['average_price'] if result else None,
+                            sample_size=result.get('sample_size') if result else None,
+                            cached=bool(outcome.get('cached')),
+                            stale_age=outcome.get('age') if outcome.get('stale') else None,
+                            elapsed=outcome['elapsed'])
         
-        # Calculate overall average
+        if verbose:
+            for name, reason in self.unconfigured_sources.items():
+                events.emit('source.unconfigured', events.WARNING, source=name, reason=reason)
+        
+        # Calculate overall average; a source disagreeing wildly with the
+        # others is rejected as an outlier once there are enough of them
         if results['sources']:
-            prices = [source['average_price'] for source in results['sources']]
-            results['average_price'] = round(sum(prices) / len(prices), 2)
+            stats = summarize((source['average_price'], source.get('sample_size', 1))
+                              for source in results['sources'])
+            results['average_price'] = stats['robust_mean']
+            results['median_price'] = stats['median']
+            results['weighted_average_price'] = stats['weighted_mean']
             results['price_range'] = {
-                'min': round(min(prices), 2),
-                'max': round(max(prices), 2)
+                'min': stats['min'],
+                'max': stats['max']
             }
         
         return results
     
+    def get_price(self, card_name: str, language: str = "English", 
+                 condition: str = "Near Mint", max_stale: float = 0) -> Dict:
+        """
+        Get pricing information from all available sources.
+        
+        Args:
+            card_name: Name of the Pokemon card to price
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Near Mint)
+            max_stale: Stale-while-revalidate bound in seconds. A cached
+                       result that expired at most this long ago is returned
+                       right away and refreshed in the background; older
+                       ones are fetched while the caller waits (default: 0,
+                       always wait)
+            
+        Returns:
+            Dictionary with pricing from all sources and aggregated data.
+            Sources that did not answer within their time budget are listed
+            under ``timed_out``; sources answered from the cache under
+            ``cached``, and those served stale under ``stale`` with the
+            age of their result in seconds. Sources whose circuit breaker
+            is open are skipped and listed under ``unavailable``. The name
+            the card was searched under is ``canonical_name``.
+        """
+        search_name = self.canonical_name(card_name)
+        results = self._new_results(card_name, language, condition,
+                                    canonical_name=search_name)
+        outcomes = self._fetch_all(search_name, language, condition, max_stale)
+        return self._merge(results, outcomes)
+    
+    def get_history(self, card_name: str, language: str = "English",
+                    condition: str = "Near Mint",
+                    days: float = DEFAULT_WINDOW_DAYS) -> Optional[Dict]:
+        """
+        Summarise recorded prices for a card without querying any source.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Near Mint)
+            days: Look-back window in days (default: 30)
+            
+        Returns:
+            Dictionary with the window, the summary of individual sales and
+            of source prices, and the trend, or None if no history store
+            is configured
+        """
+        if self.history is None:
+            return None
+        key = normalize_query(self.canonical_name(card_name), language, condition)
+        return {
+            'card_name': card_name,
+            'language': language,
+            'condition': condition,
+            'days': days,
+            'sales': self.history.summary(key, days, kind='sale'),
+            'sources': self.history.summary(key, days, kind='source'),
+            'trend': self.history.trend(key, days)
+        }
+    
+    def _outcome(self, future, start: float) -> Dict:
+        """Build the outcome dict for a finished lookup future."""
+        result = future.result()
+        return {'status': 'ok' if result else 'no_results',
+                'result': result,
+                'elapsed': round(time.monotonic() - start, 3)}
+    
+    @staticmethod
+    def _source_event(name: str, outcome: Dict) -> Dict:
+        """Build the streaming event describing one source's outcome."""
+        return {
+            'type': 'source',
+            'source': name,
+            'status': outcome['status'],
+            'result': outcome['result'],
+            'cached': outcome.get('cached', False),
+            'stale_age': outcome.get('age'),
+            'elapsed': outcome['elapsed']
+        }
+    
+    def iter_price(self, card_name: str, language: str = "English",
+                   condition: str = "Near Mint",
+                   max_stale: float = 0) -> Iterator[Dict]:
+        """
+        Price a card, yielding each source's outcome as soon as it arrives.
+        
+        Cached sources are yielded first, then the others in completion
+        order. The same time budgets as get_price() apply.
+        
+        Args:
+            card_name: Name of the Pokemon card to price
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Near Mint)
+            max_stale: See get_price()
+            
+        Yields:
+            ``{'type': 'source', 'source', 'status', 'result', 'cached',
+            'elapsed'}`` per source, then ``{'type': 'summary', 'results'}``
+            with the same dictionary get_price() would return
+        """
+        search_name = self.canonical_name(card_name)
+        key = normalize_query(search_name, language, condition)
+        self._note_access(key, search_name, language, condition)
+        start = time.monotonic()
+        outcomes = {}
+        futures = {}
+        for name, source in self.sources.items():
+            outcome = self._cached_or_revalidate(name, source, key, search_name,
+                                                 language, condition, max_stale)
+            outcome = outcome or self._unavailable(name)
+            if outcome:
+                outcomes[name] = outcome
+                yield self._source_event(name, outcome)
+                continue
+            futures[self._start_lookup(name, source, key, search_name,
+                                       language, condition)] = name
+        
+        budget = min(self.source_timeout, self.deadline)
+        try:
+            for future in as_completed(futures, timeout=max(0.0, budget - (time.monotonic() - start))):
+                name = futures[future]
+                outcomes[name] = self._outcome(future, start)
+                yield self._source_event(name, outcomes[name])
+        except FutureTimeoutError:
+            for future, name in futures.items():
+                if name not in outcomes:
+                    self._inflight.abandon((name, key), future)
+                    outcomes[name] = {'status': 'timeout', 'result': None,
+                                      'elapsed': round(time.monotonic() - start, 3)}
+                    yield self._source_event(name, outcomes[name])
+        
+        results = self._merge(
+            self._new_results(card_name, language, condition, verbose=False,
+                              canonical_name=search_name),
+            {name: outcomes[name] for name in self.sources}, verbose=False)
+        yield {'type': 'summary', 'results': results}
+    
+    def iter_prices(self, queries: Sequence[CardQuery],
+                    concurrency: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Price many cards, yielding each card as soon as all its sources are in.
+        
+        Identical queries (after canonicalization) are fetched once. Every
+        source works through the batch with at most ``concurrency`` lookups
+        in flight, so a large batch neither floods an upstream nor waits for
+        the cards one after another.
+        
+        Args:
+            queries: Card names or (card_name, language, condition) tuples
+            concurrency: Concurrent lookups per source
+                         (default: the pricer's batch_concurrency)
+            
+        Returns:
+            Iterator of ``{'type': 'card', 'index', 'results'}`` events in
+            completion order, where ``index`` is the query's position
+            
+        Raises:
+            ValueError: If a query is malformed (raised before any work starts)
+        """
+        parsed = [parse_query(query) for query in queries]
+        return self._iter_batch(parsed, concurrency or self.batch_concurrency)
+    
+    def _iter_batch(self, parsed: List[Tuple[str, str, str]],
+                    concurrency: int) -> Iterator[Dict]:
+        """Generator behind iter_prices()."""
+        searched = [(self.canonical_name(card_name), language, condition)
+                    for card_name, language, condition in parsed]
+        indexes = {}
+        for index, query in enumerate(searched):
+            indexes.setdefault(normalize_query(*query), []).append(index)
+        
+        executors = {
+            name: ThreadPoolExecutor(max_workers=concurrency,
+                                     thread_name_prefix=f'pokepricer-batch-{name}')
+            for name in self.sources
+        }
+        
+        def card_events(key, outcomes):
+            card_name, language, condition = parsed[indexes[key][0]]
+            merged = self._merge(
+                self._new_results(card_name, language, condition, verbose=False,
+                                  canonical_name=searched[indexes[key][0]][0]),
+                {name: outcomes[name] for name in self.sources}, verbose=False)
+            # Duplicates share the fetched data but keep their own spelling
+            for index in indexes[key]:
+                card_name, language, condition = parsed[index]
+                yield {'type': 'card', 'index': index,
+                       'results': dict(merged, card_name=card_name,
+                                       language=language, condition=condition)}
+        
+        # Lookups started and finished futures, in the order they happen
+        updates = queue.Queue()
+        # Lookups still awaited: future -> (key, source name)
+        lookups = {}
+        
+        def lookup_started(name, key):
+            updates.put((name, key))
+        
+        try:
+            start = time.monotonic()
+            outcomes = {key: {} for key in indexes}
+            for key, positions in indexes.items():
+                card_name, language, condition = searched[positions[0]]
+                self._note_access(key, card_name, language, condition)
+                for name, source in self.sources.items():
+                    outcome = self._cached(name, key) or self._unavailable(name)
+                    if outcome:
+                        outcomes[key][name] = outcome
+                        continue
+                    future = executors[name].submit(
+                        self._fetch_batched, name, source, key, card_name, language,
+                        condition, functools.partial(lookup_started, name, key))
+                    lookups[future] = (key, name)
+                    future.add_done_callback(updates.put)
+                if len(outcomes[key]) == len(self.sources):
+                    yield from card_events(key, outcomes[key])
+            
+            # A card's deadline runs from when its first lookup began, since
+            # the others may wait behind earlier cards for a free worker
+            remaining = len(lookups)
+            card_started = {}
+            deadlines = []
+            while remaining:
+                now = time.monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    _, key, name = heapq.heappop(deadlines)
+                    if name in outcomes[key]:
+                        continue
+                    outcomes[key][name] = {'status': 'timeout', 'result': None,
+                                           'elapsed': round(now - start, 3)}
+                    remaining -= 1
+                    if len(outcomes[key]) == len(self.sources):
+                        yield from card_events(key, outcomes[key])
+                if not remaining:
+                    break
+                try:
+                    update = updates.get(timeout=deadlines[0][0] - now if deadlines else None)
+                except queue.Empty:
+                    continue
+                if not isinstance(update, Future):
+                    name, key = update
+                    began = time.monotonic()
+                    card_started.setdefault(key, began)
+                    heapq.heappush(deadlines, (min(began + self.source_timeout,
+                                                   card_started[key] + self.deadline),
+                                               key, name))
+                    continue
+                key, name = lookups.pop(update)
+                if name in outcomes[key]:
+                    continue
+                outcomes[key][name] = self._outcome(update, start)
+                remaining -= 1
+                if len(outcomes[key]) == len(self.sources):
+                    yield from card_events(key, outcomes[key])
+        finally:
+            # Drop the queued lookups of an abandoned batch; they are the
+            # batch's own, and running ones finish and fill the cache
+            for future in lookups:
+                future.cancel()
+            for executor in executors.values():
+                executor.shutdown(wait=False)
+    
+    def get_prices(self, queries: Sequence[CardQuery],
+                   concurrency: Optional[int] = None) -> List[Dict]:
+        """
+        Price many cards at once.
+        
+        See iter_prices() for how the batch is deduplicated and scheduled.
+        
+        Args:
+            queries: Card names or (card_name, language, condition) tuples
+            concurrency: Concurrent lookups per source
+                         (default: the pricer's batch_concurrency)
+            
+        Returns:
+            List of results dictionaries (see get_price), in query order
+            
+        Raises:
+            ValueError: If a query is malformed
+        """
+        results = [None] * len(queries)
+        for event in self.iter_prices(queries, concurrency):
+            results[event['index']] = event['results']
+        return results
+    
+    async def get_price_async(self, card_name: str, language: str = "English",
+                              condition: str = "Near Mint", max_stale: float = 0) -> Dict:
+        """
+        Asynchronous variant of get_price() for use inside an event loop.
+        
+        Args:
+            card_name: Name of the Pokemon card to price
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Near Mint)
+            max_stale: Serve results expired at most this many seconds ago
+                       and refresh them in the background (default: 0)
+            
+        Returns:
+            Dictionary with pricing from all sources and aggregated data
+        """
+        search_name = self.canonical_name(card_name)
+        results = self._new_results(card_name, language, condition,
+                                    canonical_name=search_name)
+        outcomes = await self._fetch_all_async(search_name, language, condition, max_stale)
+        return self._merge(results, outcomes)
+    
+    async def aclose(self):
+        """Close the sources' async HTTP clients before the event loop ends."""
+        for source in self.sources.values():
+            close = getattr(source, 'aclose', None)
+            if close is not None:
+                await close()
+    
     def display_results(self, results: Dict):
         """
         Display pricing results in a formatted way.
@@ -116,12 +858,19 @@ class PokemonCardPricer:
             
             # Show additional details for eBay
             if source_name == 'eBay' and 'sample_size' in source:
-                print(f"{'':20} (Based on {source['sample_size']} sold items)")
+                line = f"{'':20} (Based on {source['sample_size']} sold items"
+                if 'median_price' in source:
+                    line += f", median ${source['median_price']:.2f}"
+                if source.get('price_stats', {}).get('outliers'):
+                    line += f", {source['price_stats']['outliers']} outliers ignored"
+                print(line + ")")
         
         print("-" * 60)
         
         if results['average_price']:
             print(f"\n{'OVERALL AVERAGE:':20} ${results['average_price']:>8.2f} USD")
+            if results.get('median_price') is not None:
+                print(f"{'MEDIAN:':20} ${results['median_price']:>8.2f} USD")
             if 'price_range' in results:
                 print(f"{'PRICE RANGE:':20} ${results['price_range']['min']:.2f} - "
                       f"${results['price_range']['max']:.2f}")
@@ -131,6 +880,9 @@ class PokemonCardPricer:
 
 def main():
     """Main function to run the Pokemon card pricer."""
+    # Show search progress and source errors as console lines
+    events.enable_console()
+    
     print("""
     ╔════════════════════════════════════════════════════════╗
     ║          POKEMON CARD PRICING TOOL                     ║
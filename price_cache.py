@@ -0,0 +1,462 @@
+"""
+Result cache for Pokemon card price lookups.
+Keeps recent per-source results keyed on the normalized query so repeated
+searches for popular cards skip the upstream round-trips. An optional SQLite
+backend shares the cache between worker processes and across restarts.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from card_catalog import normalize_name
+from events import WARNING, emit
+
+# Seconds a cached source result stays fresh
+DEFAULT_TTL = 300
+# Maximum number of cached source results
+DEFAULT_MAX_ENTRIES = 2048
+# Approximate memory bound for cached results (serialized bytes)
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Bytes of the SQLite file mapped into memory for reads
+DEFAULT_MMAP_SIZE = 64 * 1024 * 1024
+# Seconds past its TTL an expired result may still be served while it is
+# refreshed (0 disables stale serving)
+DEFAULT_MAX_STALE = 3600
+# Purge expired rows from the SQLite backend every this many writes
+PURGE_EVERY = 500
+
+
+def normalize_query(card_name: str, language: str = "English",
+                    condition: str = "Near Mint") -> Tuple[str, str, str]:
+    """
+    Normalize a search so equivalent queries share a cache key.
+
+    Args:
+        card_name: Name of the Pokemon card
+        language: Language of the card
+        condition: Condition of the card
+
+    Returns:
+        Tuple of (card_name, language, condition), lowercased with
+        whitespace collapsed; the card name is further normalized by
+        card_catalog.normalize_name() ("Charizard V-MAX" -> "charizard vmax")
+    """
+    return (normalize_name(card_name),) + tuple(' '.join(part.split()).lower()
+                                                for part in (language, condition))
+
+
+class PriceCache:
+    """Thread-safe TTL + LRU cache of per-source price results."""
+
+    def __init__(self, default_ttl: float = DEFAULT_TTL,
+                 ttls: Optional[Dict[str, float]] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 backend: Optional['SQLitePriceCache'] = None,
+                 max_stale: float = DEFAULT_MAX_STALE):
+        """
+        Initialize the cache.
+
+        Args:
+            default_ttl: Seconds a result stays fresh
+            ttls: Per-source TTL overrides, e.g. {'eBay': 900}
+            max_entries: Maximum number of cached results
+            max_bytes: Approximate memory bound; least recently used results
+                       are evicted once the serialized size exceeds it
+            backend: Optional persistent cache consulted on a memory miss
+                     and written through on every store
+            max_stale: Seconds past their TTL that expired results are kept
+                       for get_stale()
+        """
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.max_stale = max_stale
+
+        # (source, key) -> (value, stored_at, size), oldest first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['PriceCache']:
+        """
+        Build a cache from environment variables.
+
+        PRICE_CACHE_TTL sets the default TTL, PRICE_CACHE_TTL_<SOURCE> (e.g.
+        PRICE_CACHE_TTL_EBAY) overrides it per source, and
+        PRICE_CACHE_MAX_ENTRIES / PRICE_CACHE_MAX_BYTES bound its size.
+        PRICE_CACHE_MAX_STALE sets how long expired results are kept for
+        stale-while-revalidate serving.
+        If PRICE_CACHE_PATH is set, results are also persisted to a SQLite
+        database at that path, shared by every process using it.
+
+        Returns:
+            Configured PriceCache, or None if PRICE_CACHE_MAX_ENTRIES is 0
+        """
+        max_entries = int(os.getenv('PRICE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        if max_entries <= 0:
+            return None
+
+        ttls = {}
+        for name, value in os.environ.items():
+            if name.startswith('PRICE_CACHE_TTL_') and value:
+                ttls[name[len('PRICE_CACHE_TTL_'):].lower()] = float(value)
+
+        default_ttl = float(os.getenv('PRICE_CACHE_TTL', DEFAULT_TTL))
+        max_stale = float(os.getenv('PRICE_CACHE_MAX_STALE', DEFAULT_MAX_STALE))
+        path = os.getenv('PRICE_CACHE_PATH')
+        backend = SQLitePriceCache(path, default_ttl=default_ttl, ttls=ttls,
+                                   max_stale=max_stale) if path else None
+
+        return cls(default_ttl=default_ttl,
+                   ttls=ttls,
+                   max_entries=max_entries,
+                   max_bytes=int(os.getenv('PRICE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                   backend=backend,
+                   max_stale=max_stale)
+
+    def ttl_for(self, source: str) -> float:
+        """
+        Get the TTL that applies to a source.
+
+        Args:
+            source: Source name
+
+        Returns:
+            TTL in seconds
+        """
+        if source in self.ttls:
+            return self.ttls[source]
+        return self.ttls.get(source.lower(), self.default_ttl)
+
+    def get(self, source: str, key: Tuple) -> Optional[Dict]:
+        """
+        Look up a fresh cached result.
+
+        Cached results are shared between callers and must not be mutated.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+
+        Returns:
+            The cached result, or None on a miss or if it has expired
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((source, key))
+            if entry is not None:
+                value, stored_at, size = entry
+                if now - stored_at <= self.ttl_for(source):
+                    self._entries.move_to_end((source, key))
+                    self.hits += 1
+                    return value
+                if now - stored_at > self.ttl_for(source) + self.max_stale:
+                    del self._entries[(source, key)]
+                    self._bytes -= size
+
+        if self.backend is not None:
+            entry = self.backend.get_entry(source, key)
+            if entry is not None and now - entry[1] <= self.ttl_for(source):
+                # Promote into memory keeping the original timestamp so the
+                # result still expires when the other workers' copies do
+                self._put(source, key, entry[0], entry[1])
+                with self._lock:
+                    self.hits += 1
+                    self.backend_hits += 1
+                return entry[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_stale(self, source: str, key: Tuple,
+                  max_stale: Optional[float] = None) -> Optional[Tuple[Dict, float]]:
+        """
+        Look up an expired result that is still within the staleness bound.
+
+        Meant to be called after get() missed, to serve the old result while
+        a fresh one is fetched.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+            max_stale: Seconds past the TTL the result may be (default and
+                       upper bound: the cache's max_stale)
+
+        Returns:
+            Tuple of (result, age in seconds), or None
+        """
+        max_stale = self.max_stale if max_stale is None else min(max_stale, self.max_stale)
+        if max_stale <= 0:
+            return None
+
+        stored_at = None
+        with self._lock:
+            entry = self._entries.get((source, key))
+            if entry is not None:
+                value, stored_at = entry[0], entry[1]
+        if stored_at is None and self.backend is not None:
+            entry = self.backend.get_entry(source, key)
+            if entry is not None:
+                value, stored_at = entry
+        if stored_at is None:
+            return None
+
+        age = time.time() - stored_at
+        if age > self.ttl_for(source) + max_stale:
+            return None
+        with self._lock:
+            self.stale_hits += 1
+        return value, age
+
+    def stored_at(self, source: str, key: Tuple) -> Optional[float]:
+        """
+        Get when a result was stored, without counting a lookup.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+
+        Returns:
+            Epoch seconds the cached result was stored, fresh or not, or
+            None if nothing is cached
+        """
+        with self._lock:
+            entry = self._entries.get((source, key))
+            if entry is not None:
+                return entry[1]
+        if self.backend is not None:
+            entry = self.backend.get_entry(source, key)
+            if entry is not None:
+                return entry[1]
+        return None
+
+    def set(self, source: str, key: Tuple, value: Dict):
+        """
+        Store a result, evicting least recently used results if needed.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+            value: Source result to cache
+        """
+        stored_at = time.time()
+        self._put(source, key, value, stored_at)
+        if self.backend is not None:
+            self.backend.set(source, key, value, stored_at)
+
+    def _put(self, source: str, key: Tuple, value: Dict, stored_at: float):
+        """Insert a result into memory and enforce the size bounds."""
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop((source, key), None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._entries[(source, key)] = (value, stored_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached result, including persisted ones."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict:
+        """
+        Get cache counters.
+
+        Returns:
+            Dictionary with hits, misses, hit_ratio, backend_hits,
+            stale_hits, evictions, entries and bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'backend_hits': self.backend_hits,
+                'stale_hits': self.stale_hits,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
+
+
+class SQLitePriceCache:
+    """
+    Persistent price cache stored in a SQLite database.
+
+    The database runs in WAL mode so any number of worker processes can read
+    while one of them writes, and reads go through a memory-mapped view of
+    the file. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str, default_ttl: float = DEFAULT_TTL,
+                 ttls: Optional[Dict[str, float]] = None,
+                 mmap_size: int = DEFAULT_MMAP_SIZE,
+                 max_stale: float = 0):
+        """
+        Initialize the cache, creating the database if needed.
+
+        Args:
+            path: Path of the SQLite database file
+            default_ttl: Seconds a result stays fresh (used when purging)
+            ttls: Per-source TTL overrides
+            mmap_size: Bytes of the database file to memory-map
+            max_stale: Seconds past their TTL that rows are kept before
+                       being purged
+        """
+        self.path = path
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.mmap_size = mmap_size
+        self.max_stale = max_stale
+        self._local = threading.local()
+        self._writes = 0
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_cache (
+                source TEXT NOT NULL,
+                query_key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (source, query_key)
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode_key(key: Tuple) -> str:
+        return json.dumps(list(key))
+
+    def get_entry(self, source: str, key: Tuple) -> Optional[Tuple[Dict, float]]:
+        """
+        Read a persisted result regardless of its age.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+
+        Returns:
+            Tuple of (result, stored_at epoch seconds), or None
+        """
+        try:
+            row = self._connection().execute(
+                'SELECT value, stored_at FROM price_cache WHERE source = ? AND query_key = ?',
+                (source, self._encode_key(key))).fetchone()
+        except sqlite3.Error as e:
+            emit('cache.error', WARNING, action='reading', error=str(e))
+            return None
+
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, source: str, key: Tuple) -> Optional[Dict]:
+        """
+        Look up a fresh persisted result.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+
+        Returns:
+            The cached result, or None on a miss or if it has expired
+        """
+        entry = self.get_entry(source, key)
+        if entry is None or time.time() - entry[1] > self._ttl_for(source):
+            return None
+        return entry[0]
+
+    def set(self, source: str, key: Tuple, value: Dict, stored_at: Optional[float] = None):
+        """
+        Persist a result.
+
+        Args:
+            source: Source name
+            key: Normalized query from normalize_query()
+            value: Source result to cache
+            stored_at: Timestamp of the result (default: now)
+        """
+        conn = self._connection()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO price_cache (source, query_key, value, stored_at) '
+                'VALUES (?, ?, ?, ?)',
+                (source, self._encode_key(key), json.dumps(value, default=str),
+                 stored_at if stored_at is not None else time.time()))
+            conn.commit()
+        except sqlite3.Error as e:
+            emit('cache.error', WARNING, action='writing', error=str(e))
+            return
+
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self) -> int:
+        """
+        Delete rows older than the longest configured TTL plus max_stale.
+
+        Returns:
+            Number of rows deleted
+        """
+        max_ttl = max([self.default_ttl] + list(self.ttls.values())) + self.max_stale
+        conn = self._connection()
+        try:
+            cursor = conn.execute('DELETE FROM price_cache WHERE stored_at < ?',
+                                  (time.time() - max_ttl,))
+            conn.commit()
+        except sqlite3.Error as e:
+            emit('cache.error', WARNING, action='purging', error=str(e))
+            return 0
+        return cursor.rowcount
+
+    def clear(self):
+        """Delete every persisted result."""
+        conn = self._connection()
+        conn.execute('DELETE FROM price_cache')
+        conn.commit()
+
+    def _ttl_for(self, source: str) -> float:
+        if source in self.ttls:
+            return self.ttls[source]
+        return self.ttls.get(source.lower(), self.default_ttl)
@@ -0,0 +1,284 @@
+"""
+Price extraction engine for TCGPlayer pages.
+Prefers the structured JSON state embedded in the page. Otherwise scans the
+raw response bytes with precompiled regexes instead of building a DOM, and
+stops as soon as every price field has been found. Optional lxml, selectolax
+and BeautifulSoup backends extract the page text first for pages where the
+raw scan is not enough.
+"""
+import json
+import re
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Union
+
+PRICE_FIELDS = ('market_price', 'low_price', 'mid_price', 'high_price')
+
+# Parser backends accepted by extract_prices()
+BACKENDS = ('regex', 'lxml', 'selectolax', 'bs4')
+
+# One pass finds all four labelled prices. Between the label and the amount
+# we allow the separators the text-based patterns allowed, plus markup, so
+# '<span>Market Price:</span><span>$45.99</span>' matches on the raw bytes.
+# The leading lookahead lets the engine skip most positions with one
+# character test before trying the case-insensitive alternation.
+_LABELLED_PRICE = re.compile(
+    rb'(?=[mlhMLH])(market|low|mid|high)[_\s-]?price(?:["\s:>]|<[^<>]{0,200}>)+\$?([\d,.]+)',
+    re.IGNORECASE
+)
+# Any dollar amount, used when no labelled price is present
+_ANY_PRICE = re.compile(rb'\$([\d,.]+)')
+# Number of unlabelled prices averaged by the fallback
+_FALLBACK_SAMPLE = 5
+
+# JSON keys used for each price field by TCGPlayer's page state, its search
+# API and schema.org offers, in order of preference
+PRICE_KEYS = {
+    'market_price': ('marketPrice', 'market_price'),
+    'low_price': ('lowPrice', 'lowestPrice', 'low_price'),
+    'mid_price': ('midPrice', 'medianPrice', 'mid_price'),
+    'high_price': ('highPrice', 'highestPrice', 'high_price'),
+}
+_ALL_PRICE_KEYS = frozenset(key for keys in PRICE_KEYS.values() for key in keys)
+# Cheap check that a JSON document mentions a price key before decoding it
+_PRICE_KEY = re.compile(
+    rb'"(?:' + b'|'.join(re.escape(key.encode()) for key in sorted(_ALL_PRICE_KEYS)) + rb')"\s*:'
+)
+
+# Script blocks that hold the page's state as plain JSON
+_JSON_SCRIPT = re.compile(
+    rb'<script[^>]*\b(?:id="__NEXT_DATA__"|type="application/(?:ld\+)?json")[^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL
+)
+# Inline assignments of the page state, e.g. window.__INITIAL_STATE__ = {...};
+_STATE_ASSIGNMENT = re.compile(
+    rb'window\.__(?:INITIAL_STATE|PRELOADED_STATE|NUXT|APOLLO_STATE)__\s*=\s*(?=[{\[])'
+)
+# The same, for finding the assignments again in the decoded page
+_STATE_ASSIGNMENT_TEXT = re.compile(_STATE_ASSIGNMENT.pattern.decode())
+# Stop walking huge state trees after this many nodes
+_MAX_WALK_NODES = 50000
+
+
+def _parse_amount(raw: bytes) -> Optional[float]:
+    """Convert a matched amount like b'1,234.56' to a float."""
+    try:
+        return float(raw.replace(b',', b''))
+    except ValueError:
+        return None
+
+
+def _page_text(html: bytes, backend: str) -> bytes:
+    """Extract visible page text with one of the DOM backends."""
+    if backend == 'lxml':
+        import lxml.html
+        text = lxml.html.fromstring(html).text_content()
+    elif backend == 'selectolax':
+        from selectolax.parser import HTMLParser
+        text = HTMLParser(html).text(separator=' ')
+    elif backend == 'bs4':
+        from bs4 import BeautifulSoup
+        text = BeautifulSoup(html, 'html.parser').get_text()
+    else:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return text.encode('utf-8')
+
+
+def backend_available(backend: str) -> bool:
+    """
+    Check whether a parser backend can be used in this environment.
+
+    Args:
+        backend: One of BACKENDS
+
+    Returns:
+        True if the backend's library is installed
+    """
+    modules = {'regex': None, 'lxml': 'lxml.html',
+               'selectolax': 'selectolax.parser', 'bs4': 'bs4'}
+    if backend not in modules:
+        return False
+    if modules[backend] is None:
+        return True
+    try:
+        __import__(modules[backend])
+    except ImportError:
+        return False
+    return True
+
+
+def _to_price(value: Any) -> Optional[float]:
+    """Convert a JSON price value (number or string like '$1,234.56') to a float."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return _parse_amount(value.strip().lstrip('$').encode('ascii', 'ignore'))
+    return None
+
+
+def map_price_record(record: Dict) -> Optional[Dict]:
+    """
+    Map a JSON object with TCGPlayer-style price keys to our price fields.
+
+    Args:
+        record: Decoded JSON object, e.g. a product from the search API
+
+    Returns:
+        Dictionary with the price fields present, or None
+    """
+    prices = {}
+    for field, keys in PRICE_KEYS.items():
+        for key in keys:
+            value = _to_price(record.get(key))
+            if value is not None:
+                prices[field] = value
+                break
+    return prices or None
+
+
+def find_price_record(data: Any) -> Optional[Dict]:
+    """
+    Find the first object carrying price keys in decoded JSON.
+
+    Objects are visited breadth first so top-level product data wins over
+    deeply nested recommendations.
+
+    Args:
+        data: Decoded JSON document
+
+    Returns:
+        Mapped price fields of the first matching object, or None
+    """
+    queue = deque([data])
+    visited = 0
+    while queue and visited < _MAX_WALK_NODES:
+        node = queue.popleft()
+        visited += 1
+        if isinstance(node, dict):
+            if not _ALL_PRICE_KEYS.isdisjoint(node):
+                prices = map_price_record(node)
+                if prices:
+                    return prices
+            queue.extend(value for value in node.values() if isinstance(value, (dict, list)))
+        elif isinstance(node, list):
+            queue.extend(value for value in node if isinstance(value, (dict, list)))
+    return None
+
+
+def _decode_prices(decoder: json.JSONDecoder, text: str, start: int) -> Optional[Dict]:
+    """Decode the JSON value at text[start:] and find its price record."""
+    try:
+        state, _ = decoder.raw_decode(text, start)
+    except ValueError:
+        return None
+    return find_price_record(state)
+
+
+def extract_embedded_prices(html: Union[bytes, str]) -> Optional[Dict]:
+    """
+    Extract prices from the JSON state embedded in a TCGPlayer page.
+
+    Looks at __NEXT_DATA__ / application/json / ld+json script blocks and
+    window.__*_STATE__ assignments, decodes them and maps the first object
+    with price keys. No DOM is built.
+
+    Args:
+        html: Raw page bytes (or text)
+
+    Returns:
+        Dictionary with the price fields found, or None
+    """
+    data = html.encode('utf-8') if isinstance(html, str) else html
+    if b'<script' not in data:
+        return None
+
+    decoder = json.JSONDecoder()
+    for match in _JSON_SCRIPT.finditer(data):
+        document = match.group(1)
+        if not _PRICE_KEY.search(document):
+            continue
+        prices = _decode_prices(decoder, document.decode('utf-8', 'replace').strip(), 0)
+        if prices:
+            return prices
+
+    if not _STATE_ASSIGNMENT.search(data):
+        return None
+    # Decode the page once and parse each assigned object in place, rather
+    # than copying and decoding the rest of the page per assignment
+    text = data.decode('utf-8', 'replace')
+    for match in _STATE_ASSIGNMENT_TEXT.finditer(text):
+        prices = _decode_prices(decoder, text, match.end())
+        if prices:
+            return prices
+
+    return None
+
+
+def extract_prices(html: Union[bytes, str], backend: str = 'regex',
+                   timings: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Extract market/low/mid/high prices from a TCGPlayer page.
+
+    Prices in the page's embedded JSON state are used when present; they are
+    exact and cheap to decode. Otherwise labelled prices ("Market Price:
+    $45.99", "low_price": 40.0, ...) are collected in a single regex pass
+    that stops once all four fields are found. If no labelled price exists,
+    the first few dollar amounts on the page are summarised instead.
+
+    Args:
+        html: Raw page bytes (or text)
+        backend: 'regex' scans the raw bytes; 'lxml', 'selectolax' and 'bs4'
+                 scan the extracted page text instead
+        timings: Optional dictionary; 'html_parse' is set to the seconds
+                 spent building the DOM when a DOM backend was used
+
+    Returns:
+        Dictionary with the price fields found, or None
+    """
+    data = html.encode('utf-8') if isinstance(html, str) else html
+
+    prices = extract_embedded_prices(data)
+    if prices:
+        return prices
+
+    if backend != 'regex':
+        start = time.perf_counter()
+        data = _page_text(data, backend)
+        if timings is not None:
+            timings['html_parse'] = time.perf_counter() - start
+
+    prices = {}
+    for match in _LABELLED_PRICE.finditer(data):
+        field = match.group(1).lower().decode('ascii') + '_price'
+        if field in prices:
+            continue
+        value = _parse_amount(match.group(2))
+        if value is None:
+            continue
+        prices[field] = value
+        if len(prices) == len(PRICE_FIELDS):
+            break
+
+    if prices:
+        return prices
+
+    # If we couldn't find structured prices, try to find any price listings
+    extracted_prices = []
+    for match in _ANY_PRICE.finditer(data):
+        value = _parse_amount(match.group(1))
+        if value is None:
+            continue
+        extracted_prices.append(value)
+        if len(extracted_prices) == _FALLBACK_SAMPLE:
+            break
+
+    if not extracted_prices:
+        return None
+
+    return {
+        'market_price': sum(extracted_prices) / len(extracted_prices),
+        'low_price': min(extracted_prices),
+        'high_price': max(extracted_prices)
+    }
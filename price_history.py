@@ -0,0 +1,297 @@
+"""
+Local price history for Pokemon cards.
+Appends every fresh source price and every observed sold item to a SQLite
+database indexed on (card, time), so questions like "30-day median" or
+"price trend" are answered from local data without another upstream call.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from events import WARNING, emit
+from price_cache import DEFAULT_MMAP_SIZE
+from price_stats import percentile, summarize
+
+SECONDS_PER_DAY = 86400
+# Default look-back window for history queries (days)
+DEFAULT_WINDOW_DAYS = 30
+
+# Observation kinds
+KIND_SOURCE = 'source'  # A source's aggregated price for the card
+KIND_SALE = 'sale'      # One individual sold item
+
+
+def card_key(key: Tuple) -> str:
+    """
+    Encode a normalized query as the history's card key.
+
+    Args:
+        key: Normalized query from normalize_query()
+
+    Returns:
+        Stable string key, e.g. '["charizard", "english", "near mint"]'
+    """
+    return json.dumps(list(key))
+
+
+class PriceHistory:
+    """
+    Append-only store of observed prices in a SQLite database.
+
+    Rows are never updated; sold items carrying an item_id are recorded
+    once however often they are seen again. The database runs in WAL mode
+    with memory-mapped reads and one connection per thread, and a covering
+    index led by (card_key, observed_at) answers window queries without
+    touching the table.
+    """
+
+    def __init__(self, path: str, mmap_size: int = DEFAULT_MMAP_SIZE):
+        """
+        Initialize the store, creating the database if needed.
+
+        Args:
+            path: Path of the SQLite database file
+            mmap_size: Bytes of the database file to memory-map
+        """
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS price_history (
+                card_key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                price REAL NOT NULL,
+                currency TEXT NOT NULL,
+                observed_at REAL NOT NULL,
+                item_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS price_history_card_time
+                ON price_history (card_key, observed_at, kind, source, price);
+            CREATE UNIQUE INDEX IF NOT EXISTS price_history_item
+                ON price_history (source, item_id) WHERE item_id IS NOT NULL;
+        """)
+        conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional['PriceHistory']:
+        """
+        Build a history store from the PRICE_HISTORY_PATH environment variable.
+
+        Returns:
+            PriceHistory at that path, or None if it is not set
+        """
+        path = os.getenv('PRICE_HISTORY_PATH')
+        return cls(path) if path else None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.conn = conn
+        return conn
+
+    def record(self, key: Tuple, source: str, result: Dict,
+               observed_at: Optional[float] = None,
+               sales: Optional[List[Dict]] = None) -> int:
+        """
+        Append a source result and the sold items it carries.
+
+        Args:
+            key: Normalized query from normalize_query()
+            source: Source name
+            result: Source result with average_price and optionally items
+            observed_at: Timestamp of the observation (default: now); sold
+                         items use their own end_time when they have one
+            sales: Every sold item observed, when the result's items are
+                   only a sample of them (default: the result's items)
+
+        Returns:
+            Number of rows appended
+        """
+        if not result or result.get('average_price') is None:
+            return 0
+
+        observed_at = observed_at if observed_at is not None else time.time()
+        encoded = card_key(key)
+        currency = result.get('currency', 'USD')
+        rows = [(encoded, source, KIND_SOURCE, result['average_price'], currency,
+                 observed_at, None)]
+        for item in (sales if sales is not None else result.get('items')) or ():
+            if item.get('price') is None:
+                continue
+            rows.append((encoded, source, KIND_SALE, item['price'],
+                         item.get('currency', currency),
+                         self._timestamp(item.get('end_time'), observed_at),
+                         item.get('item_id')))
+
+        conn = self._connection()
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    'INSERT OR IGNORE INTO price_history '
+                    '(card_key, source, kind, price, currency, observed_at, item_id) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                return conn.total_changes - before
+        except sqlite3.Error as e:
+            emit('history.error', WARNING, action='writing', error=str(e))
+            return 0
+
+    @staticmethod
+    def _timestamp(value: Optional[str], default: float) -> float:
+        """Convert an ISO 8601 time like '2024-05-01T12:00:00.000Z' to epoch seconds."""
+        if not value:
+            return default
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return default
+
+    def prices(self, key: Tuple, days: Optional[float] = DEFAULT_WINDOW_DAYS,
+               source: Optional[str] = None,
+               kind: Optional[str] = None) -> List[Tuple[float, float]]:
+        """
+        Read observed prices for a card, oldest first.
+
+        Args:
+            key: Normalized query from normalize_query()
+            days: Look-back window in days; None reads the whole history
+            source: Only this source (default: all)
+            kind: Only KIND_SOURCE or KIND_SALE observations (default: both)
+
+        Returns:
+            List of (observed_at, price) tuples
+        """
+        sql = 'SELECT observed_at, price FROM price_history WHERE card_key = ?'
+        params = [card_key(key)]
+        if days is not None:
+            sql += ' AND observed_at >= ?'
+            params.append(time.time() - days * SECONDS_PER_DAY)
+        if source is not None:
+            sql += ' AND source = ?'
+            params.append(source)
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params.append(kind)
+        sql += ' ORDER BY observed_at'
+
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            emit('history.error', WARNING, action='reading', error=str(e))
+            return []
+
+    def summary(self, key: Tuple, days: Optional[float] = DEFAULT_WINDOW_DAYS,
+                source: Optional[str] = None,
+                kind: Optional[str] = None) -> Optional[Dict]:
+        """
+        Summarise a card's prices over a window.
+
+        Args:
+            key: Normalized query from normalize_query()
+            days: Look-back window in days; None covers the whole history
+            source: Only this source (default: all)
+            kind: Only KIND_SOURCE or KIND_SALE observations (default: both)
+
+        Returns:
+            PriceStats summary (median, robust_mean, percentiles, ...) plus
+            first_seen and last_seen timestamps, or None without data
+        """
+        rows = self.prices(key, days, source, kind)
+        stats = summarize(price for _, price in rows)
+        if stats is None:
+            return None
+        stats['first_seen'] = rows[0][0]
+        stats['last_seen'] = rows[-1][0]
+        return stats
+
+    def median(self, key: Tuple, days: Optional[float] = DEFAULT_WINDOW_DAYS,
+               source: Optional[str] = None,
+               kind: Optional[str] = None) -> Optional[float]:
+        """
+        Median price over a window, e.g. the 30-day median.
+
+        Args:
+            key: Normalized query from normalize_query()
+            days: Look-back window in days
+            source: Only this source (default: all)
+            kind: Only KIND_SOURCE or KIND_SALE observations (default: both)
+
+        Returns:
+            Median price, or None without data
+        """
+        stats = self.summary(key, days, source, kind)
+        return stats['median'] if stats else None
+
+    def trend(self, key: Tuple, days: float = DEFAULT_WINDOW_DAYS,
+              bucket_days: float = 1, source: Optional[str] = None,
+              kind: Optional[str] = None) -> Optional[Dict]:
+        """
+        Price trend over a window.
+
+        Observations are grouped into buckets of bucket_days; the trend is
+        the least-squares slope through the bucket medians, so a few odd
+        sales do not flip it.
+
+        Args:
+            key: Normalized query from normalize_query()
+            days: Look-back window in days
+            bucket_days: Bucket width in days
+            source: Only this source (default: all)
+            kind: Only KIND_SOURCE or KIND_SALE observations (default: both)
+
+        Returns:
+            Dictionary with points (bucket start, median, count),
+            slope_per_day, change_pct between the first and last bucket and
+            direction ('up', 'down' or 'flat'), or None without data
+        """
+        rows = self.prices(key, days, source, kind)
+        if not rows:
+            return None
+
+        width = bucket_days * SECONDS_PER_DAY
+        buckets = {}
+        for observed_at, price in rows:
+            buckets.setdefault(int(observed_at // width), []).append(price)
+
+        points = [{'start': bucket * width,
+                   'median': round(percentile(sorted(prices), 50), 2),
+                   'count': len(prices)}
+                  for bucket, prices in sorted(buckets.items())]
+
+        slope = 0.0
+        if len(points) > 1:
+            xs = [point['start'] / SECONDS_PER_DAY for point in points]
+            ys = [point['median'] for point in points]
+            mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+            var_x = sum((x - mean_x) ** 2 for x in xs)
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+        first, last = points[0]['median'], points[-1]['median']
+        change_pct = round((last - first) / first * 100, 2) if first else 0.0
+        return {
+            'points': points,
+            'slope_per_day': round(slope, 4),
+            'change_pct': change_pct,
+            'direction': 'up' if change_pct > 0 else 'down' if change_pct < 0 else 'flat'
+        }
+
+    def count(self) -> int:
+        """
+        Count recorded observations.
+
+        Returns:
+            Number of rows in the history
+        """
+        return self._connection().execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
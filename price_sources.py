@@ -0,0 +1,157 @@
+"""
+Pluggable pricing sources for the Pokemon card pricer.
+Defines the PriceSource interface and the registry PokemonCardPricer uses to
+discover which sources to query.
+"""
+import asyncio
+from typing import Callable, Dict, List, Optional, Protocol, runtime_checkable
+
+# Private result field carrying every sold item a source observed when the
+# result's own 'items' is trimmed. Only sources with reports_sales set add it,
+# and only when the pricer passes fetch(..., with_sales=True) for its price
+# history; the pricer removes it before the result is cached or returned
+SALES_FIELD = '_sales'
+
+
+@runtime_checkable
+class PriceSource(Protocol):
+    """Interface every pricing source implements."""
+
+    name: str
+
+    def fetch(self, card_name: str, language: str = "English",
+              condition: str = "Near Mint") -> Optional[Dict]:
+        """Return a price result dict (with 'source' and 'average_price') or None."""
+        ...
+
+    async def fetch_async(self, card_name: str, language: str = "English",
+                          condition: str = "Near Mint") -> Optional[Dict]:
+        """Asynchronous variant of fetch()."""
+        ...
+
+
+class BasePriceSource:
+    """
+    Mixin providing the PriceSource methods on top of get_average_price().
+
+    Sources without a native async client get a fetch_async() that runs the
+    blocking lookup on a worker thread so it never stalls the event loop.
+    """
+
+    name = ''
+    # Whether fetch() and fetch_async() accept with_sales (see SALES_FIELD)
+    reports_sales = False
+
+    def get_average_price(self, card_name: str, language: str = "English",
+                          condition: str = "Near Mint") -> Optional[Dict]:
+        raise NotImplementedError
+
+    def fetch(self, card_name: str, language: str = "English",
+              condition: str = "Near Mint") -> Optional[Dict]:
+        """
+        Fetch the price result for a card.
+
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+
+        Returns:
+            Price result dictionary, or None if nothing was found
+        """
+        return self.get_average_price(card_name, language, condition)
+
+    async def fetch_async(self, card_name: str, language: str = "English",
+                          condition: str = "Near Mint") -> Optional[Dict]:
+        """
+        Fetch the price result for a card without blocking the event loop.
+
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+
+        Returns:
+            Price result dictionary, or None if nothing was found
+        """
+        return await asyncio.to_thread(self.fetch, card_name, language, condition)
+
+    async def aclose(self):
+        """Close the source's async HTTP clients; nothing to do by default."""
+
+
+class SourceNotConfigured(Exception):
+    """Raised by a source factory when the source cannot be enabled."""
+
+
+# Source name -> factory(timeout=...) returning a PriceSource, in registration order
+_SOURCE_FACTORIES: Dict[str, Callable[..., PriceSource]] = {}
+
+
+def register_source(name: str, factory: Callable[..., PriceSource]) -> Callable[..., PriceSource]:
+    """
+    Register a pricing source.
+
+    The factory is called with a ``timeout`` keyword argument and must return
+    a PriceSource, or raise SourceNotConfigured if the source cannot be used
+    (for example because credentials are missing).
+
+    Args:
+        name: Display name of the source (e.g. "eBay")
+        factory: Callable building the source
+
+    Returns:
+        The factory, so this can be used as a decorator
+    """
+    _SOURCE_FACTORIES[name] = factory
+    return factory
+
+
+def unregister_source(name: str):
+    """
+    Remove a pricing source from the registry.
+
+    Args:
+        name: Display name of the source
+    """
+    _SOURCE_FACTORIES.pop(name, None)
+
+
+def registered_sources() -> List[str]:
+    """
+    List registered source names in registration order.
+
+    Returns:
+        List of source names
+    """
+    return list(_SOURCE_FACTORIES)
+
+
+def create_sources(names: Optional[List[str]] = None, timeout: float = 10):
+    """
+    Instantiate registered sources.
+
+    Args:
+        names: Source names to enable (default: all registered sources)
+        timeout: HTTP timeout passed to each source factory
+
+    Returns:
+        Tuple of (dict of name -> PriceSource, dict of name -> reason for
+        sources that could not be configured)
+    """
+    if names is None:
+        names = registered_sources()
+
+    sources = {}
+    unconfigured = {}
+    for name in names:
+        factory = _SOURCE_FACTORIES.get(name)
+        if factory is None:
+            unconfigured[name] = 'Unknown source'
+            continue
+        try:
+            sources[name] = factory(timeout=timeout)
+        except SourceNotConfigured as e:
+            unconfigured[name] = str(e)
+
+    return sources, unconfigured
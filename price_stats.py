@@ -0,0 +1,216 @@
+"""
+Robust statistics for sold-price samples.
+Prices are accumulated in one pass (from a list or a generator) into a
+compact float array; the summary then reports the median, a trimmed mean,
+percentiles, an IQR-filtered mean that ignores mislabeled slabs and lot
+listings, and a volume-weighted average. NumPy is used for large samples
+when it is installed.
+"""
+import math
+from array import array
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Fraction cut from each end for the trimmed mean
+DEFAULT_TRIM = 0.1
+# Tukey fence multiplier for IQR outlier rejection
+DEFAULT_IQR_K = 1.5
+# Fewer prices than this are too few to call any of them an outlier
+MIN_OUTLIER_SAMPLE = 4
+# Samples at least this large are summarised with NumPy when available
+NUMPY_MIN_SAMPLE = 512
+
+Price = Union[float, Tuple[float, float]]
+
+
+def percentile(sorted_values, q: float) -> float:
+    """
+    Percentile of already sorted values, interpolating linearly between ranks.
+
+    Matches numpy.percentile's default method.
+
+    Args:
+        sorted_values: Values in ascending order
+        q: Percentile between 0 and 100
+
+    Returns:
+        The percentile value
+    """
+    if not len(sorted_values):
+        raise ValueError("percentile of an empty sample")
+    rank = (len(sorted_values) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class PriceStats:
+    """
+    Single-pass accumulator of prices and their weights.
+
+    Count, sum, weighted sum, min and max are kept as running totals;
+    the prices themselves are stored in array('d') buffers (8 bytes each)
+    for the order statistics computed by summary().
+    """
+
+    def __init__(self, trim: float = DEFAULT_TRIM, iqr_k: float = DEFAULT_IQR_K):
+        """
+        Initialize an empty accumulator.
+
+        Args:
+            trim: Fraction cut from each end for the trimmed mean
+            iqr_k: Tukey fence multiplier; prices outside
+                   [Q1 - k*IQR, Q3 + k*IQR] are rejected as outliers
+        """
+        self.trim = trim
+        self.iqr_k = iqr_k
+        self._values = array('d')
+        self._weights = array('d')
+        self.count = 0
+        self.total = 0.0
+        self.weight_total = 0.0
+        self.weighted_total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, price: float, weight: float = 1.0):
+        """
+        Add one price.
+
+        Args:
+            price: Sale price
+            weight: Volume behind the price, e.g. quantity sold or the
+                    number of sales a source averaged over
+        """
+        price = float(price)
+        self._values.append(price)
+        self._weights.append(weight)
+        self.count += 1
+        self.total += price
+        self.weight_total += weight
+        self.weighted_total += price * weight
+        if price < self.min:
+            self.min = price
+        if price > self.max:
+            self.max = price
+
+    def extend(self, prices: Iterable[Price]) -> 'PriceStats':
+        """
+        Add prices from any iterable, including a generator.
+
+        Args:
+            prices: Prices, or (price, weight) tuples
+
+        Returns:
+            This accumulator
+        """
+        for price in prices:
+            if isinstance(price, tuple):
+                self.add(*price)
+            else:
+                self.add(price)
+        return self
+
+    @property
+    def mean(self) -> Optional[float]:
+        """Plain arithmetic mean, or None for an empty sample."""
+        return self.total / self.count if self.count else None
+
+    def summary(self) -> Optional[Dict]:
+        """
+        Summarise the sample.
+
+        Returns:
+            Dictionary with count, mean, median, trimmed_mean, robust_mean
+            (mean of the prices inside the IQR fences), weighted_mean, min,
+            max, p10/p25/p75/p90 and outliers (number of rejected prices),
+            or None for an empty sample
+        """
+        if not self.count:
+            return None
+        if np is not None and self.count >= NUMPY_MIN_SAMPLE:
+            return self._summary_numpy()
+        return self._summary_python()
+
+    def _summary_python(self) -> Dict:
+        values = sorted(self._values)
+        n = len(values)
+        q1, q3 = percentile(values, 25), percentile(values, 75)
+
+        cut = int(n * self.trim)
+        trimmed = values[cut:n - cut] if n - 2 * cut > 0 else values
+
+        if n >= MIN_OUTLIER_SAMPLE:
+            fence = self.iqr_k * (q3 - q1)
+            low, high = q1 - fence, q3 + fence
+            inliers = [v for v in values if low <= v <= high]
+        else:
+            inliers = values
+
+        return self._result(
+            median=percentile(values, 50),
+            trimmed_mean=sum(trimmed) / len(trimmed),
+            robust_mean=sum(inliers) / len(inliers),
+            percentiles=(percentile(values, 10), q1, q3, percentile(values, 90)),
+            outliers=n - len(inliers)
+        )
+
+    def _summary_numpy(self) -> Dict:
+        # Zero-copy views of the accumulated buffers
+        values = np.sort(np.frombuffer(self._values, dtype=np.float64))
+        n = len(values)
+        p10, q1, median, q3, p90 = np.percentile(values, [10, 25, 50, 75, 90])
+
+        cut = int(n * self.trim)
+        trimmed = values[cut:n - cut] if n - 2 * cut > 0 else values
+
+        fence = self.iqr_k * (q3 - q1)
+        inliers = values[(values >= q1 - fence) & (values <= q3 + fence)]
+
+        return self._result(
+            median=float(median),
+            trimmed_mean=float(trimmed.mean()),
+            robust_mean=float(inliers.mean()),
+            percentiles=(float(p10), float(q1), float(q3), float(p90)),
+            outliers=int(n - len(inliers))
+        )
+
+    def _result(self, median: float, trimmed_mean: float, robust_mean: float,
+                percentiles: Tuple[float, float, float, float], outliers: int) -> Dict:
+        p10, p25, p75, p90 = percentiles
+        weighted = self.weighted_total / self.weight_total if self.weight_total else self.mean
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 2),
+            'median': round(median, 2),
+            'trimmed_mean': round(trimmed_mean, 2),
+            'robust_mean': round(robust_mean, 2),
+            'weighted_mean': round(weighted, 2),
+            'min': round(self.min, 2),
+            'max': round(self.max, 2),
+            'p10': round(p10, 2),
+            'p25': round(p25, 2),
+            'p75': round(p75, 2),
+            'p90': round(p90, 2),
+            'outliers': outliers
+        }
+
+
+def summarize(prices: Iterable[Price], trim: float = DEFAULT_TRIM,
+              iqr_k: float = DEFAULT_IQR_K) -> Optional[Dict]:
+    """
+    Summarise prices in a single pass.
+
+    Args:
+        prices: Prices, or (price, weight) tuples; may be a generator
+        trim: Fraction cut from each end for the trimmed mean
+        iqr_k: Tukey fence multiplier for outlier rejection
+
+    Returns:
+        Summary from PriceStats.summary(), or None if there are no prices
+    """
+    return PriceStats(trim=trim, iqr_k=iqr_k).extend(prices).summary()
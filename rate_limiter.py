@@ -0,0 +1,366 @@
+"""
+Per-source rate limiting for upstream calls.
+Each source gets a token bucket bounding its sustained request rate and an
+AIMD concurrency limit that grows while the upstream is healthy and halves
+on throttling (429), server errors (5xx) and timeouts. Both are shared by
+every thread and session in the process, and record how long callers queue.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+# Sustained requests per second and burst size by source. eBay's Finding API
+# allows 5,000 calls a day; TCGPlayer throttles aggressive scrapers.
+DEFAULT_RATES = {
+    'eBay': (5000 / 86400, 100),
+    'TCGPlayer': (2.0, 5),
+}
+# Starting and maximum concurrent requests per source
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 16
+# Multiplicative decrease applied to the concurrency limit on overload
+DEFAULT_BACKOFF = 0.5
+# Status codes that mean the upstream wants us to slow down
+OVERLOAD_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised when a request would have to queue longer than its timeout."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Callers reserve a token up front, possibly driving the balance negative,
+    and then sleep outside the lock until their token has accrued, so
+    waiting callers are served in arrival order without polling.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Take one token, waiting for it if needed.
+
+        Args:
+            timeout: Longest acceptable wait in seconds (default: no limit)
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimitExceeded: If the token would arrive after the timeout
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                raise RateLimitExceeded(
+                    f"Rate limit reached; next request slot in {wait:.1f}s")
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self) -> bool:
+        """
+        Take one token only if it is available right away.
+
+        Returns:
+            True if a token was taken
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def available(self) -> float:
+        """
+        Get the current token balance.
+
+        Returns:
+            Tokens available now (negative while callers are queued)
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease).
+
+    Every successful request raises the limit by 1/limit, i.e. by one per
+    limit's worth of successes; every overloaded one multiplies it by
+    backoff. Requests beyond the limit wait for a slot.
+    """
+
+    def __init__(self, initial: int = DEFAULT_INITIAL_CONCURRENCY,
+                 min_limit: int = 1, max_limit: int = DEFAULT_MAX_CONCURRENCY,
+                 backoff: float = DEFAULT_BACKOFF):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial: Starting concurrency limit
+            min_limit: Lowest limit backoff can reach
+            max_limit: Highest limit growth can reach
+            backoff: Factor applied to the limit on overload
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Wait for a free slot.
+
+        Args:
+            timeout: Longest acceptable wait in seconds (default: no limit)
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimitExceeded: If no slot frees up within the timeout
+        """
+        start = time.monotonic()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise RateLimitExceeded(
+                    f"Concurrency limit of {int(self.limit)} reached")
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot only if one is free right away.
+
+        Returns:
+            True if a slot was taken
+        """
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        """Free a slot without adapting the limit."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def release(self, ok: bool):
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            ok: False if the request was throttled, failed with a server
+                error or timed out
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._cond.notify_all()
+
+
+class SourceLimiter:
+    """Token bucket plus AIMD concurrency for one upstream source."""
+
+    def __init__(self, name: str, rate: Optional[float] = None, burst: float = 1,
+                 concurrency: Optional[AIMDLimiter] = None):
+        """
+        Initialize the limiter.
+
+        Args:
+            name: Source name
+            rate: Sustained requests per second (default: no rate limit)
+            burst: Requests allowed back to back
+            concurrency: Adaptive concurrency limit (default: a new
+                         AIMDLimiter)
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = concurrency or AIMDLimiter()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        Wait for both a token and a concurrency slot.
+
+        Every successful acquire() must be paired with release().
+
+        Args:
+            timeout: Longest acceptable total wait in seconds
+
+        Returns:
+            Seconds spent queueing
+
+        Raises:
+            RateLimitExceeded: If the request would queue past the timeout
+        """
+        start = time.monotonic()
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire(timeout)
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+            self.concurrency.acquire(remaining)
+        except RateLimitExceeded:
+            with self._lock:
+                self.rejected += 1
+            raise
+
+        delay = time.monotonic() - start
+        with self._lock:
+            self.requests += 1
+            self.queue_delay_total += delay
+            self.queue_delay_max = max(self.queue_delay_max, delay)
+        return delay
+
+    def try_acquire(self, waited: float = 0.0) -> bool:
+        """
+        Take a token and a concurrency slot only if both are free right away.
+
+        Event-loop callers poll this instead of blocking in acquire(). A
+        successful try_acquire() must be paired with release().
+
+        Args:
+            waited: Seconds the caller has already spent polling, recorded
+                    as queue delay on success
+
+        Returns:
+            True if the request may be sent now
+        """
+        if not self.concurrency.try_acquire():
+            return False
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self.concurrency.cancel()
+            return False
+        with self._lock:
+            self.requests += 1
+            self.queue_delay_total += waited
+            self.queue_delay_max = max(self.queue_delay_max, waited)
+        return True
+
+    def cancel(self):
+        """Free the slot of a request abandoned by its caller, without adapting the limit."""
+        self.concurrency.cancel()
+
+    def reject(self):
+        """Count a request its caller gave up on after polling try_acquire()."""
+        with self._lock:
+            self.rejected += 1
+
+    def release(self, ok: bool):
+        """
+        Report the request's outcome and free its slot.
+
+        Args:
+            ok: False if the upstream was overloaded (429/5xx or timeout)
+        """
+        if not ok:
+            with self._lock:
+                self.overloaded += 1
+        self.concurrency.release(ok)
+
+    def stats(self) -> Dict:
+        """
+        Get limiter counters.
+
+        Returns:
+            Dictionary with requests, rejected, overloaded, concurrency_limit,
+            in_flight, tokens, avg_queue_delay_ms and max_queue_delay_ms
+        """
+        with self._lock:
+            requests_made = self.requests
+            return {
+                'requests': requests_made,
+                'rejected': self.rejected,
+                'overloaded': self.overloaded,
+                'concurrency_limit': int(self.concurrency.limit),
+                'in_flight': self.concurrency.in_flight,
+                'tokens': round(self.bucket.available(), 2) if self.bucket else None,
+                'avg_queue_delay_ms': round(self.queue_delay_total / requests_made * 1000, 2)
+                if requests_made else 0.0,
+                'max_queue_delay_ms': round(self.queue_delay_max * 1000, 2)
+            }
+
+
+_LIMITERS: Dict[str, SourceLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(name: str) -> SourceLimiter:
+    """
+    Get the process-wide limiter of a source, building it on first use.
+
+    RATE_LIMIT_<SOURCE> sets the sustained requests per second (0 disables
+    rate limiting), RATE_BURST_<SOURCE> the burst size and
+    MAX_CONCURRENCY_<SOURCE> the ceiling of the adaptive concurrency limit,
+    e.g. RATE_LIMIT_TCGPLAYER=2.
+
+    Args:
+        name: Source name
+
+    Returns:
+        The source's shared SourceLimiter
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(name)
+        if limiter is None:
+            suffix = name.upper()
+            rate, burst = DEFAULT_RATES.get(name, (None, 1))
+            rate = float(os.getenv(f'RATE_LIMIT_{suffix}', rate or 0)) or None
+            burst = float(os.getenv(f'RATE_BURST_{suffix}', burst))
+            max_limit = int(os.getenv(f'MAX_CONCURRENCY_{suffix}', DEFAULT_MAX_CONCURRENCY))
+            limiter = _LIMITERS[name] = SourceLimiter(
+                name, rate=rate, burst=burst,
+                concurrency=AIMDLimiter(initial=min(DEFAULT_INITIAL_CONCURRENCY, max_limit),
+                                        max_limit=max_limit))
+        return limiter
+
+
+def limiter_stats() -> Dict[str, Dict]:
+    """
+    Get the counters of every limiter built so far.
+
+    Returns:
+        Dictionary mapping source name to SourceLimiter.stats()
+    """
+    with _LIMITERS_LOCK:
+        limiters = dict(_LIMITERS)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
@@ -0,0 +1,349 @@
+"""
+Background refresh of popular cards.
+Keeps a watchlist of cards and re-fetches their prices shortly before the
+cached results expire, so searches for them are always answered from a warm
+cache. Refreshes are ordered by how often a card is searched and when its
+results expire, and every source has a calls-per-minute budget.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from events import WARNING, emit
+from price_cache import normalize_query
+
+# Refresh a result once this fraction of its TTL has passed
+DEFAULT_REFRESH_AHEAD = 0.8
+# Seconds between scheduler passes
+DEFAULT_INTERVAL = 1.0
+# Maximum number of watched cards
+DEFAULT_MAX_CARDS = 500
+# Background refreshes per source per minute
+DEFAULT_BUDGET = 6
+# eBay's Finding API allows 5,000 calls a day; leave most of it for users
+DEFAULT_BUDGETS = {'eBay': 2, 'TCGPlayer': 6}
+
+
+class RefreshBudget:
+    """Sliding-window limit of calls per minute."""
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize the budget.
+
+        Args:
+            per_minute: Calls allowed in any 60-second window
+        """
+        self.per_minute = per_minute
+        self._calls = deque()
+
+    def try_acquire(self, now: float) -> bool:
+        """
+        Spend one call if the window has room.
+
+        Args:
+            now: Current time in epoch seconds
+
+        Returns:
+            True if the call may be made
+        """
+        while self._calls and now - self._calls[0] >= 60:
+            self._calls.popleft()
+        if len(self._calls) >= self.per_minute:
+            return False
+        self._calls.append(now)
+        return True
+
+
+class RefreshScheduler:
+    """
+    Refresh-ahead scheduler for a watchlist of cards.
+
+    While a refresh runs, searches keep being served the cached result, and
+    a failed refresh leaves it in place. Refreshes go through the pricer's
+    in-flight coalescing, so a user search for the same card joins the
+    refresh instead of starting another upstream call.
+    """
+
+    def __init__(self, pricer, refresh_ahead: float = DEFAULT_REFRESH_AHEAD,
+                 budgets: Optional[Dict[str, float]] = None,
+                 interval: float = DEFAULT_INTERVAL,
+                 auto_watch: int = 0,
+                 max_cards: int = DEFAULT_MAX_CARDS):
+        """
+        Initialize the scheduler and attach it to a pricer.
+
+        Args:
+            pricer: PokemonCardPricer whose cache is kept warm; it must
+                    have a cache
+            refresh_ahead: Fraction of a result's TTL after which it is
+                           refreshed
+            budgets: Refreshes per minute by source name (default:
+                     DEFAULT_BUDGETS, DEFAULT_BUDGET for other sources)
+            interval: Seconds between scheduler passes
+            auto_watch: Watch cards automatically once they have been
+                        searched this many times (0 disables it)
+            max_cards: Maximum number of watched cards
+        """
+        if pricer.cache is None:
+            raise ValueError("RefreshScheduler needs a pricer with a cache")
+        self.pricer = pricer
+        self.refresh_ahead = refresh_ahead
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.interval = interval
+        self.auto_watch = auto_watch
+        self.max_cards = max_cards
+
+        # key -> {'query': (card_name, language, condition), 'hits', 'last_access'}
+        self._watched: Dict[Tuple, Dict] = {}
+        # Search counts of cards not watched yet, for auto_watch
+        self._access: Dict[Tuple, int] = {}
+        self._limits: Dict[str, RefreshBudget] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.refreshes = 0
+        self.deferred = 0
+
+        pricer.scheduler = self
+
+    @classmethod
+    def from_env(cls, pricer) -> Optional['RefreshScheduler']:
+        """
+        Build a scheduler from environment variables.
+
+        REFRESH_WATCHLIST lists cards separated by ';', each optionally
+        followed by '|language|condition'. REFRESH_AUTO_WATCH watches cards
+        searched that many times. REFRESH_AHEAD, REFRESH_INTERVAL and
+        REFRESH_MAX_CARDS tune the scheduler, and REFRESH_BUDGET_<SOURCE>
+        (e.g. REFRESH_BUDGET_EBAY) sets a source's refreshes per minute.
+
+        Args:
+            pricer: PokemonCardPricer to keep warm
+
+        Returns:
+            Configured scheduler, or None if nothing is to be watched or
+            the pricer has no cache
+        """
+        watchlist = [entry for entry in os.getenv('REFRESH_WATCHLIST', '').split(';')
+                     if entry.strip()]
+        auto_watch = int(os.getenv('REFRESH_AUTO_WATCH', 0))
+        if (not watchlist and auto_watch <= 0) or pricer.cache is None:
+            return None
+
+        budgets = {}
+        for name in pricer.sources:
+            value = os.getenv(f'REFRESH_BUDGET_{name.upper()}')
+            if value:
+                budgets[name] = float(value)
+
+        scheduler = cls(pricer,
+                        refresh_ahead=float(os.getenv('REFRESH_AHEAD', DEFAULT_REFRESH_AHEAD)),
+                        budgets=budgets,
+                        interval=float(os.getenv('REFRESH_INTERVAL', DEFAULT_INTERVAL)),
+                        auto_watch=auto_watch,
+                        max_cards=int(os.getenv('REFRESH_MAX_CARDS', DEFAULT_MAX_CARDS)))
+        for entry in watchlist:
+            fields = [field.strip() for field in entry.split('|')]
+            scheduler.watch(*fields[:3])
+        return scheduler
+
+    def watch(self, card_name: str, language: str = "English",
+              condition: str = "Near Mint") -> bool:
+        """
+        Add a card to the watchlist.
+
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+
+        Returns:
+            True if the card is watched, False if the watchlist is full
+        """
+        card_name = self.pricer.canonical_name(card_name)
+        key = normalize_query(card_name, language or "English", condition or "Near Mint")
+        with self._lock:
+            return self._watch(key, (card_name, language or "English",
+                                     condition or "Near Mint"))
+
+    def _watch(self, key: Tuple, query: Tuple[str, str, str], hits: int = 0) -> bool:
+        """Add a card while holding the lock."""
+        if key in self._watched:
+            return True
+        if len(self._watched) >= self.max_cards:
+            return False
+        self._watched[key] = {'query': query, 'hits': hits, 'last_access': None}
+        self._access.pop(key, None)
+        return True
+
+    def unwatch(self, card_name: str, language: str = "English",
+                condition: str = "Near Mint"):
+        """
+        Remove a card from the watchlist.
+
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+        """
+        key = normalize_query(self.pricer.canonical_name(card_name), language, condition)
+        with self._lock:
+            self._watched.pop(key, None)
+
+    def watched(self) -> List[Tuple[str, str, str]]:
+        """
+        List the watched cards.
+
+        Returns:
+            (card_name, language, condition) of every watched card
+        """
+        with self._lock:
+            return [entry['query'] for entry in self._watched.values()]
+
+    def record_access(self, key: Tuple, card_name: str, language: str, condition: str):
+        """
+        Count a search; called by the pricer for every card it prices.
+
+        Args:
+            key: Normalized query from normalize_query()
+            card_name: Name of the Pokemon card as searched
+            language: Language of the card
+            condition: Condition of the card
+        """
+        with self._lock:
+            entry = self._watched.get(key)
+            if entry is not None:
+                entry['hits'] += 1
+                entry['last_access'] = time.time()
+                return
+            if self.auto_watch <= 0:
+                return
+            hits = self._access.get(key, 0) + 1
+            if hits >= self.auto_watch and self._watch(key, (card_name, language, condition), hits):
+                return
+            # Bound the counters kept for cards that are never watched
+            if len(self._access) >= self.max_cards * 10:
+                self._access.clear()
+            self._access[key] = hits
+
+    def due(self, now: Optional[float] = None) -> List[Tuple[Tuple, str]]:
+        """
+        List the refreshes that are due, most important first.
+
+        A source result is due once refresh_ahead of its TTL has passed,
+        or right away if nothing is cached. Most searched cards come
+        first; among equally popular cards, the result expiring soonest.
+
+        Args:
+            now: Current time in epoch seconds (default: now)
+
+        Returns:
+            List of (key, source name) pairs
+        """
+        now = now if now is not None else time.time()
+        cache = self.pricer.cache
+        candidates = []
+        with self._lock:
+            watched = list(self._watched.items())
+        for key, entry in watched:
+            for name in self.pricer.sources:
+                stored_at = cache.stored_at(name, key)
+                due_at = 0.0 if stored_at is None else \
+                    stored_at + cache.ttl_for(name) * self.refresh_ahead
+                if due_at <= now:
+                    candidates.append((-entry['hits'], due_at, key, name))
+        candidates.sort(key=lambda candidate: candidate[:2])
+        return [(key, name) for _, _, key, name in candidates]
+
+    def run_once(self, now: Optional[float] = None) -> List[Tuple[Tuple, str]]:
+        """
+        Start every due refresh the source budgets allow.
+
+        Args:
+            now: Current time in epoch seconds (default: now)
+
+        Returns:
+            List of (key, source name) pairs whose refresh was started
+        """
+        now = now if now is not None else time.time()
+        started = []
+        for key, name in self.due(now):
+            with self._lock:
+                entry = self._watched.get(key)
+                if entry is None or (name, key) in self._refreshing:
+                    continue
+            source = self.pricer.sources.get(name)
+            if source is None:
+                continue
+            if not self._budget(name).try_acquire(now):
+                self.deferred += 1
+                continue
+
+            card_name, language, condition = entry['query']
+            with self._lock:
+                self._refreshing.add((name, key))
+            future = self.pricer._start_lookup(name, source, key, card_name, language, condition)
+            future.add_done_callback(lambda _, done=(name, key): self._finished(done))
+            self.refreshes += 1
+            started.append((key, name))
+        return started
+
+    def _budget(self, name: str) -> RefreshBudget:
+        """Get a source's refresh budget, creating it on first use."""
+        limit = self._limits.get(name)
+        if limit is None:
+            limit = self._limits[name] = RefreshBudget(self.budgets.get(name, DEFAULT_BUDGET))
+        return limit
+
+    def _finished(self, refresh: Tuple[str, Tuple]):
+        with self._lock:
+            self._refreshing.discard(refresh)
+
+    def start(self):
+        """Run scheduler passes every interval seconds in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='pokepricer-refresh',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop the background thread.
+
+        Args:
+            timeout: Seconds to wait for it to exit
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                emit('scheduler.error', WARNING, error=str(e))
+
+    def stats(self) -> Dict:
+        """
+        Get scheduler counters.
+
+        Returns:
+            Dictionary with watched, refreshing, refreshes and deferred
+            (refreshes postponed by a source budget) counts
+        """
+        with self._lock:
+            return {
+                'watched': len(self._watched),
+                'refreshing': len(self._refreshing),
+                'refreshes': self.refreshes,
+                'deferred': self.deferred
+            }
@@ -0,0 +1,105 @@
+"""
+Request coalescing for concurrent identical lookups.
+While a lookup for a key is in flight, later callers asking for the same key
+get the in-flight future instead of starting another upstream call.
+"""
+import threading
+from typing import Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key.
+
+    Works with anything future-like that supports add_done_callback(), so the
+    same class coalesces thread-pool futures and asyncio tasks. Callers must
+    not cancel a shared future; they should stop waiting on it instead, or
+    call abandon(), which only cancels calls nobody else joined.
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        # Reentrant because cancelling a future runs _forget() right away
+        self._lock = threading.RLock()
+        self._calls: Dict[Hashable, object] = {}
+        self._callers: Dict[Hashable, int] = {}
+        self.started = 0
+        self.shared = 0
+
+    def run(self, key: Hashable, start: Callable[[], object]) -> Tuple[object, bool]:
+        """
+        Return the in-flight future for a key, starting one if there is none.
+
+        Args:
+            key: Identity of the call, e.g. (source name, normalized query)
+            start: Zero-argument callable that starts the call and returns
+                   its future
+
+        Returns:
+            Tuple of (future, shared) where shared is True if the future was
+            started by an earlier caller
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                self._callers[key] += 1
+                return future, True
+
+            future = start()
+            self._calls[key] = future
+            self._callers[key] = 1
+            self.started += 1
+
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future, False
+
+    def _forget(self, key: Hashable, future: object):
+        """Drop a finished call so the next caller starts a fresh one."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                del self._callers[key]
+
+    def abandon(self, key: Hashable, future: object) -> bool:
+        """
+        Cancel a call its only caller no longer needs.
+
+        Thread-pool futures can only be cancelled while still queued.
+
+        Args:
+            key: Identity of the call
+            future: The future run() returned for it
+
+        Returns:
+            True if the call was cancelled; False if it is running, done or
+            shared with another caller
+        """
+        with self._lock:
+            if self._calls.get(key) is not future or self._callers[key] > 1:
+                return False
+            return future.cancel()
+
+    def in_flight(self) -> int:
+        """
+        Count calls currently in flight.
+
+        Returns:
+            Number of distinct keys being fetched
+        """
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict:
+        """
+        Get coalescing counters.
+
+        Returns:
+            Dictionary with started, shared and in_flight counts
+        """
+        with self._lock:
+            return {
+                'started': self.started,
+                'shared': self.shared,
+                'in_flight': len(self._calls)
+            }
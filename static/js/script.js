@@ -27,11 +27,12 @@ document.addEventListener('DOMContentLoaded', function() {
         hideAllSections();
         
         try {
-            // Make API request
-            const response = await fetch('/search', {
+            // Stream the search so each source is shown as soon as it answers
+            const response = await fetch('/search/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson',
                 },
                 body: JSON.stringify({
                     card_name: cardName,
@@ -40,17 +41,22 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
             });
             
-            const data = await response.json();
-            
             if (!response.ok) {
+                const data = await response.json();
                 throw new Error(data.error || 'Search failed');
             }
             
-            if (data.success) {
-                displayResults(data);
-            } else {
-                throw new Error(data.error || 'Unknown error occurred');
-            }
+            startResults({ card_name: cardName, language: language, condition: condition });
+            
+            await readEvents(response, function(event) {
+                if (event.type === 'source' && event.result) {
+                    addSourceCard(event.result);
+                } else if (event.type === 'summary') {
+                    displayResults(event.results);
+                } else if (event.type === 'error') {
+                    throw new Error(event.error || 'Unknown error occurred');
+                }
+            });
             
         } catch (error) {
             console.error('Search error:', error);
@@ -60,6 +66,34 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    async function readEvents(response, onEvent) {
+        // Parse an NDJSON response body line by line as chunks arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) {
+                    onEvent(JSON.parse(line));
+                }
+            }
+        }
+        
+        if (buffer.trim()) {
+            onEvent(JSON.parse(buffer));
+        }
+    }
+    
     function setLoading(isLoading) {
         searchBtn.disabled = isLoading;
         if (isLoading) {
@@ -83,6 +117,60 @@ document.addEventListener('DOMContentLoaded', function() {
         errorSection.classList.remove('hidden');
     }
     
+    function renderCardInfo(data) {
+        const cardInfo = document.getElementById('cardInfo');
+        cardInfo.innerHTML = `
+            <p><strong>Card:</strong> ${escapeHtml(data.card_name)}</p>
+            <p><strong>Language:</strong> ${escapeHtml(data.language)}</p>
+            <p><strong>Condition:</strong> ${escapeHtml(data.condition)}</p>
+        `;
+    }
+    
+    function startResults(query) {
+        // Show the results panel right away; sources fill in as they arrive
+        hideAllSections();
+        renderCardInfo(query);
+        
+        document.getElementById('averagePrice').innerHTML = `
+            <div class="label">Waiting for sources...</div>
+        `;
+        document.getElementById('sourceResults').innerHTML = '';
+        
+        resultsSection.classList.remove('hidden');
+    }
+    
+    function addSourceCard(source) {
+        const sourceCard = document.createElement('div');
+        sourceCard.className = 'source-card';
+        
+        let detailsHtml = '';
+        if (source.source === 'eBay' && source.sample_size) {
+            detailsHtml = `<div class="source-details">Based on ${source.sample_size} sold items</div>`;
+        } else if (source.details) {
+            const details = [];
+            if (source.details.market_price) {
+                details.push(`Market: $${source.details.market_price.toFixed(2)}`);
+            }
+            if (source.details.low_price) {
+                details.push(`Low: $${source.details.low_price.toFixed(2)}`);
+            }
+            if (source.details.high_price) {
+                details.push(`High: $${source.details.high_price.toFixed(2)}`);
+            }
+            if (details.length > 0) {
+                detailsHtml = `<div class="source-details">${details.join(' • ')}</div>`;
+            }
+        }
+        
+        sourceCard.innerHTML = `
+            <div class="source-name">${escapeHtml(source.source)}</div>
+            <div class="source-price">$${source.average_price.toFixed(2)} ${source.currency || 'USD'}</div>
+            ${detailsHtml}
+        `;
+        
+        document.getElementById('sourceResults').appendChild(sourceCard);
+    }
+    
     function displayResults(data) {
         hideAllSections();
         
@@ -93,12 +181,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Display card info
-        const cardInfo = document.getElementById('cardInfo');
-        cardInfo.innerHTML = `
-            <p><strong>Card:</strong> ${escapeHtml(data.card_name)}</p>
-            <p><strong>Language:</strong> ${escapeHtml(data.language)}</p>
-            <p><strong>Condition:</strong> ${escapeHtml(data.condition)}</p>
-        `;
+        renderCardInfo(data);
         
         // Display average price
         const averageBox = document.getElementById('averagePrice');
@@ -121,38 +204,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Display source results
         const sourceResults = document.getElementById('sourceResults');
         sourceResults.innerHTML = '';
-        
-        data.sources.forEach(source => {
-            const sourceCard = document.createElement('div');
-            sourceCard.className = 'source-card';
-            
-            let detailsHtml = '';
-            if (source.source === 'eBay' && source.sample_size) {
-                detailsHtml = `<div class="source-details">Based on ${source.sample_size} sold items</div>`;
-            } else if (source.details) {
-                const details = [];
-                if (source.details.market_price) {
-                    details.push(`Market: $${source.details.market_price.toFixed(2)}`);
-                }
-                if (source.details.low_price) {
-                    details.push(`Low: $${source.details.low_price.toFixed(2)}`);
-                }
-                if (source.details.high_price) {
-                    details.push(`High: $${source.details.high_price.toFixed(2)}`);
-                }
-                if (details.length > 0) {
-                    detailsHtml = `<div class="source-details">${details.join(' • ')}</div>`;
-                }
-            }
-            
-            sourceCard.innerHTML = `
-                <div class="source-name">${escapeHtml(source.source)}</div>
-                <div class="source-price">$${source.average_price.toFixed(2)} ${source.currency || 'USD'}</div>
-                ${detailsHtml}
-            `;
-            
-            sourceResults.appendChild(sourceCard);
-        });
+        data.sources.forEach(addSourceCard);
         
         // Show results
         resultsSection.classList.remove('hidden');
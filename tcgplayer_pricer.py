@@ -2,24 +2,156 @@
 TCGPlayer web scraper for Pokemon card pricing.
 Uses manual crawl algorithm to extract pricing data.
 """
+import asyncio
+import os
 import requests
-from bs4 import BeautifulSoup
-from typing import Optional, Dict
+from typing import Optional, Dict, Union
 import time
-import re
+from circuit_breaker import get_breaker
+from hedging import get_hedger, hedging_enabled
+from http_session import async_http_available, build_session
+from latency import STAGE_EXTRACT, STAGE_HTML, STAGE_JSON, get_histogram, timed
+from events import WARNING, emit
+from metrics import record_error
+from price_extraction import backend_available, extract_prices, find_price_record
+from rate_limiter import get_limiter
+from price_sources import BasePriceSource, register_source
 
+# Site and search API roots (TCGPLAYER_URL and TCGPLAYER_SEARCH_API_URL point
+# them elsewhere, e.g. at a stub)
+DEFAULT_BASE_URL = "https://www.tcgplayer.com"
+DEFAULT_SEARCH_API_URL = "https://mp-search-api.tcgplayer.com/v1/search/request"
 
-class TCGPlayerPricer:
+
+class TCGPlayerPricer(BasePriceSource):
     """Handles web scraping of TCGPlayer for Pokemon card prices."""
     
-    def __init__(self):
-        """Initialize TCGPlayer scraper."""
-        self.base_url = "https://www.tcgplayer.com"
+    name = 'TCGPlayer'
+    
+    def __init__(self, timeout: float = 10,
+                 session: Optional[requests.Session] = None,
+                 parser: Optional[str] = None,
+                 use_search_api: Optional[bool] = None,
+                 hedge: Optional[bool] = None,
+                 async_client: Optional['httpx.AsyncClient'] = None):
+        """
+        Initialize TCGPlayer scraper.
+        
+        Args:
+            timeout: HTTP timeout for page requests in seconds (default: 10)
+            session: HTTP session to use (default: a new pooled keep-alive
+                     session shared by all calls made through this pricer)
+            parser: Price extraction backend: 'regex' (default), 'lxml',
+                    'selectolax' or 'bs4' (default: TCGPLAYER_PARSER env var)
+            use_search_api: Query the JSON search endpoint the TCGPlayer
+                            site itself uses before falling back to the
+                            HTML page (default: TCGPLAYER_SEARCH_API env var)
+            hedge: Send a second request when a search page is slower than
+                   usual (default: HEDGE_REQUESTS env var)
+            async_client: httpx client used by fetch_async() (default: a
+                          pooled client per event loop if httpx is installed,
+                          otherwise fetch_async() runs fetch() on a thread)
+        """
+        self.base_url = os.getenv('TCGPLAYER_URL', DEFAULT_BASE_URL).rstrip('/')
         self.search_url = f"{self.base_url}/search/pokemon/product"
+        # Undocumented endpoint behind the site's search page; may change
+        self.search_api_url = os.getenv('TCGPLAYER_SEARCH_API_URL', DEFAULT_SEARCH_API_URL)
+        self.timeout = timeout
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
                          '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.session = session or build_session(headers=self.headers,
+                                                limiter=get_limiter(self.name),
+                                                breaker=get_breaker(self.name),
+                                                histogram=get_histogram(self.name))
+        
+        self.parser = parser or os.getenv('TCGPLAYER_PARSER', 'regex')
+        if not backend_available(self.parser):
+            emit('source.parser_unavailable', WARNING, source=self.name,
+                 parser=self.parser, fallback='regex')
+            self.parser = 'regex'
+        
+        if use_search_api is None:
+            use_search_api = os.getenv('TCGPLAYER_SEARCH_API', 'false').lower() == 'true'
+        self.use_search_api = use_search_api
+        
+        if hedge is None:
+            hedge = hedging_enabled()
+        self.hedger = get_hedger(self.name) if hedge else None
+        
+        self.async_client = async_client
+        self._async_clients = None
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request, hedged if hedging is enabled."""
+        if self.hedger is None:
+            return self.session.get(url, **kwargs)
+        return self.hedger.call(lambda: self.session.get(url, **kwargs))
+    
+    def _client_async(self) -> 'httpx.AsyncClient':
+        """Get the httpx client of the running event loop, loading httpx on first use."""
+        if self.async_client is not None:
+            return self.async_client
+        if self._async_clients is None:
+            from async_http import AsyncClientSlot, build_async_client
+            self._async_clients = AsyncClientSlot(
+                lambda: build_async_client(headers=self.headers,
+                                           limiter=get_limiter(self.name),
+                                           breaker=get_breaker(self.name),
+                                           histogram=get_histogram(self.name)))
+        return self._async_clients.get()
+    
+    async def aclose(self):
+        """Close the httpx client built for the running event loop, if any."""
+        if self._async_clients is not None:
+            await self._async_clients.aclose()
+    
+    def _search_api_prices(self, card_name: str, language: str) -> Optional[Dict]:
+        """
+        Look up prices through TCGPlayer's JSON search endpoint.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            
+        Returns:
+            Dictionary with prices of the best matching product, or None
+        """
+        params, payload = self._search_api_request(card_name, language)
+        
+        try:
+            response = self.session.post(
+                self.search_api_url,
+                params=params,
+                json=payload,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            with timed(self.name, STAGE_JSON):
+                data = response.json()
+            with timed(self.name, STAGE_EXTRACT):
+                return find_price_record(data.get('results', []))
+        except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+            emit('source.error', WARNING, source=self.name, operation='search API',
+                 error=str(e))
+            record_error(self.name, e)
+            return None
+    
+    @staticmethod
+    def _search_api_request(card_name: str, language: str):
+        """Build the query parameters and JSON body of a search API request."""
+        query = card_name if language.lower() == 'english' else f"{card_name} {language}"
+        payload = {
+            'algorithm': 'sales_synonym_v2',
+            'from': 0,
+            'size': 1,
+            'filters': {'term': {'productLineName': ['pokemon']}, 'range': {}, 'match': {}},
+            'context': {'cart': {}, 'shippingCountry': 'US'},
+            'settings': {'useFuzzySearch': True, 'didYouMean': {}},
+            'sort': {}
+        }
+        return {'q': query, 'isList': 'false'}, payload
     
     def search_card(self, card_name: str, language: str = "English",
                    condition: str = "Near Mint") -> Optional[Dict]:
@@ -40,94 +172,133 @@ class TCGPlayerPricer:
             'language': language
         }
         
+        # Step 0: Ask the JSON search endpoint; exact prices, no HTML at all
+        if self.use_search_api:
+            prices = self._search_api_prices(card_name, language)
+            if prices:
+                return self._format_prices(prices, condition)
+        
         try:
             # Step 1: Search for the card
-            response = requests.get(
+            response = self._get(
                 self.search_url, 
                 params=search_params,
-                headers=self.headers,
-                timeout=10
+                timeout=self.timeout
             )
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Step 2: Extract price information
+            # Step 2: Extract price information straight from the raw bytes,
+            # preferring the page's embedded JSON state over the visible text
             # TCGPlayer typically shows Market Price, Low Price, Mid Price
-            prices = self._extract_prices(soup, condition)
+            prices = self._extract_prices(response.content, condition)
             
             if prices:
-                return {
-                    'source': 'TCGPlayer',
-                    'market_price': prices.get('market_price'),
-                    'low_price': prices.get('low_price'),
-                    'mid_price': prices.get('mid_price'),
-                    'high_price': prices.get('high_price'),
-                    'currency': 'USD',
-                    'condition': condition
-                }
+                return self._format_prices(prices, condition)
             
             return None
             
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching TCGPlayer data: {e}")
+            emit('source.error', WARNING, source=self.name, error=str(e))
+            record_error(self.name, e)
             return None
     
-    def _extract_prices(self, soup: BeautifulSoup, condition: str) -> Optional[Dict]:
+    async def search_card_async(self, card_name: str, language: str = "English",
+                                condition: str = "Near Mint") -> Optional[Dict]:
+        """
+        Asynchronous variant of search_card() using the httpx client.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card (default: English)
+            condition: Condition of the card (default: Near Mint)
+            
+        Returns:
+            Dictionary with pricing information
+        """
+        import httpx
+        client = self._client_async()
+        
+        if self.use_search_api:
+            params, payload = self._search_api_request(card_name, language)
+            try:
+                response = await client.post(self.search_api_url, params=params,
+                                             json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                with timed(self.name, STAGE_JSON):
+                    data = response.json()
+                with timed(self.name, STAGE_EXTRACT):
+                    prices = find_price_record(data.get('results', []))
+            except (httpx.HTTPError, requests.exceptions.RequestException,
+                    ValueError, AttributeError) as e:
+                emit('source.error', WARNING, source=self.name, operation='search API',
+                     error=str(e))
+                record_error(self.name, e)
+                prices = None
+            if prices:
+                return self._format_prices(prices, condition)
+        
+        try:
+            response = await client.get(
+                self.search_url,
+                params={'q': card_name, 'language': language},
+                headers=self.headers,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+        except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+            emit('source.error', WARNING, source=self.name, error=str(e))
+            record_error(self.name, e)
+            return None
+        
+        # Parsing a full page takes milliseconds; keep it off the event loop
+        prices = await asyncio.to_thread(self._extract_prices, response.content, condition)
+        return self._format_prices(prices, condition) if prices else None
+    
+    @staticmethod
+    def _format_prices(prices: Dict, condition: str) -> Dict:
+        """Build the search_card() result from extracted price fields."""
+        return {
+            'source': 'TCGPlayer',
+            'market_price': prices.get('market_price'),
+            'low_price': prices.get('low_price'),
+            'mid_price': prices.get('mid_price'),
+            'high_price': prices.get('high_price'),
+            'currency': 'USD',
+            'condition': condition
+        }
+    
+    def _extract_prices(self, page: Union[bytes, str, 'BeautifulSoup'],
+                        condition: str) -> Optional[Dict]:
         """
         Extract price information from the page HTML.
         
+        Time spent building a DOM (for the lxml, selectolax and bs4 parsers,
+        or reading a BeautifulSoup object's text) is recorded as the
+        html_parse stage and the rest as the extract stage.
+        
         Args:
-            soup: BeautifulSoup object of the page
+            page: Raw page bytes/text, or an already parsed BeautifulSoup
+                  object (its text is scanned)
             condition: Card condition to look for
             
         Returns:
             Dictionary with extracted prices
         """
-        prices = {}
-        
-        # Try to find price elements (structure may vary)
-        # Look for common TCGPlayer price classes/patterns
-        price_patterns = [
-            r'market[_\s-]?price["\s:>]+\$?([\d,.]+)',
-            r'low[_\s-]?price["\s:>]+\$?([\d,.]+)',
-            r'mid[_\s-]?price["\s:>]+\$?([\d,.]+)',
-            r'high[_\s-]?price["\s:>]+\$?([\d,.]+)'
-        ]
-        
-        page_text = soup.get_text()
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, page_text, re.IGNORECASE)
-            if match:
-                price_type = pattern.split('[')[0].lower().replace('_', ' ').strip()
-                try:
-                    price_value = float(match.group(1).replace(',', ''))
-                    prices[f"{price_type.replace(' ', '_')}"] = price_value
-                except (ValueError, IndexError):
-                    continue
-        
-        # If we couldn't find structured prices, try to find any price listings
-        if not prices:
-            price_elements = soup.find_all(text=re.compile(r'\$[\d,.]+'))
-            if price_elements:
-                extracted_prices = []
-                for elem in price_elements[:5]:  # Get first 5 prices found
-                    price_match = re.search(r'\$([\d,.]+)', elem)
-                    if price_match:
-                        try:
-                            extracted_prices.append(float(price_match.group(1).replace(',', '')))
-                        except ValueError:
-                            continue
-                
-                if extracted_prices:
-                    prices = {
-                        'market_price': sum(extracted_prices) / len(extracted_prices),
-                        'low_price': min(extracted_prices),
-                        'high_price': max(extracted_prices)
-                    }
-        
-        return prices if prices else None
+        start = time.perf_counter()
+        timings = {}
+        if hasattr(page, 'get_text'):
+            page = page.get_text()
+            timings['html_parse'] = time.perf_counter() - start
+            prices = extract_prices(page)
+        else:
+            prices = extract_prices(page, self.parser, timings)
+        
+        parse = timings.get('html_parse')
+        if parse is not None:
+            get_histogram(self.name, STAGE_HTML).record(parse)
+        get_histogram(self.name, STAGE_EXTRACT).record(
+            time.perf_counter() - start - (parse or 0.0))
+        return prices
     
     def get_average_price(self, card_name: str, language: str = "English",
                          condition: str = "Near Mint") -> Optional[Dict]:
@@ -142,8 +313,31 @@ class TCGPlayerPricer:
         Returns:
             Dictionary with average price
         """
-        result = self.search_card(card_name, language, condition)
+        return self._average(self.search_card(card_name, language, condition))
+    
+    async def fetch_async(self, card_name: str, language: str = "English",
+                          condition: str = "Near Mint") -> Optional[Dict]:
+        """
+        Fetch the price result for a card on the event loop.
         
+        Uses the httpx client when there is one, and otherwise falls back
+        to running fetch() on a worker thread. Requests are not hedged.
+        
+        Args:
+            card_name: Name of the Pokemon card
+            language: Language of the card
+            condition: Condition of the card
+            
+        Returns:
+            Price result dictionary, or None if nothing was found
+        """
+        if self.async_client is None and not async_http_available():
+            return await super().fetch_async(card_name, language, condition)
+        return self._average(await self.search_card_async(card_name, language, condition))
+    
+    @staticmethod
+    def _average(result: Optional[Dict]) -> Optional[Dict]:
+        """Build the get_average_price() result from a search_card() result."""
         if result and result.get('market_price'):
             return {
                 'source': 'TCGPlayer',
@@ -168,3 +362,6 @@ class TCGPlayerPricer:
                 }
         
         return None
+
+
+register_source(TCGPlayerPricer.name, TCGPlayerPricer)
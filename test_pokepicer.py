@@ -4,10 +4,45 @@ Tests the core functionality without requiring external API calls
 """
 import unittest
 from unittest.mock import Mock, patch
+import asyncio
+import io
+import json
 import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from ebay_pricer import EbayPricer
 from tcgplayer_pricer import TCGPlayerPricer
 from pokepicer import PokemonCardPricer
+from http_session import build_session
+try:
+    import httpx
+except ImportError:  # httpx is optional
+    httpx = None
+try:
+    from starlette.testclient import TestClient
+    import asgi_app
+except ImportError:  # starlette is optional
+    asgi_app = None
+from price_stats import NUMPY_MIN_SAMPLE, PriceStats, np, percentile, summarize
+from price_extraction import extract_embedded_prices, extract_prices
+from circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from hedging import HedgeBudget, Hedger
+from latency import STAGE_HTML, STAGE_LOOKUP, LatencyHistogram, get_histogram, timed
+import events
+import metrics
+from rate_limiter import AIMDLimiter, RateLimitExceeded, SourceLimiter, TokenBucket
+from refresh_scheduler import RefreshBudget, RefreshScheduler
+from singleflight import SingleFlight
+from price_history import KIND_SALE, KIND_SOURCE, PriceHistory
+from price_cache import PriceCache, SQLitePriceCache, normalize_query
+from card_catalog import CardCatalog, normalize_name
+from price_sources import (BasePriceSource, PriceSource, register_source,
+                           registered_sources, unregister_source)
 from app import app as flask_app
 
 
@@ -31,7 +66,7 @@ class TestEbayPricer(unittest.TestCase):
         self.assertEqual(self.pricer._map_condition("Used"), "3000")
         self.assertEqual(self.pricer._map_condition("unknown"), "3000")
     
-    @patch('ebay_pricer.requests.get')
+    @patch('ebay_pricer.requests.Session.get')
     def test_search_sold_items_success(self, mock_get):
         """Test successful eBay API call."""
         # Mock response
@@ -62,7 +97,7 @@ class TestEbayPricer(unittest.TestCase):
         self.assertEqual(items[0]['title'], 'Charizard Card')
         self.assertEqual(items[0]['price'], 45.99)
     
-    @patch('ebay_pricer.requests.get')
+    @patch('ebay_pricer.requests.Session.get')
     def test_search_sold_items_no_results(self, mock_get):
         """Test eBay API call with no results."""
         mock_response = Mock()
@@ -78,7 +113,7 @@ class TestEbayPricer(unittest.TestCase):
         
         self.assertEqual(len(items), 0)
     
-    @patch('ebay_pricer.requests.get')
+    @patch('ebay_pricer.requests.Session.get')
     def test_get_average_price(self, mock_get):
         """Test average price calculation."""
         mock_response = Mock()
@@ -116,6 +151,114 @@ class TestEbayPricer(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertEqual(result['average_price'], 15.00)
         self.assertEqual(result['sample_size'], 2)
+    
+    @staticmethod
+    def _sold_page(prices, total_pages, end_time='2099-01-01T00:00:00.000Z'):
+        """Build a mocked findCompletedItems response for one page."""
+        response = Mock()
+        response.json.return_value = {
+            'findCompletedItemsResponse': [{
+                'searchResult': [{'item': [
+                    {
+                        'title': [f'Card {price}'],
+                        'sellingStatus': [{'currentPrice': [{'__value__': str(price),
+                                                             '@currencyId': 'USD'}]}],
+                        'listingInfo': [{'endTime': [end_time]}]
+                    }
+                    for price in prices
+                ]}],
+                'paginationOutput': [{'totalPages': [str(total_pages)]}]
+            }]
+        }
+        return response
+    
+    def test_paginated_sample_stops_at_sample_size(self):
+        """Test that later pages are fetched until the sample is complete."""
+        session = Mock()
+        pages = {str(page): self._sold_page([page * 10] * 4, total_pages=50)
+                 for page in range(1, 51)}
+        session.get.side_effect = lambda url, params, timeout: \
+            pages[params['paginationInput.pageNumber']]
+        pricer = EbayPricer("test_app_id", session=session, sample_size=10,
+                            entries_per_page=4, page_concurrency=2, items_kept=3)
+        
+        result = pricer.get_average_price("Test Card")
+        
+        # 4 + 4 + 2 items from pages 1-3; nothing beyond page 3 is requested
+        self.assertEqual(result['sample_size'], 10)
+        self.assertEqual(result['average_price'], 18.0)
+        self.assertEqual(len(result['items']), 3)
+        requested = {call.kwargs['params']['paginationInput.pageNumber']
+                     for call in session.get.call_args_list}
+        self.assertEqual(requested, {'1', '2', '3'})
+        self.assertEqual(session.get.call_args.kwargs['params']['paginationInput.entriesPerPage'], '4')
+    
+    def test_date_window_filters_and_stops(self):
+        """Test that sales older than max_days are skipped and end the scan."""
+        session = Mock()
+        recent = self._sold_page([10, 20], total_pages=3)
+        old = self._sold_page([99], total_pages=3, end_time='2000-01-01T00:00:00.000Z')
+        session.get.side_effect = [recent, old, recent]
+        pricer = EbayPricer("test_app_id", session=session, sample_size=100,
+                            entries_per_page=2, max_days=30, page_concurrency=1)
+        
+        items = pricer.search_sold_items("Test Card")
+        
+        self.assertEqual([item['price'] for item in items], [10.0, 20.0])
+        params = session.get.call_args_list[0].kwargs['params']
+        self.assertEqual(params['itemFilter(2).name'], 'EndTimeFrom')
+    
+    def test_average_ignores_outlier_listing(self):
+        """Test that a graded slab among raw card sales does not skew the average."""
+        session = Mock()
+        session.get.return_value = self._sold_page([10, 11, 12, 9, 10, 450], total_pages=1)
+        pricer = EbayPricer("test_app_id", session=session)
+        
+        result = pricer.get_average_price("Test Card")
+        
+        self.assertEqual(result['average_price'], 10.4)
+        self.assertEqual(result['median_price'], 10.5)
+        self.assertEqual(result['sample_size'], 6)
+        self.assertEqual(result['price_stats']['outliers'], 1)
+        self.assertEqual(result['price_stats']['max'], 450.0)
+
+
+class TestPriceStats(unittest.TestCase):
+    """Test the sold-price statistics engine."""
+    
+    def test_summary_of_generator(self):
+        """Test order statistics and outlier rejection over a generator."""
+        stats = summarize(price for price in [1, 2, 3, 4, 5, 6, 7, 8, 9, 100])
+        
+        self.assertEqual(stats['count'], 10)
+        self.assertEqual(stats['mean'], 14.5)
+        self.assertEqual(stats['median'], 5.5)
+        self.assertEqual(stats['trimmed_mean'], 5.5)
+        self.assertEqual(stats['robust_mean'], 5.0)
+        self.assertEqual(stats['outliers'], 1)
+        self.assertEqual(stats['p25'], 3.25)
+        self.assertEqual(stats['p90'], 18.1)
+    
+    def test_weighted_mean_and_small_samples(self):
+        """Test volume weighting and that tiny samples keep every price."""
+        stats = summarize([(45.0, 3), (50.0, 1)])
+        
+        self.assertEqual(stats['weighted_mean'], 46.25)
+        self.assertEqual(stats['robust_mean'], 47.5)
+        self.assertEqual(stats['outliers'], 0)
+        self.assertIsNone(summarize([]))
+    
+    def test_percentile_interpolates(self):
+        """Test linear interpolation between ranks."""
+        self.assertEqual(percentile([10.0, 20.0], 50), 15.0)
+        self.assertEqual(percentile([5.0], 90), 5.0)
+    
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_numpy_matches_python(self):
+        """Test that the NumPy path agrees with the pure Python one."""
+        stats = PriceStats().extend((i * 7) % 101 + 0.5 for i in range(NUMPY_MIN_SAMPLE))
+        
+        self.assertEqual(stats._summary_numpy(), stats._summary_python())
 
 
 class TestTCGPlayerPricer(unittest.TestCase):
@@ -130,6 +273,16 @@ class TestTCGPlayerPricer(unittest.TestCase):
         self.assertIsNotNone(self.pricer)
         self.assertEqual(self.pricer.base_url, "https://www.tcgplayer.com")
     
+    @patch.dict('os.environ', {'TCGPLAYER_URL': 'http://127.0.0.1:8765/',
+                               'TCGPLAYER_SEARCH_API_URL': 'http://127.0.0.1:8765/v1/search/request',
+                               'EBAY_FINDING_API_URL': 'http://127.0.0.1:8765/finding'})
+    def test_upstream_urls_from_env(self):
+        """Test that upstream endpoints can be pointed at a local stub."""
+        pricer = TCGPlayerPricer()
+        self.assertEqual(pricer.search_url, 'http://127.0.0.1:8765/search/pokemon/product')
+        self.assertEqual(pricer.search_api_url, 'http://127.0.0.1:8765/v1/search/request')
+        self.assertEqual(EbayPricer("test_app_id").base_url, 'http://127.0.0.1:8765/finding')
+    
     def test_extract_prices_from_patterns(self):
         """Test price extraction from HTML."""
         from bs4 import BeautifulSoup
@@ -147,6 +300,90 @@ class TestTCGPlayerPricer(unittest.TestCase):
         
         # Should extract some price information
         self.assertIsNotNone(prices)
+    
+    def test_extract_prices_from_raw_markup(self):
+        """Test that labels and amounts split across tags are matched on raw bytes."""
+        html = b"""
+        <table>
+            <tr><td>Market Price:</td><td>$45.99</td></tr>
+            <tr><td>Low Price</td><td><span>$40.00</span></td></tr>
+            <tr><td>Mid Price</td><td>$1,046.50</td></tr>
+            <tr><td>High Price</td><td>$50.00</td></tr>
+            <tr><td>Market Price:</td><td>$99.99</td></tr>
+        </table>
+        """
+        
+        prices = extract_prices(html)
+        
+        self.assertEqual(prices, {'market_price': 45.99, 'low_price': 40.00,
+                                  'mid_price': 1046.50, 'high_price': 50.00})
+    
+    def test_extract_prices_fallback_to_listed_prices(self):
+        """Test that unlabelled dollar amounts are summarised."""
+        prices = extract_prices(b'<li>$10.00</li><li>$20.00</li><li>$.</li><li>$30.00</li>')
+        
+        self.assertEqual(prices['market_price'], 20.00)
+        self.assertEqual(prices['low_price'], 10.00)
+        self.assertEqual(prices['high_price'], 30.00)
+        self.assertIsNone(extract_prices(b'<p>No prices here</p>'))
+    
+    def test_extract_prices_bs4_backend(self):
+        """Test that the BeautifulSoup backend scans the page text."""
+        prices = extract_prices(b'<div>Market Price: <b>$12.50</b></div>', backend='bs4')
+        
+        self.assertEqual(prices['market_price'], 12.50)
+    
+    def test_extract_embedded_state_preferred(self):
+        """Test that prices in the embedded JSON state win over page text."""
+        html = b"""
+        <script id="__NEXT_DATA__" type="application/json">
+        {"props": {"pageProps": {"results": [
+            {"productName": "Charizard VMAX", "marketPrice": 45.5,
+             "lowestPrice": "$40.25", "medianPrice": 44, "highestPrice": null}
+        ]}}}
+        </script>
+        <div>Market Price: $99.99</div>
+        """
+        
+        self.assertEqual(extract_prices(html), {'market_price': 45.5, 'low_price': 40.25,
+                                                'mid_price': 44.0})
+    
+    def test_extract_embedded_state_assignment(self):
+        """Test window.__INITIAL_STATE__ assignments and undecodable state."""
+        html = b'<script>window.__INITIAL_STATE__ = {"product": {"marketPrice": 7.5}};</script>'
+        self.assertEqual(extract_embedded_prices(html), {'market_price': 7.5})
+        
+        broken = b'<script>window.__NUXT__ = {"marketPrice": fn(1)};</script>'
+        self.assertIsNone(extract_embedded_prices(broken))
+    
+    def test_search_api_used_before_html(self):
+        """Test that the JSON search endpoint answers without fetching the page."""
+        pricer = TCGPlayerPricer(use_search_api=True)
+        api_response = Mock()
+        api_response.json.return_value = {'results': [{'results': [
+            {'productName': 'Pikachu V', 'marketPrice': 3.25, 'lowestPrice': 2.5}
+        ]}]}
+        
+        with patch.object(pricer.session, 'post', return_value=api_response), \
+                patch.object(pricer.session, 'get') as mock_get:
+            result = pricer.search_card("Pikachu V")
+        
+        mock_get.assert_not_called()
+        self.assertEqual(result['market_price'], 3.25)
+        self.assertEqual(result['low_price'], 2.5)
+    
+    def test_search_api_falls_back_to_html(self):
+        """Test that an empty API answer falls back to the HTML page."""
+        pricer = TCGPlayerPricer(use_search_api=True)
+        api_response = Mock()
+        api_response.json.return_value = {'results': []}
+        
+        with patch.object(pricer.session, 'post', return_value=api_response), \
+                patch.object(pricer.session, 'get') as mock_get:
+            mock_get.return_value.content = b'<p>Market Price: $8.00</p>'
+            result = pricer.search_card("Pikachu V")
+        
+        self.assertEqual(result['market_price'], 8.00)
 
 
 class TestPokemonCardPricer(unittest.TestCase):
@@ -174,7 +411,7 @@ class TestPokemonCardPricer(unittest.TestCase):
         """Test price aggregation from multiple sources."""
         # Mock eBay results
         mock_ebay_instance = Mock()
-        mock_ebay_instance.get_average_price.return_value = {
+        mock_ebay_instance.fetch.return_value = {
             'source': 'eBay',
             'average_price': 45.00,
             'currency': 'USD',
@@ -184,7 +421,7 @@ class TestPokemonCardPricer(unittest.TestCase):
         
         # Mock TCGPlayer results
         mock_tcg_instance = Mock()
-        mock_tcg_instance.get_average_price.return_value = {
+        mock_tcg_instance.fetch.return_value = {
             'source': 'TCGPlayer',
             'average_price': 50.00,
             'currency': 'USD'
@@ -202,6 +439,1161 @@ class TestPokemonCardPricer(unittest.TestCase):
         self.assertEqual(results['average_price'], 47.50)  # Average of 45 and 50
         self.assertEqual(results['price_range']['min'], 45.00)
         self.assertEqual(results['price_range']['max'], 50.00)
+    
+    def test_get_price_queries_sources_concurrently(self):
+        """Test that sources are fetched in parallel, not one after another."""
+        def slow_lookup(result):
+            def lookup(*args):
+                time.sleep(0.3)
+                return result
+            return lookup
+        
+        pricer = PokemonCardPricer(deadline=5, source_timeout=5)
+        pricer.ebay_pricer = Mock()
+        pricer.ebay_pricer.fetch.side_effect = slow_lookup({
+            'source': 'eBay', 'average_price': 10.00,
+            'currency': 'USD', 'sample_size': 1
+        })
+        pricer.tcgplayer_pricer = Mock()
+        pricer.tcgplayer_pricer.fetch.side_effect = slow_lookup({
+            'source': 'TCGPlayer', 'average_price': 20.00, 'currency': 'USD'
+        })
+        
+        start = time.monotonic()
+        results = pricer.get_price("Charizard", "English", "Near Mint")
+        elapsed = time.monotonic() - start
+        
+        self.assertEqual(len(results['sources']), 2)
+        self.assertLess(elapsed, 0.55)
+    
+    def test_get_price_marks_slow_source_as_timed_out(self):
+        """Test that a source exceeding its time budget does not block the result."""
+        def hanging_lookup(*args):
+            time.sleep(1)
+            return {'source': 'TCGPlayer', 'average_price': 20.00, 'currency': 'USD'}
+        
+        pricer = PokemonCardPricer(deadline=0.2, source_timeout=0.2)
+        pricer.ebay_pricer = Mock()
+        pricer.ebay_pricer.fetch.return_value = {
+            'source': 'eBay', 'average_price': 10.00,
+            'currency': 'USD', 'sample_size': 1
+        }
+        pricer.tcgplayer_pricer = Mock()
+        pricer.tcgplayer_pricer.fetch.side_effect = hanging_lookup
+        
+        start = time.monotonic()
+        results = pricer.get_price("Charizard", "English", "Near Mint")
+        elapsed = time.monotonic() - start
+        
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(results['timed_out'], ['TCGPlayer'])
+        self.assertEqual(len(results['sources']), 1)
+        self.assertEqual(results['average_price'], 10.00)
+    
+    def test_timed_out_queued_lookup_is_cancelled(self):
+        """Test that a lookup still queued when its search gives up never runs."""
+        def hanging_lookup(*args):
+            time.sleep(0.4)
+            return {'source': 'eBay', 'average_price': 10.00, 'currency': 'USD'}
+        
+        pricer = PokemonCardPricer(deadline=0.1, source_timeout=0.1, max_workers=1,
+                                   cache=PriceCache())
+        pricer.ebay_pricer = Mock()
+        pricer.ebay_pricer.fetch.side_effect = hanging_lookup
+        pricer.tcgplayer_pricer = Mock()
+        pricer.tcgplayer_pricer.fetch.side_effect = hanging_lookup
+        
+        results = pricer.get_price("Charizard", "English", "Near Mint")
+        time.sleep(0.5)
+        
+        self.assertEqual(sorted(results['timed_out']), ['TCGPlayer', 'eBay'])
+        self.assertEqual(pricer.ebay_pricer.fetch.call_count +
+                         pricer.tcgplayer_pricer.fetch.call_count, 1)
+        self.assertEqual(pricer._inflight.in_flight(), 0)
+    
+    def test_timed_out_async_lookup_is_cancelled(self):
+        """Test that an async lookup nobody else waits for is cancelled on timeout."""
+        cancelled = []
+        
+        class HangingSource(FixedPriceSource):
+            async def fetch_async(self, *args):
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+        
+        pricer = PokemonCardPricer(deadline=0.1, source_timeout=0.1, sources=[],
+                                   cache=PriceCache())
+        pricer._set_source('Fixed', HangingSource())
+        
+        async def price():
+            results = await pricer.get_price_async("Charizard")
+            await asyncio.sleep(0.01)
+            # Checked before asyncio.run() cancels whatever is left
+            return results, list(cancelled)
+        
+        results, cancelled_in_time = asyncio.run(price())
+        
+        self.assertEqual(results['timed_out'], ['Fixed'])
+        self.assertEqual(cancelled_in_time, [True])
+
+
+class TestHTTPSession(unittest.TestCase):
+    """Test pooled HTTP session construction."""
+    
+    def test_build_session_pool_and_retries(self):
+        """Test that sessions get a sized keep-alive pool with retries."""
+        session = build_session(pool_size=4, max_retries=3, backoff_factor=0.1,
+                                headers={'User-Agent': 'test'})
+        adapter = session.get_adapter('https://svcs.ebay.com')
+        
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertEqual(session.headers['User-Agent'], 'test')
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+    
+    def test_retry_after_is_capped(self):
+        """Test that a long Retry-After cannot hold a thread past the source timeout."""
+        from urllib3 import HTTPResponse
+        from http_session import MAX_RETRY_AFTER
+        retry = build_session().get_adapter('https://svcs.ebay.com').max_retries
+        response = HTTPResponse(status=429, headers={'Retry-After': '3600'})
+        
+        self.assertEqual(retry.get_retry_after(response), MAX_RETRY_AFTER)
+        self.assertEqual(retry.increment('GET', '/', response).get_retry_after(response),
+                         MAX_RETRY_AFTER)
+    
+    def test_limited_session_does_not_retry_answers(self):
+        """Test that a limiter-guarded session only retries connection errors."""
+        session = build_session(max_retries=3, limiter=SourceLimiter('test'))
+        retry = session.get_adapter('https://svcs.ebay.com').max_retries
+        
+        self.assertEqual(retry.connect, 3)
+        self.assertFalse(retry.is_retry('GET', 429, has_retry_after=True))
+        self.assertFalse(retry.is_retry('GET', 503))
+    
+    def test_pricers_reuse_one_session(self):
+        """Test that every lookup goes through the pricer's own session."""
+        pricer = TCGPlayerPricer()
+        
+        with patch.object(pricer.session, 'get') as mock_get:
+            mock_get.return_value.content = b'<div>Market Price: $12.00</div>'
+            pricer.search_card("Pikachu")
+            pricer.search_card("Mewtwo")
+        
+        self.assertEqual(mock_get.call_count, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test per-source token buckets and adaptive concurrency."""
+    
+    def test_token_bucket_paces_requests(self):
+        """Test that requests beyond the burst wait for tokens."""
+        bucket = TokenBucket(rate=50, burst=2)
+        
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        start = time.monotonic()
+        waited = bucket.acquire()
+        
+        self.assertAlmostEqual(waited, 0.02, delta=0.005)
+        self.assertGreaterEqual(time.monotonic() - start, 0.015)
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire(timeout=0.001)
+    
+    def test_aimd_backs_off_and_recovers(self):
+        """Test multiplicative decrease on overload and additive increase after."""
+        limiter = AIMDLimiter(initial=8, max_limit=8)
+        
+        limiter.acquire()
+        limiter.release(ok=False)
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(ok=True)
+        self.assertAlmostEqual(limiter.limit, 4.92, places=2)
+        
+        for _ in range(4):
+            limiter.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire(timeout=0.01)
+    
+    def test_session_reports_throttling_to_limiter(self):
+        """Test that a 429 halves the source's concurrency and delay is reported."""
+        limiter = SourceLimiter('test', rate=100, burst=10,
+                                concurrency=AIMDLimiter(initial=4))
+        session = build_session(max_retries=0, limiter=limiter)
+        throttled = requests.Response()
+        throttled.status_code = 429
+        
+        with patch('requests.adapters.HTTPAdapter.send', return_value=throttled):
+            response = session.get('https://example.invalid/search', timeout=5)
+        
+        self.assertLess(response.queue_delay, 0.05)
+        stats = limiter.stats()
+        self.assertEqual(stats['concurrency_limit'], 2)
+        self.assertEqual(stats['overloaded'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test per-source circuit breakers."""
+    
+    def setUp(self):
+        """Set up a breaker driven by a fake clock."""
+        self.now = 0.0
+        self.breaker = CircuitBreaker('test', failure_rate=0.5, slow_call_seconds=1,
+                                      window=4, min_calls=4, open_seconds=30,
+                                      clock=lambda: self.now)
+    
+    def test_trips_on_failures_and_slow_calls(self):
+        """Test that errors and slow calls together trip the breaker."""
+        for ok, elapsed in ((True, 0.1), (False, 0.1), (True, 0.2)):
+            self.breaker.allow()
+            self.breaker.record(ok, elapsed)
+        self.assertEqual(self.breaker.state, 'closed')
+        
+        self.breaker.allow()
+        self.breaker.record(True, 5.0)  # slow
+        
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.available())
+        self.assertFalse(self.breaker.allow())
+    
+    def test_half_open_probe_closes_or_reopens(self):
+        """Test that one probe is let through after the cool-down."""
+        for _ in range(4):
+            self.breaker.allow()
+            self.breaker.record(False)
+        self.now = 31
+        
+        self.assertEqual(self.breaker.state, 'half_open')
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, 'open')
+        
+        self.now = 62
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, 'closed')
+    
+    def test_session_fails_fast_while_open(self):
+        """Test that an open breaker stops requests before they are sent."""
+        for _ in range(4):
+            self.breaker.record(False)
+        session = build_session(breaker=self.breaker)
+        
+        with patch('requests.adapters.HTTPAdapter.send') as mock_send:
+            with self.assertRaises(CircuitOpenError):
+                session.get('https://example.invalid/search', timeout=5)
+        mock_send.assert_not_called()
+    
+    def test_pricer_skips_tripped_source(self):
+        """Test that get_price() reports a tripped source as unavailable."""
+        source = Mock()
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(max_entries=0))
+        pricer._set_source('Flaky', source)
+        breaker = get_breaker('Flaky')
+        for _ in range(breaker.min_calls):
+            breaker.record(False)
+        
+        results = pricer.get_price("Pikachu")
+        
+        source.fetch.assert_not_called()
+        self.assertEqual(results['unavailable'], ['Flaky'])
+
+
+class TestHedging(unittest.TestCase):
+    """Test latency histograms and hedged requests."""
+    
+    def setUp(self):
+        """Set up a histogram where 95% of requests take about 10ms."""
+        self.histogram = LatencyHistogram()
+        for _ in range(19):
+            self.histogram.record(0.005)
+        self.histogram.record(0.01)
+    
+    def test_histogram_percentiles(self):
+        """Test that percentiles are within one bucket of the true value."""
+        self.assertAlmostEqual(self.histogram.percentile(50), 0.005, delta=0.0005)
+        self.assertAlmostEqual(self.histogram.percentile(99), 0.01, delta=0.001)
+        self.assertIsNone(LatencyHistogram().percentile(95))
+    
+    def test_histogram_forgets_old_windows(self):
+        """Test that latencies age out after two windows."""
+        now = [0.0]
+        histogram = LatencyHistogram(window_seconds=60, clock=lambda: now[0])
+        histogram.record(2.0)
+        now[0] = 90
+        histogram.record(0.1)
+        self.assertEqual(histogram.recent_count(), 2)
+        now[0] = 150
+        self.assertEqual(histogram.recent_count(), 1)
+        self.assertEqual(histogram.count, 2)
+    
+    def test_slow_request_is_hedged(self):
+        """Test that a second attempt wins when the first one stalls."""
+        budget = HedgeBudget(ratio=1.0)
+        hedger = Hedger('test', self.histogram, percentile=95, budget=budget,
+                        min_samples=10, min_delay=0.01)
+        release = threading.Event()
+        attempts = []
+        
+        def attempt():
+            attempts.append(1)
+            if len(attempts) == 1:
+                release.wait(5)
+                return 'slow'
+            return 'fast'
+        
+        try:
+            self.assertEqual(hedger.call(attempt), 'fast')
+        finally:
+            release.set()
+        self.assertEqual(hedger.stats()['hedged'], 1)
+        self.assertEqual(hedger.stats()['hedge_wins'], 1)
+    
+    def test_budget_limits_hedges(self):
+        """Test that no hedge is sent once the budget is spent."""
+        hedger = Hedger('test', self.histogram, budget=HedgeBudget(ratio=0.1),
+                        min_samples=10, min_delay=0.01)
+        attempt = Mock(side_effect=lambda: time.sleep(0.05) or 'ok')
+        
+        self.assertEqual(hedger.call(attempt), 'ok')
+        self.assertEqual(attempt.call_count, 1)
+        self.assertEqual(hedger.stats()['hedged'], 0)
+    
+    def test_no_hedging_without_samples(self):
+        """Test that requests run inline until enough latencies are known."""
+        hedger = Hedger('test', LatencyHistogram(), min_samples=10)
+        attempt = Mock(return_value='ok')
+        
+        self.assertEqual(hedger.call(attempt), 'ok')
+        self.assertIsNone(hedger.stats()['delay_ms'])
+    
+    def test_failed_attempt_falls_back_to_other(self):
+        """Test that an error from one attempt does not lose the other's result."""
+        hedger = Hedger('test', self.histogram, budget=HedgeBudget(ratio=1.0),
+                        min_samples=10, min_delay=0.01)
+        calls = []
+        
+        def attempt():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.05)
+                return 'slow but fine'
+            raise requests.exceptions.ConnectionError('reset')
+        
+        self.assertEqual(hedger.call(attempt), 'slow but fine')
+    
+    def test_ebay_pages_use_hedger(self):
+        """Test that eBay page requests go through the hedger."""
+        hedger = Mock()
+        hedger.call.return_value = Mock(json=Mock(return_value={}),
+                                        raise_for_status=Mock())
+        pricer = EbayPricer("test_app_id", hedge=False)
+        pricer.hedger = hedger
+        
+        pricer.search_sold_items("Pikachu")
+        
+        hedger.call.assert_called_once()
+    
+    def test_session_records_latency(self):
+        """Test that the source adapter feeds the latency histogram."""
+        histogram = LatencyHistogram()
+        session = build_session(histogram=histogram)
+        response = requests.Response()
+        response.status_code = 200
+        
+        with patch('requests.adapters.HTTPAdapter.send', return_value=response):
+            session.get('https://example.invalid/search', timeout=5)
+        
+        self.assertEqual(histogram.count, 1)
+
+
+class TestMetrics(unittest.TestCase):
+    """Test per-stage latency histograms and the Prometheus exposition."""
+    
+    def test_cumulative_buckets(self):
+        """Test that exported buckets are cumulative and end with +Inf."""
+        histogram = LatencyHistogram()
+        for seconds in (0.002, 0.02, 0.02, 60):
+            histogram.record(seconds)
+        
+        buckets = dict(histogram.cumulative_buckets())
+        self.assertEqual(buckets[0.001], 0)
+        self.assertEqual(buckets[0.0025], 1)
+        self.assertEqual(buckets[0.025], 3)
+        self.assertEqual(buckets[30.0], 3)
+        self.assertEqual(buckets[float('inf')], 4)
+    
+    def test_timed_records_stage(self):
+        """Test that timed() feeds the source's stage histogram."""
+        histogram = get_histogram('metrics-timed', STAGE_HTML)
+        before = histogram.count
+        
+        with timed('metrics-timed', STAGE_HTML):
+            pass
+        
+        self.assertEqual(histogram.count, before + 1)
+        self.assertIsNot(histogram, get_histogram('metrics-timed'))
+    
+    def test_extract_prices_reports_parse_time(self):
+        """Test that DOM backends report their parse time."""
+        timings = {}
+        extract_prices(b'<div>Market Price: <b>$12.50</b></div>', backend='bs4',
+                       timings=timings)
+        self.assertGreater(timings['html_parse'], 0)
+        
+        timings = {}
+        extract_prices(b'<div>Market Price: $12.50</div>', timings=timings)
+        self.assertNotIn('html_parse', timings)
+    
+    def test_render_after_search(self):
+        """Test that a search shows up in lookup, outcome and cache metrics."""
+        source = Mock()
+        source.fetch.return_value = {'source': 'MetricsSource', 'average_price': 10.0}
+        pricer = PokemonCardPricer(cache=PriceCache(), history=None)
+        pricer.sources = {'MetricsSource': source}
+        lookups = get_histogram('MetricsSource', STAGE_LOOKUP).count
+        
+        pricer.get_price("Pikachu", max_stale=0)
+        pricer.get_price("Pikachu", max_stale=0)
+        body = metrics.render(pricer)
+        
+        self.assertEqual(get_histogram('MetricsSource', STAGE_LOOKUP).count, lookups + 1)
+        self.assertIn('# TYPE pokepricer_stage_seconds histogram', body)
+        self.assertIn('pokepricer_stage_seconds_bucket{source="MetricsSource",'
+                      'stage="lookup",le="+Inf"}', body)
+        self.assertIn('pokepricer_source_lookups_total{source="MetricsSource",status="ok"}', body)
+        self.assertIn('pokepricer_source_lookups_total{source="MetricsSource",status="cached"}', body)
+        self.assertIn('pokepricer_cache_hits_total 1', body)
+        self.assertIn('pokepricer_cache_hit_ratio 0.5', body)
+        self.assertIn('pokepricer_lookups_in_flight 0', body)
+    
+    def test_record_error_kinds(self):
+        """Test that decode errors are told apart from request errors."""
+        metrics.record_error('metrics-errors', ValueError('bad json'))
+        metrics.record_error('metrics-errors', requests.exceptions.ConnectionError('reset'))
+        
+        series = metrics.counters()[metrics.SOURCE_ERRORS]
+        self.assertEqual(series[(('kind', 'decode'), ('source', 'metrics-errors'))], 1)
+        self.assertEqual(series[(('kind', 'request'), ('source', 'metrics-errors'))], 1)
+    
+    def test_label_values_are_escaped(self):
+        """Test that quotes in label values cannot break the exposition."""
+        metrics.inc('pokepricer_test_total', source='say "hi"\\n')
+        self.assertIn('pokepricer_test_total{source="say \\"hi\\"\\\\n"} 1',
+                      metrics.render())
+
+
+class TestEvents(unittest.TestCase):
+    """Test the structured event layer."""
+    
+    def setUp(self):
+        """Set up a pricer with one answering and one empty source."""
+        self.pricer = PokemonCardPricer(cache=PriceCache(), history=None)
+        ebay = Mock()
+        ebay.fetch.return_value = {'source': 'eBay', 'average_price': 12.5, 'sample_size': 4}
+        tcg = Mock()
+        tcg.fetch.return_value = None
+        self.pricer.sources = {'eBay': ebay, 'TCGPlayer': tcg}
+        self.pricer.unconfigured_sources = {}
+    
+    def tearDown(self):
+        """Leave events disabled for the other tests."""
+        events.disable()
+    
+    def test_disabled_by_default(self):
+        """Test that nothing is recorded until events are enabled."""
+        self.assertFalse(events.enabled(events.WARNING))
+        with patch.object(events.logger, 'log') as log:
+            self.pricer.get_price("Pikachu")
+        log.assert_not_called()
+    
+    def test_console_renderer(self):
+        """Test that the console renderer prints the familiar progress lines."""
+        stream = io.StringIO()
+        events.enable(stream=stream, fmt='console', queued=False)
+        
+        self.pricer.get_price("Pikachu")
+        self.pricer.get_price("Pikachu")
+        output = stream.getvalue()
+        
+        self.assertIn("Searching for: Pikachu", output)
+        self.assertIn("Fetching prices from eBay and TCGPlayer...", output)
+        self.assertIn("✓ eBay: $12.5 (based on 4 sold items)\n", output)
+        self.assertIn("✓ eBay: $12.5 (based on 4 sold items) [cached]", output)
+        self.assertIn("✗ TCGPlayer: No results found", output)
+    
+    def test_queued_json_events(self):
+        """Test that queued events are written as JSON lines by the listener."""
+        stream = io.StringIO()
+        events.enable(stream=stream)
+        
+        self.pricer.get_price("Pikachu")
+        events.disable()
+        
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(records[0]['event'], 'search.started')
+        self.assertEqual([(r['source'], r['status']) for r in records[1:]],
+                         [('eBay', 'ok'), ('TCGPlayer', 'no_results')])
+    
+    def test_level_filters_progress(self):
+        """Test that a WARNING level keeps errors and drops progress events."""
+        stream = io.StringIO()
+        events.enable(events.WARNING, stream=stream, queued=False)
+        
+        self.pricer.get_price("Pikachu")
+        events.emit('cache.error', events.WARNING, action='reading', error='disk I/O error')
+        
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['event'] for r in records], ['cache.error'])
+    
+    @patch.dict('os.environ', {'LOG_LEVEL': 'off'})
+    def test_configure_from_env_off(self):
+        """Test that LOG_LEVEL=off keeps events disabled."""
+        events.configure_from_env()
+        self.assertFalse(events.enabled(events.WARNING))
+
+
+class TestPriceCache(unittest.TestCase):
+    """Test the TTL + LRU price cache."""
+    
+    def test_normalize_query(self):
+        """Test that equivalent queries share a key."""
+        self.assertEqual(normalize_query(" Charizard  VMAX ", "english", "Near Mint"),
+                         normalize_query("charizard vmax", "English", "near  mint"))
+    
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted."""
+        cache = PriceCache()
+        key = normalize_query("Pikachu V")
+        
+        self.assertIsNone(cache.get('eBay', key))
+        cache.set('eBay', key, {'average_price': 5.0})
+        self.assertEqual(cache.get('eBay', key), {'average_price': 5.0})
+        
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+    
+    def test_per_source_ttl(self):
+        """Test that each source expires after its own TTL."""
+        cache = PriceCache(default_ttl=60, ttls={'TCGPlayer': 0})
+        key = normalize_query("Pikachu V")
+        cache.set('eBay', key, {'average_price': 5.0})
+        cache.set('TCGPlayer', key, {'average_price': 6.0})
+        time.sleep(0.01)
+        
+        self.assertIsNotNone(cache.get('eBay', key))
+        self.assertIsNone(cache.get('TCGPlayer', key))
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = PriceCache(max_entries=2)
+        for name in ("A", "B"):
+            cache.set('eBay', normalize_query(name), {'average_price': 1.0})
+        cache.get('eBay', normalize_query("A"))
+        cache.set('eBay', normalize_query("C"), {'average_price': 1.0})
+        
+        self.assertIsNotNone(cache.get('eBay', normalize_query("A")))
+        self.assertIsNone(cache.get('eBay', normalize_query("B")))
+        self.assertEqual(cache.stats()['evictions'], 1)
+    
+    def test_sqlite_backend_shared_between_caches(self):
+        """Test that a persisted result warms a second, independent cache."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'prices.db')
+            key = normalize_query("Mewtwo VSTAR")
+            writer = PriceCache(backend=SQLitePriceCache(path))
+            writer.set('eBay', key, {'source': 'eBay', 'average_price': 12.5})
+            
+            reader = PriceCache(backend=SQLitePriceCache(path))
+            
+            self.assertEqual(reader.get('eBay', key)['average_price'], 12.5)
+            self.assertEqual(reader.stats()['backend_hits'], 1)
+            # Second read is served from memory
+            reader.get('eBay', key)
+            self.assertEqual(reader.stats()['backend_hits'], 1)
+    
+    def test_sqlite_backend_respects_ttl(self):
+        """Test that expired persisted results are ignored and purged."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backend = SQLitePriceCache(os.path.join(tmpdir, 'prices.db'), default_ttl=60)
+            key = normalize_query("Mewtwo VSTAR")
+            backend.set('eBay', key, {'average_price': 12.5}, stored_at=time.time() - 120)
+            
+            self.assertIsNone(backend.get('eBay', key))
+            self.assertEqual(backend.purge(), 1)
+    
+    def test_pricer_serves_repeat_search_from_cache(self):
+        """Test that a repeated search does not hit the source again."""
+        pricer = PokemonCardPricer(cache=PriceCache())
+        pricer.ebay_pricer = None
+        pricer.tcgplayer_pricer = Mock()
+        pricer.tcgplayer_pricer.fetch.return_value = {
+            'source': 'TCGPlayer', 'average_price': 20.00, 'currency': 'USD'
+        }
+        
+        pricer.get_price("Charizard VMAX", "English", "Near Mint")
+        results = pricer.get_price("charizard  vmax", "English", "Near Mint")
+        
+        self.assertEqual(pricer.tcgplayer_pricer.fetch.call_count, 1)
+        self.assertEqual(results['cached'], ['TCGPlayer'])
+        self.assertEqual(results['average_price'], 20.00)
+    
+    def test_stale_result_served_and_refreshed(self):
+        """Test stale-while-revalidate: old value now, fresh value next time."""
+        prices = iter([12.0])
+        refreshed = threading.Event()
+        source = Mock()
+        
+        def fetch(card_name, language, condition):
+            result = {'source': 'TCGPlayer', 'average_price': next(prices), 'currency': 'USD'}
+            refreshed.set()
+            return result
+        
+        source.fetch.side_effect = fetch
+        cache = PriceCache(default_ttl=60, max_stale=600)
+        pricer = PokemonCardPricer(sources=[], cache=cache)
+        pricer.tcgplayer_pricer = source
+        key = normalize_query("Lugia V")
+        cache._put('TCGPlayer', key, {'source': 'TCGPlayer', 'average_price': 10.0,
+                                      'currency': 'USD'}, time.time() - 120)
+        
+        results = pricer.get_price("Lugia V", max_stale=300)
+        
+        self.assertEqual(results['average_price'], 10.0)
+        self.assertEqual(list(results['stale']), ['TCGPlayer'])
+        self.assertGreaterEqual(results['stale']['TCGPlayer'], 120)
+        self.assertTrue(refreshed.wait(2))
+        deadline = time.time() + 2
+        while cache.get('TCGPlayer', key) is None and time.time() < deadline:
+            time.sleep(0.01)
+        
+        results = pricer.get_price("Lugia V", max_stale=300)
+        self.assertEqual(results['average_price'], 12.0)
+        self.assertEqual(results['stale'], {})
+    
+    def test_too_stale_result_blocks(self):
+        """Test that results past max_stale are fetched while the caller waits."""
+        cache = PriceCache(default_ttl=60, max_stale=600)
+        key = normalize_query("Lugia V")
+        cache._put('eBay', key, {'average_price': 10.0}, time.time() - 500)
+        
+        self.assertIsNone(cache.get('eBay', key))
+        self.assertIsNone(cache.get_stale('eBay', key, max_stale=300))
+        self.assertEqual(cache.get_stale('eBay', key)[0]['average_price'], 10.0)
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+
+class TestCardCatalog(unittest.TestCase):
+    """Test canonicalizing card names with the card catalog."""
+    
+    def setUp(self):
+        """Set up a small catalog."""
+        self.catalog = CardCatalog([
+            {'name': 'Charizard VMAX', 'set': 'Darkness Ablaze', 'number': '20/189'},
+            {'name': 'Charizard', 'set': 'Base Set', 'number': '4/102',
+             'variants': ['1st Edition']},
+            {'name': 'Umbreon VMAX', 'set': 'Evolving Skies', 'number': '215/203',
+             'aliases': ['Moonbreon']},
+        ])
+    
+    def test_normalize_name(self):
+        """Test that spellings of the same card normalize alike."""
+        self.assertEqual(normalize_name("Charizard V-MAX"), "charizard vmax")
+        self.assertEqual(normalize_name(" charizard  V MAX "), "charizard vmax")
+        self.assertEqual(normalize_name("Pokémon Farfetch'd"), "pokemon farfetchd")
+        self.assertEqual(normalize_name("Charizard 004/102"), "charizard 4/102")
+        self.assertEqual(normalize_query("Charizard V-MAX"), normalize_query("charizard vmax"))
+    
+    def test_match(self):
+        """Test exact, alias and misspelled lookups."""
+        for query in ("charizard vmax", "Charizard V-MAX", "Charizrd VMAX"):
+            self.assertEqual(self.catalog.canonicalize(query), "Charizard VMAX")
+        self.assertEqual(self.catalog.match("Charizrd VMAX")['cards'][0]['set'],
+                         'Darkness Ablaze')
+        self.assertLess(self.catalog.match("Charizrd VMAX")['similarity'], 1.0)
+        self.assertEqual(self.catalog.canonicalize("moonbreon"), "Umbreon VMAX 215/203")
+        self.assertEqual(self.catalog.canonicalize("charizard 1st edition"),
+                         "Charizard 1st Edition")
+    
+    def test_no_match_across_variants_or_numbers(self):
+        """Test that a close name with another variant or number is left alone."""
+        self.assertIsNone(self.catalog.match("Charizard V"))
+        self.assertIsNone(self.catalog.match("Charizard 5/102"))
+        self.assertIsNone(self.catalog.match("Dark Charizard"))
+        self.assertEqual(self.catalog.canonicalize("Dark  Charizard"), "Dark Charizard")
+    
+    def test_fuzzy_match_never_drops_words(self):
+        """Test that extra or missing words are never corrected away."""
+        for query in ("Charizard Holo 1st Edition", "charizard base set holo",
+                      "Charizard Darkness Ablaze VMAX", "Umbreon"):
+            self.assertIsNone(self.catalog.match(query), query)
+        self.assertEqual(self.catalog.canonicalize("Umbron VMAX"), "Umbreon VMAX")
+        self.assertEqual(self.catalog.canonicalize("Charizard 1st Editon"),
+                         "Charizard 1st Edition")
+    
+    def test_complete(self):
+        """Test prefix lookup."""
+        self.assertEqual(self.catalog.complete("umbreon v"),
+                         ["Umbreon VMAX", "Umbreon VMAX 215/203", "Umbreon VMAX Evolving Skies"])
+        self.assertEqual(len(self.catalog.complete("char", limit=2)), 2)
+        self.assertEqual(self.catalog.complete("   "), [])
+    
+    def test_from_env(self):
+        """Test that the bundled catalog loads and an empty path disables it."""
+        self.assertGreater(len(CardCatalog.from_env()), 0)
+        with patch.dict(os.environ, {'CARD_CATALOG_PATH': ''}):
+            self.assertIsNone(CardCatalog.from_env())
+    
+    def test_pricer_shares_spellings(self):
+        """Test that spellings of a card share one upstream lookup and cache entry."""
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(), catalog=self.catalog)
+        source = Mock()
+        source.fetch.return_value = {'source': 'TCGPlayer', 'average_price': 5.0,
+                                     'currency': 'USD'}
+        pricer.tcgplayer_pricer = source
+        
+        first = pricer.get_price("charizard v-max")
+        second = pricer.get_price("Charizrd VMAX")
+        
+        source.fetch.assert_called_once_with("Charizard VMAX", "English", "Near Mint")
+        self.assertEqual(first['canonical_name'], "Charizard VMAX")
+        self.assertEqual(second['card_name'], "Charizrd VMAX")
+        self.assertEqual(second['cached'], ['TCGPlayer'])
+    
+    def test_non_latin_names_stay_distinct(self):
+        """Test that names in other scripts keep their own cache entries."""
+        self.assertEqual(normalize_name("ﾘｻﾞｰﾄﾞﾝ  V"), "リザードン v")
+        self.assertNotEqual(normalize_name("リザードン"), normalize_name("リサードン"))
+        self.assertEqual(normalize_name("Пикачу"), "пикачу")
+        
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(), catalog=self.catalog)
+        source = Mock()
+        source.fetch.side_effect = lambda name, *args: {
+            'source': 'TCGPlayer', 'average_price': float(len(name)), 'currency': 'USD'}
+        pricer.tcgplayer_pricer = source
+        
+        charizard = pricer.get_price("リザードン", "Japanese")
+        mewtwo = pricer.get_price("ミュウツーex", "Japanese")
+        
+        self.assertEqual(source.fetch.call_count, 2)
+        self.assertEqual((charizard['average_price'], mewtwo['average_price']), (5.0, 7.0))
+        self.assertEqual(mewtwo['cached'], [])
+
+
+class TestPriceHistory(unittest.TestCase):
+    """Test the local price-history store."""
+    
+    def setUp(self):
+        """Set up a history database in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = PriceHistory(os.path.join(self.tmpdir.name, 'history.db'))
+        self.key = normalize_query("Umbreon VMAX")
+    
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmpdir.cleanup()
+    
+    def test_records_source_price_and_sales_once(self):
+        """Test that sold items are appended once even if seen again."""
+        result = {'source': 'eBay', 'average_price': 50.0, 'currency': 'USD', 'items': [
+            {'price': 48.0, 'currency': 'USD', 'item_id': '1',
+             'end_time': '2099-01-01T00:00:00.000Z'},
+            {'price': 52.0, 'currency': 'USD', 'item_id': '2'}
+        ]}
+        
+        self.assertEqual(self.history.record(self.key, 'eBay', result), 3)
+        self.assertEqual(self.history.record(self.key, 'eBay', result), 1)
+        
+        self.assertEqual(self.history.count(), 4)
+        self.assertEqual(len(self.history.prices(self.key, days=None, kind=KIND_SALE)), 2)
+        self.assertEqual(self.history.median(self.key, kind=KIND_SOURCE), 50.0)
+    
+    def test_window_median_and_trend(self):
+        """Test the 30-day median and an upward trend."""
+        now = time.time()
+        day = 86400
+        old = now - 60 * day
+        self.history.record(self.key, 'TCGPlayer', {'average_price': 5.0}, observed_at=old)
+        for days_ago, price in ((20, 10.0), (10, 12.0), (1, 14.0)):
+            self.history.record(self.key, 'TCGPlayer', {'average_price': price},
+                                observed_at=now - days_ago * day)
+        
+        self.assertEqual(self.history.median(self.key, days=30), 12.0)
+        self.assertEqual(self.history.summary(self.key, days=None)['count'], 4)
+        
+        trend = self.history.trend(self.key, days=30)
+        self.assertEqual(len(trend['points']), 3)
+        self.assertEqual(trend['direction'], 'up')
+        self.assertEqual(trend['change_pct'], 40.0)
+        self.assertAlmostEqual(trend['slope_per_day'], 0.2105, places=2)
+    
+    def test_pricer_appends_fresh_results(self):
+        """Test that get_price() feeds the history and get_history() reads it."""
+        source = Mock()
+        source.fetch.return_value = {'source': 'TCGPlayer', 'average_price': 7.0,
+                                     'currency': 'USD'}
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(), history=self.history)
+        pricer.tcgplayer_pricer = source
+        
+        pricer.get_price("Umbreon VMAX")
+        pricer.get_price("umbreon  vmax")  # served from the cache, not recorded again
+        summary = pricer.get_history("Umbreon VMAX")
+        
+        self.assertEqual(summary['sources']['count'], 1)
+        self.assertEqual(summary['sources']['median'], 7.0)
+        self.assertIsNone(summary['sales'])
+        self.assertEqual(summary['trend']['direction'], 'flat')
+    
+    def test_pricer_records_every_sale(self):
+        """Test that the whole eBay sample is recorded, not only the returned items."""
+        session = Mock()
+        session.get.return_value = TestEbayPricer._sold_page(
+            [10 + price % 5 for price in range(50)], total_pages=1,
+            end_time='2026-01-01T00:00:00.000Z')
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(), history=self.history)
+        pricer.ebay_pricer = EbayPricer("test_app_id", session=session, items_kept=10)
+        
+        results = pricer.get_price("Umbreon VMAX")
+        
+        self.assertEqual(len(results['sources'][0]['items']), 10)
+        self.assertNotIn('_sales', results['sources'][0])
+        self.assertEqual(len(self.history.prices(self.key, days=None, kind=KIND_SALE)), 50)
+        
+        direct = pricer.ebay_pricer.get_average_price("Umbreon VMAX")
+        self.assertEqual(len(direct['items']), 10)
+        self.assertNotIn('_sales', direct)
+        self.assertNotIn('_sales', pricer.ebay_pricer.fetch("Umbreon VMAX"))
+
+
+class TestRefreshScheduler(unittest.TestCase):
+    """Test the background refresh of watched cards."""
+    
+    def setUp(self):
+        """Set up a pricer with one counting source and a 100 s cache."""
+        self.source = Mock()
+        self.source.fetch.side_effect = lambda card_name, language, condition: {
+            'source': 'TCGPlayer', 'average_price': 5.0, 'currency': 'USD'}
+        self.pricer = PokemonCardPricer(sources=[], cache=PriceCache(default_ttl=100))
+        self.pricer.tcgplayer_pricer = self.source
+        self.scheduler = RefreshScheduler(self.pricer, refresh_ahead=0.8,
+                                          budgets={'TCGPlayer': 60})
+    
+    def _drain(self):
+        """Wait for started refreshes to finish."""
+        deadline = time.time() + 2
+        while self.scheduler.stats()['refreshing'] and time.time() < deadline:
+            time.sleep(0.01)
+    
+    def test_refreshes_ahead_of_expiry(self):
+        """Test that watched cards are fetched, then refreshed near expiry."""
+        self.scheduler.watch("Charizard VMAX")
+        
+        self.assertEqual(len(self.scheduler.run_once()), 1)
+        self._drain()
+        # Fresh for the first 80 s of its 100 s TTL
+        self.assertEqual(self.scheduler.run_once(), [])
+        self.assertEqual(len(self.scheduler.run_once(now=time.time() + 85)), 1)
+        self._drain()
+        
+        self.assertEqual(self.source.fetch.call_count, 2)
+        results = self.pricer.get_price("charizard vmax")
+        self.assertEqual(results['cached'], ['TCGPlayer'])
+    
+    def test_priority_and_budget(self):
+        """Test that the most searched card wins when the budget is short."""
+        self.scheduler.budgets['TCGPlayer'] = 1
+        self.scheduler.watch("Pikachu V")
+        self.scheduler.watch("Mew ex")
+        key = normalize_query("Mew ex")
+        for _ in range(3):
+            self.scheduler.record_access(key, "Mew ex", "English", "Near Mint")
+        
+        started = self.scheduler.run_once()
+        
+        self.assertEqual(started, [(key, 'TCGPlayer')])
+        self.assertEqual(self.scheduler.stats()['deferred'], 1)
+    
+    def test_auto_watch_popular_cards(self):
+        """Test that cards searched often enough are watched automatically."""
+        self.scheduler.auto_watch = 2
+        
+        self.pricer.get_price("Gengar VMAX")
+        self.assertEqual(self.scheduler.watched(), [])
+        self.pricer.get_price("gengar vmax")
+        
+        # Watched under the card catalog's spelling
+        self.assertEqual(self.scheduler.watched(), [("Gengar VMAX", "English", "Near Mint")])
+    
+    def test_budget_window(self):
+        """Test the sliding one-minute window."""
+        budget = RefreshBudget(2)
+        self.assertTrue(budget.try_acquire(0))
+        self.assertTrue(budget.try_acquire(1))
+        self.assertFalse(budget.try_acquire(2))
+        self.assertTrue(budget.try_acquire(61))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test request coalescing."""
+    
+    def test_concurrent_calls_share_one_future(self):
+        """Test that a second caller gets the in-flight future."""
+        flight = SingleFlight()
+        release = threading.Event()
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first, first_shared = flight.run('key', lambda: executor.submit(release.wait))
+            second, second_shared = flight.run('key', lambda: executor.submit(release.wait))
+            release.set()
+            first.result(timeout=1)
+        
+        self.assertIs(first, second)
+        self.assertFalse(first_shared)
+        self.assertTrue(second_shared)
+        self.assertEqual(flight.in_flight(), 0)
+    
+    @patch.dict('os.environ', {'PRICE_CACHE_MAX_ENTRIES': '0'})
+    def test_concurrent_searches_hit_source_once(self):
+        """Test that identical concurrent searches make one upstream call."""
+        def slow_lookup(*args):
+            time.sleep(0.2)
+            return {'source': 'TCGPlayer', 'average_price': 20.00, 'currency': 'USD'}
+        
+        pricer = PokemonCardPricer()
+        pricer.ebay_pricer = None
+        pricer.tcgplayer_pricer = Mock()
+        pricer.tcgplayer_pricer.fetch.side_effect = slow_lookup
+        
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(
+                lambda _: pricer.get_price("Charizard VMAX", "English", "Near Mint"),
+                range(5)))
+        
+        self.assertEqual(pricer.tcgplayer_pricer.fetch.call_count, 1)
+        self.assertTrue(all(r['average_price'] == 20.00 for r in results))
+    
+    def test_abandon_keeps_shared_calls(self):
+        """Test that abandon() only cancels queued calls nobody else joined."""
+        flight = SingleFlight()
+        release = threading.Event()
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(release.wait)
+            alone, _ = flight.run('alone', lambda: executor.submit(time.sleep, 0))
+            shared, _ = flight.run('shared', lambda: executor.submit(time.sleep, 0))
+            flight.run('shared', lambda: executor.submit(time.sleep, 0))
+            
+            self.assertTrue(flight.abandon('alone', alone))
+            self.assertFalse(flight.abandon('shared', shared))
+            release.set()
+        
+        self.assertTrue(alone.cancelled())
+        self.assertFalse(shared.cancelled())
+        self.assertEqual(flight.in_flight(), 0)
+
+
+class FixedPriceSource(BasePriceSource):
+    """Minimal price source used to exercise the registry."""
+    
+    name = 'Fixed'
+    
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+    
+    def get_average_price(self, card_name, language="English", condition="Near Mint"):
+        return {'source': self.name, 'average_price': 30.00, 'currency': 'USD'}
+
+
+class TestPriceSources(unittest.TestCase):
+    """Test the pluggable price source registry."""
+    
+    def setUp(self):
+        """Register the test source."""
+        register_source(FixedPriceSource.name, FixedPriceSource)
+    
+    def tearDown(self):
+        """Remove the test source from the registry."""
+        unregister_source(FixedPriceSource.name)
+    
+    def test_builtin_sources_registered(self):
+        """Test that eBay and TCGPlayer register themselves."""
+        self.assertIn('eBay', registered_sources())
+        self.assertIn('TCGPlayer', registered_sources())
+        self.assertIsInstance(TCGPlayerPricer(), PriceSource)
+    
+    @patch.dict('os.environ', {}, clear=True)
+    def test_registered_source_is_aggregated(self):
+        """Test that a newly registered source is queried and merged."""
+        pricer = PokemonCardPricer(sources=['Fixed'])
+        
+        results = pricer.get_price("Charizard", "English", "Near Mint")
+        
+        self.assertEqual(list(pricer.sources), ['Fixed'])
+        self.assertEqual(results['average_price'], 30.00)
+    
+    @patch.dict('os.environ', {}, clear=True)
+    def test_unconfigured_source_is_reported(self):
+        """Test that eBay without credentials is skipped with a reason."""
+        pricer = PokemonCardPricer(sources=['eBay', 'Fixed'])
+        
+        self.assertNotIn('eBay', pricer.sources)
+        self.assertIn('eBay', pricer.unconfigured_sources)
+    
+    @patch.dict('os.environ', {}, clear=True)
+    def test_get_price_async(self):
+        """Test the asynchronous aggregation path."""
+        pricer = PokemonCardPricer(sources=['Fixed'])
+        
+        results = asyncio.run(pricer.get_price_async("Charizard", "English", "Near Mint"))
+        
+        self.assertEqual(len(results['sources']), 1)
+        self.assertEqual(results['average_price'], 30.00)
+
+
+class TestBatchPricing(unittest.TestCase):
+    """Test pricing many cards at once."""
+    
+    def setUp(self):
+        """Set up a pricer with a mocked TCGPlayer source."""
+        self.pricer = PokemonCardPricer(cache=PriceCache())
+        self.pricer.ebay_pricer = None
+        self.pricer.tcgplayer_pricer = Mock()
+    
+    def test_get_prices_dedupes_and_keeps_order(self):
+        """Test that duplicates are fetched once and results follow input order."""
+        self.pricer.tcgplayer_pricer.fetch.side_effect = lambda name, *args: {
+            'source': 'TCGPlayer', 'average_price': float(len(name)), 'currency': 'USD'
+        }
+        
+        results = self.pricer.get_prices([
+            "Pikachu V",
+            ("Charizard VMAX", "English", "Near Mint"),
+            ("pikachu  v", "english"),
+        ])
+        
+        self.assertEqual(self.pricer.tcgplayer_pricer.fetch.call_count, 2)
+        self.assertEqual([r['card_name'] for r in results],
+                         ["Pikachu V", "Charizard VMAX", "pikachu  v"])
+        self.assertEqual(results[1]['average_price'], 14.0)
+        self.assertEqual(results[2]['average_price'], results[0]['average_price'])
+    
+    def test_get_prices_bounds_concurrency_per_source(self):
+        """Test that at most `concurrency` lookups run per source."""
+        lock = threading.Lock()
+        active = [0, 0]
+        
+        def lookup(*args):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return {'source': 'TCGPlayer', 'average_price': 1.0, 'currency': 'USD'}
+        
+        self.pricer.tcgplayer_pricer.fetch.side_effect = lookup
+        
+        results = self.pricer.get_prices([f"Card {i}" for i in range(12)], concurrency=3)
+        
+        self.assertEqual(len(results), 12)
+        self.assertLessEqual(active[1], 3)
+        self.assertGreater(active[1], 1)
+    
+    def test_iter_price_yields_fastest_source_first(self):
+        """Test that source events stream in completion order before the summary."""
+        def slow_lookup(*args):
+            time.sleep(0.2)
+            return {'source': 'eBay', 'average_price': 10.00,
+                    'currency': 'USD', 'sample_size': 1}
+        
+        self.pricer.ebay_pricer = Mock()
+        self.pricer.ebay_pricer.fetch.side_effect = slow_lookup
+        self.pricer.tcgplayer_pricer.fetch.return_value = {
+            'source': 'TCGPlayer', 'average_price': 20.00, 'currency': 'USD'
+        }
+        
+        events = list(self.pricer.iter_price("Charizard", "English", "Near Mint"))
+        
+        self.assertEqual([e['type'] for e in events], ['source', 'source', 'summary'])
+        self.assertEqual(events[0]['source'], 'TCGPlayer')
+        self.assertEqual(events[2]['results']['average_price'], 15.00)
+    
+    def test_iter_prices_reports_index(self):
+        """Test that streamed batch events identify their query."""
+        self.pricer.tcgplayer_pricer.fetch.return_value = {
+            'source': 'TCGPlayer', 'average_price': 5.00, 'currency': 'USD'
+        }
+        
+        events = list(self.pricer.iter_prices(["Pikachu V", "Mew", "pikachu v"]))
+        
+        self.assertEqual(sorted(e['index'] for e in events), [0, 1, 2])
+        self.assertTrue(all(e['type'] == 'card' for e in events))
+    
+    def test_get_prices_rejects_empty_name(self):
+        """Test that malformed queries raise ValueError."""
+        with self.assertRaises(ValueError):
+            self.pricer.get_prices([("", "English")])
+    
+    def test_get_prices_applies_deadline_per_card(self):
+        """Test that a hung lookup times out its card without holding up the batch."""
+        def lookup(name, *args):
+            time.sleep(1.0 if name == "Slow Card" else 0.05)
+            return {'source': 'TCGPlayer', 'average_price': 1.0, 'currency': 'USD'}
+    
+        self.pricer.deadline = 0.2
+        self.pricer.tcgplayer_pricer.fetch.side_effect = lookup
+    
+        start = time.monotonic()
+        results = self.pricer.get_prices(["Slow Card"] + [f"Card {i}" for i in range(6)],
+                                         concurrency=2)
+    
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(results[0]['timed_out'], ['TCGPlayer'])
+        self.assertTrue(all(r['average_price'] == 1.0 for r in results[1:]))
+    
+    def test_search_does_not_wait_behind_batch_queue(self):
+        """Test that a search for a queued batch card runs its own lookup."""
+        def lookup(*args):
+            time.sleep(0.05)
+            return {'source': 'TCGPlayer', 'average_price': 1.0, 'currency': 'USD'}
+        
+        self.pricer.deadline = 0.5
+        self.pricer.tcgplayer_pricer.fetch.side_effect = lookup
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batch = executor.submit(self.pricer.get_prices,
+                                    [f"Card {i}" for i in range(20)], concurrency=1)
+            time.sleep(0.1)
+            result = self.pricer.get_price("Card 15")
+            batch.result()
+        
+        self.assertEqual(result['timed_out'], [])
+        self.assertEqual(result['average_price'], 1.0)
+    
+    def test_abandoned_batch_cancels_queued_lookups(self):
+        """Test that closing a batch stream drops the lookups still queued."""
+        def lookup(*args):
+            time.sleep(0.05)
+            return {'source': 'TCGPlayer', 'average_price': 1.0, 'currency': 'USD'}
+    
+        self.pricer.tcgplayer_pricer.fetch.side_effect = lookup
+    
+        stream = self.pricer.iter_prices([f"Card {i}" for i in range(10)], concurrency=1)
+        next(stream)
+        stream.close()
+        time.sleep(0.3)
+    
+        self.assertLessEqual(self.pricer.tcgplayer_pricer.fetch.call_count, 2)
+        self.assertEqual(self.pricer._inflight.in_flight(), 0)
 
 
 class TestFlaskEndpoints(unittest.TestCase):
@@ -212,6 +1604,33 @@ class TestFlaskEndpoints(unittest.TestCase):
         flask_app.config['TESTING'] = True
         self.client = flask_app.test_client()
     
+    def test_history_endpoint_requires_store(self):
+        """Test /history validation and the disabled-store response."""
+        response = self.client.get('/history')
+        self.assertEqual(response.status_code, 400)
+        
+        with patch('app.pricer') as mock_pricer:
+            mock_pricer.get_history.return_value = None
+            response = self.client.get('/history?card_name=Pikachu')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_import_does_not_build_pricer(self):
+        """Test that importing the app leaves the pricing stack unloaded."""
+        code = ("import sys, app; print(app.pricer, "
+                "[m for m in ('pokepicer', 'requests', 'bs4', 'httpx') if m in sys.modules])")
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.stdout.strip().splitlines()[-1], 'None []')
+    
+    def test_metrics_endpoint(self):
+        """Test that /metrics serves the Prometheus text format."""
+        with patch('app.pricer', None):
+            response = self.client.get('/metrics')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertNotIn('pokepricer_cache_hits_total', response.get_data(as_text=True))
+    
     def test_health_endpoint(self):
         """Test health check endpoint."""
         response = self.client.get('/health')
@@ -235,6 +1654,84 @@ class TestFlaskEndpoints(unittest.TestCase):
         data = response.get_json()
         self.assertIn('error', data)
     
+    @patch('app.pricer')
+    def test_search_batch_endpoint(self, mock_pricer):
+        """Test the batch search endpoint."""
+        mock_pricer.get_prices.return_value = [{
+            'card_name': 'Pikachu V', 'language': 'English', 'condition': 'Near Mint',
+            'sources': [], 'average_price': None, 'currency': 'USD'
+        }]
+        
+        response = self.client.post('/search/batch', json={
+            'cards': [{'card_name': 'Pikachu V'}]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['results'][0]['card_name'], 'Pikachu V')
+        mock_pricer.get_prices.assert_called_once_with(
+            [('Pikachu V', 'English', 'Near Mint')])
+    
+    def test_search_batch_endpoint_validation(self):
+        """Test that malformed batches are rejected."""
+        response = self.client.post('/search/batch', json={'cards': []})
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post('/search/batch', json={'cards': [{'language': 'English'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Card 0', response.get_json()['error'])
+        
+        for path in ('/search/batch', '/search/batch/stream'):
+            for body in (['Pikachu'], {'cards': [{'card_name': ['a']}]},
+                         {'cards': ['Pikachu']}):
+                response = self.client.post(path, json=body)
+                self.assertEqual(response.status_code, 400, (path, body))
+                self.assertFalse(response.get_json()['success'])
+    
+    @patch('app.pricer')
+    def test_search_stream_ndjson(self, mock_pricer):
+        """Test that /search/stream emits one NDJSON line per event."""
+        mock_pricer.iter_price.return_value = iter([
+            {'type': 'source', 'source': 'TCGPlayer', 'status': 'ok',
+             'result': {'source': 'TCGPlayer', 'average_price': 20.0}},
+            {'type': 'summary', 'results': {
+                'card_name': 'Pikachu V', 'language': 'English', 'condition': 'Near Mint',
+                'sources': [], 'average_price': 20.0, 'currency': 'USD'}}
+        ])
+        
+        response = self.client.post('/search/stream', json={'card_name': 'Pikachu V'})
+        
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['source', 'summary'])
+        self.assertTrue(lines[1]['results']['success'])
+    
+    @patch('app.pricer')
+    def test_search_stream_sse(self, mock_pricer):
+        """Test that /search/stream speaks SSE when asked to."""
+        mock_pricer.iter_price.return_value = iter([
+            {'type': 'source', 'source': 'TCGPlayer', 'status': 'no_results', 'result': None}
+        ])
+        
+        response = self.client.post('/search/stream', json={'card_name': 'Pikachu V'},
+                                    headers={'Accept': 'text/event-stream'})
+        
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertTrue(response.data.decode().startswith('event: source\ndata: '))
+    
+    def test_search_rejects_malformed_payloads(self):
+        """Test that non-object bodies and non-string fields get a JSON 400."""
+        for path in ('/search', '/search/stream'):
+            for body in (['Pikachu'], {'card_name': 42}, {'card_name': 'Mew', 'language': []}):
+                response = self.client.post(path, json=body)
+                self.assertEqual(response.status_code, 400, (path, body))
+                self.assertFalse(response.get_json()['success'])
+            response = self.client.post(path, data='{not json',
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, path)
+            self.assertFalse(response.get_json()['success'])
+    
     def test_marketplace_account_deletion_success(self):
         """Test marketplace account deletion endpoint with valid data."""
         test_data = {
@@ -300,6 +1797,161 @@ class TestFlaskEndpoints(unittest.TestCase):
         self.assertEqual(data['status'], 'success')
 
 
+@unittest.skipIf(httpx is None, "httpx not installed")
+class TestAsyncServing(unittest.TestCase):
+    """Test the asyncio HTTP clients and the ASGI app."""
+    
+    def test_ebay_fetch_async_pages(self):
+        """Test that eBay pages are fetched through the async client."""
+        def handler(request):
+            page = int(request.url.params['paginationInput.pageNumber'])
+            data = TestEbayPricer._sold_page([page * 10] * 4, total_pages=50).json.return_value
+            return httpx.Response(200, json=data)
+        
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        pricer = EbayPricer("test_app_id", sample_size=10, entries_per_page=4,
+                            page_concurrency=2, async_client=client)
+        
+        result = asyncio.run(pricer.fetch_async("Test Card"))
+        
+        self.assertEqual(result['sample_size'], 10)
+        self.assertEqual(result['median_price'], 20.0)
+    
+    def test_tcgplayer_fetch_async(self):
+        """Test that TCGPlayer pages are scraped through the async client."""
+        page = b'<div>Market Price: $45.99</div><div>Low Price: $40.00</div>'
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=page)))
+        pricer = TCGPlayerPricer(async_client=client)
+        
+        result = asyncio.run(pricer.fetch_async("Charizard"))
+        
+        self.assertEqual(result['average_price'], 45.99)
+    
+    def test_async_transport_guards(self):
+        """Test that async requests feed the limiter and histogram and respect the breaker."""
+        from async_http import AsyncSourceTransport
+        limiter = SourceLimiter('test')
+        histogram = LatencyHistogram()
+        breaker = CircuitBreaker('test', min_calls=1, window=1)
+        transport = AsyncSourceTransport(
+            httpx.MockTransport(lambda request: httpx.Response(503)),
+            limiter, breaker, histogram)
+        
+        async def call():
+            async with httpx.AsyncClient(transport=transport) as client:
+                await client.get('https://example.invalid/search')
+                with self.assertRaises(CircuitOpenError):
+                    await client.get('https://example.invalid/search')
+        
+        asyncio.run(call())
+        
+        self.assertEqual(limiter.stats()['overloaded'], 1)
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(breaker.state, 'open')
+    
+    def test_async_transport_cancellation_is_not_a_failure(self):
+        """Test that cancelled requests free their slot without tripping anything."""
+        from async_http import AsyncSourceTransport
+        limiter = SourceLimiter('test')
+        breaker = CircuitBreaker('test', min_calls=1, window=1)
+        limit = limiter.stats()['concurrency_limit']
+        
+        async def slow(request):
+            await asyncio.sleep(10)
+            return httpx.Response(200)
+        
+        transport = AsyncSourceTransport(httpx.MockTransport(slow), limiter, breaker)
+        
+        async def call():
+            async with httpx.AsyncClient(transport=transport) as client:
+                for _ in range(3):
+                    task = asyncio.ensure_future(client.get('https://example.invalid/search'))
+                    await asyncio.sleep(0.01)
+                    task.cancel()
+                    with self.assertRaises(asyncio.CancelledError):
+                        await task
+        
+        asyncio.run(call())
+        
+        stats = limiter.stats()
+        self.assertEqual((stats['in_flight'], stats['overloaded']), (0, 0))
+        self.assertEqual(stats['concurrency_limit'], limit)
+        self.assertEqual(breaker.state, 'closed')
+    
+    def test_async_storage_runs_off_the_loop(self):
+        """Test that disk-backed cache reads and history writes use worker threads."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        cache = PriceCache(backend=SQLitePriceCache(os.path.join(tmpdir.name, 'cache.db')))
+        history = Mock()
+        pricer = PokemonCardPricer(sources=[], cache=cache, history=history)
+        pricer._set_source('Fixed', FixedPriceSource())
+        threads = []
+    
+        async def price():
+            threads.append(threading.get_ident())
+            with patch.object(cache, 'get', side_effect=lambda *args: threads.append(
+                    threading.get_ident())):
+                return await pricer.get_price_async("Pikachu")
+    
+        history.record.side_effect = lambda *args, **kwargs: threads.append(
+            threading.get_ident())
+        results = asyncio.run(price())
+    
+        self.assertEqual(results['average_price'], 30.0)
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threads[0], threads[1:])
+    
+    def test_client_slot_closes_clients(self):
+        """Test that the per-loop client slot closes the client it built."""
+        from async_http import AsyncClientSlot
+        slot = AsyncClientSlot(lambda: httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200))))
+    
+        async def use():
+            client = slot.get()
+            await client.get('https://example.invalid/')
+            await slot.aclose()
+            return client
+    
+        self.assertTrue(asyncio.run(use()).is_closed)
+    
+    @unittest.skipIf(asgi_app is None, "starlette not installed")
+    def test_asgi_search(self):
+        """Test /search and /health on the ASGI app."""
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(max_entries=0))
+        pricer._set_source('Fixed', FixedPriceSource())
+        client = TestClient(asgi_app.app)
+        
+        with patch('app.pricer', pricer):
+            response = client.post('/search', json={'card_name': 'Pikachu'})
+            missing = client.post('/search', json={})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['average_price'], 30.0)
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(client.get('/health').json(), {'status': 'ok'})
+        for path in ('/search', '/search/stream'):
+            self.assertEqual(client.post(path, json=['Pikachu']).status_code, 400)
+    
+    @unittest.skipIf(asgi_app is None, "starlette not installed")
+    def test_asgi_search_stream(self):
+        """Test that the page's /search/stream works on the ASGI app."""
+        pricer = PokemonCardPricer(sources=[], cache=PriceCache(max_entries=0))
+        pricer._set_source('Fixed', FixedPriceSource())
+        client = TestClient(asgi_app.app)
+        
+        with patch('app.pricer', pricer):
+            response = client.post('/search/stream', json={'card_name': 'Pikachu'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['content-type'].startswith('application/x-ndjson'))
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['source', 'summary'])
+        self.assertEqual(lines[-1]['results']['average_price'], 30.0)
+
+
 def run_tests():
     """Run all tests."""
     unittest.main(argv=[''], verbosity=2, exit=False)